@@ -2,18 +2,26 @@ import streamlit as st
 import pandas as pd
 import os
 import time
+import threading
+import hashlib
 from dotenv import load_dotenv
 
 # Import our modules
-from src.csv_loader import load_csv
-from src.schema_analyzer import analyze_schema, generate_schema_description
-from src.llm_client import LLMClient
+from src.csv_loader import load_csv, IncrementalCSVReader, extract_list_columns, extend_list_columns, iter_csv_chunks
+from src.time_index import build_time_index
+from src.schema_analyzer import SchemaStats, generate_schema_description
+from src.llm_client import LLMClient, extract_code
+from src.speculative import run_speculative, get_speculative_stats
+from src.code_cache import get_code_cache, schema_fingerprint
+from src.code_optimizer import optimize_code, extract_referenced_columns
+from src.llm_cache import get_response_cache
 from src.prompt_builder import build_system_prompt, build_user_prompt, build_correction_prompt
-from src.code_executor import execute_code
-from src.result_formatter import format_result
+from src.code_executor import execute_code, execute_chunked, get_executor_stats
+from src.execution_pool import get_execution_pool
+from src.result_formatter import format_result, format_timings
 from src.conversation import ConversationManager
 from src.report_generator import generate_html_report
-from src.ssh_manager import SSHManager
+from src.ssh_manager import SSHManager, get_pool_stats
 
 # Load environment variables
 load_dotenv()
@@ -33,11 +41,90 @@ if "conversation" not in st.session_state:
     st.session_state.conversation = ConversationManager()
 if "messages" not in st.session_state:
     st.session_state.messages = [] # For UI display
+if "out_of_core_path" not in st.session_state:
+    st.session_state.out_of_core_path = None # Set when the file is processed in chunks
 if "api_key" not in st.session_state:
     # Try validation from env first
     env_key = os.getenv("GROQ_API_KEY")
     st.session_state.api_key = env_key if env_key else None
 
+# Functions listed per answer when "Perfilar código" is on
+PROFILE_TOP = 10
+
+def run_generated_code(code: str):
+    """Runs generated code on the session data, in memory or chunk by chunk."""
+    return snapshot_executor()(code)
+
+def describe_schema(question: str = None) -> str:
+    """Schema description for the system prompt, compacted for the given question."""
+    desc = generate_schema_description(st.session_state.schema_stats, question=question)
+    if st.session_state.out_of_core_path:
+        desc = "(Muestra del primer bloque; el archivo completo tiene más filas)\n" + desc
+    return desc
+
+def snapshot_executor(isolated: bool = None):
+    """
+    Runner bound to the current session data, callable from worker threads.
+    Each call gets its own copy-on-write view of `df`, so concurrent programs
+    do not see each other's changes. `isolated` overrides the sidebar toggle;
+    only isolated runs can be stopped through their `cancel` event.
+    """
+    df = st.session_state.df
+    out_of_core_path = st.session_state.out_of_core_path
+    extra_globals = {"list_columns": st.session_state.get('list_columns', {}),
+                     "time_index": st.session_state.get('time_index')}
+    data_version = st.session_state.get('data_version')
+    if isolated is None:
+        isolated = st.session_state.get('isolated_execution', False)
+    profile_top = PROFILE_TOP if st.session_state.get('profile_code') else 0
+
+    def run(code: str, columns: list = None, cancel: threading.Event = None):
+        if isolated:
+            # Worker process with a time and memory limit; the frame is shared once per data version
+            return get_execution_pool().execute(code, df=None if out_of_core_path else df, frame_key=data_version,
+                                                frame_globals=extra_globals,
+                                                chunked_path=out_of_core_path, profile_top=profile_top,
+                                                columns=columns, cancel=cancel)
+        if out_of_core_path:
+            return execute_chunked(code, iter_csv_chunks(out_of_core_path, columns=columns),
+                                   data_version=data_version, profile_top=profile_top)
+        return execute_code(code, df if columns is None else df[columns], extra_globals,
+                            data_version=data_version, profile_top=profile_top)
+
+    def execute(code: str, cancel: threading.Event = None):
+        # Only the columns the code reads are parsed (out-of-core) or handed to it
+        columns = extract_referenced_columns(code, df.columns) if df is not None else None
+        time_index = extra_globals["time_index"]
+        if columns is not None and time_index is not None and "time_index" in code:
+            # Slices check the time and sector values of the frame against the index
+            keep = set(columns) | {time_index.time_col, time_index.partition_col}
+            columns = [col for col in df.columns if col in keep]
+        # Never an empty projection: code reading no column (len(df)) runs on the whole frame
+        if columns and len(columns) < len(df.columns):
+            result = run(code, columns, cancel)
+            if result.success or (cancel is not None and cancel.is_set()):
+                return result
+            print("DEBUG: Projected run failed, running again with every column")
+        return run(code, cancel=cancel)
+    return execute
+
+def snapshot_optimizer():
+    """
+    Vectorizing pass for generated code, bound to the current session data and
+    callable from worker threads. Out-of-core code is left as is. With isolated
+    execution, the validation runs on the sample go through the pool too.
+    """
+    df = None if st.session_state.out_of_core_path else st.session_state.df
+    extra_globals = {"list_columns": st.session_state.get('list_columns', {}),
+                     "time_index": st.session_state.get('time_index')}
+    runner = None
+    if st.session_state.get('isolated_execution', False):
+        sample_key = f"{st.session_state.get('data_version')}:sample"
+        # Not cached: both versions must really run to be timed
+        runner = lambda code, sample: get_execution_pool().execute(code, df=sample, frame_key=sample_key,
+                                                                   frame_globals=extra_globals, cache=False)
+    return lambda code: optimize_code(code, df, extra_globals, runner=runner).code
+
 # --- Sidebar ---
 with st.sidebar:
     st.title("🤖 Configuración")
@@ -62,6 +149,7 @@ with st.sidebar:
 
     uploaded_file = None
     local_file_path = None
+    out_of_core = False
     remote_file_path = None
     ssh_manager = None
 
@@ -70,6 +158,9 @@ with st.sidebar:
         
     elif data_source == "Archivo Local":
         local_file_path = st.text_input("Ruta absoluta del archivo (ej: C:/datos/data.csv)")
+        out_of_core = st.toggle("📦 Fuera de memoria (archivos muy grandes)", value=False)
+        if out_of_core:
+            st.caption("El archivo se procesa por bloques; solo se carga una muestra.")
         
     elif data_source == "Servidor Remoto":
         try:
@@ -79,6 +170,9 @@ with st.sidebar:
             
             with st.spinner("Conectando al servidor..."):
                 files = ssh_manager.list_files(remote_base_dir)
+
+            pool_stats = get_pool_stats()
+            st.caption(f"SSH: {pool_stats['handshakes']} conexiones, {pool_stats['reused']} reutilizadas")
                 
             if files:
                 selected_filename = st.selectbox("Selecciona un archivo:", files)
@@ -149,6 +243,8 @@ with st.sidebar:
                      current_mtime = 0 
             else:
                 current_source_sig = str(file_to_load.name) if hasattr(file_to_load, 'name') else str(file_to_load)
+                if out_of_core:
+                    current_source_sig += "|chunked"
             
             last_source = st.session_state.get('last_source', '')
             last_mtime = st.session_state.get('last_mtime', 0)
@@ -165,23 +261,107 @@ with st.sidebar:
                 with st.spinner("Cargando y analizando..."):
                     
                     # Actual loading logic
+                    # Local and remote files keep a reader so LIVE refreshes only parse appended rows
+                    reader = st.session_state.get('live_reader')
+                    if reader is None or st.session_state.get('live_reader_sig') != current_source_sig:
+                        reader = None
+
                     if data_source == "Servidor Remoto":
-                         # Download file object
-                         print(f"DEBUG: Downloading remote file: {remote_file_path}")
-                         file_obj = ssh_manager.get_file(remote_file_path)
-                         df = load_csv(file_obj)
+                         # Download only the bytes appended since the last fetch
+                         if reader is None:
+                             reader = IncrementalCSVReader(compact=True)
+                         print(f"DEBUG: Fetching remote file from offset {reader.offset}: {remote_file_path}")
+                         delta = ssh_manager.get_file_delta(
+                             remote_file_path,
+                             offset=reader.offset,
+                             prev_size=reader.size,
+                             prev_mtime=st.session_state.get('remote_mtime'),
+                             expected_head=reader.header
+                         )
+                         st.session_state.remote_mtime = delta.mtime
+                         try:
+                             df = reader.load_bytes(delta.data) if delta.reset else reader.append_bytes(delta.data)
+                         except ValueError:
+                             # Appended rows changed the schema: full download
+                             file_obj = ssh_manager.get_file(remote_file_path)
+                             df = reader.load_bytes(file_obj.getvalue())
+                         print(f"DEBUG: Received {len(delta.data)} bytes ({len(reader.last_delta)} rows)")
                          if ssh_manager: ssh_manager.close()
+                    elif isinstance(file_to_load, str) and out_of_core:
+                        # Only the first chunk is kept, as a sample for the schema
+                        print(f"DEBUG: Sampling local file for out-of-core mode: {file_to_load}")
+                        reader = None
+                        df = next(iter_csv_chunks(file_to_load))
+                    elif isinstance(file_to_load, str):
+                        if reader is None:
+                            print(f"DEBUG: Loading local file: {file_to_load}")
+                            reader = IncrementalCSVReader(file_to_load, compact=True, cache=True)
+                            df = reader.load()
+                        else:
+                            df = reader.refresh()
+                            print(f"DEBUG: Appended {len(reader.last_delta)} rows from {file_to_load}")
                     else:
-                        print(f"DEBUG: Loading local file: {file_to_load}")
-                        df = load_csv(file_to_load)
+                        print(f"DEBUG: Loading uploaded file: {file_to_load.name}")
+                        df = load_csv(file_to_load, compact=True)
+
+                    st.session_state.live_reader = reader
+                    st.session_state.live_reader_sig = current_source_sig
                         
+                    if "memory_report" in df.attrs:
+                        st.session_state.memory_report = df.attrs["memory_report"]
+
                     st.session_state.df = df
+                    # Identity of this load: sessions reading the same file version share
+                    # cached results, and isolated workers map each version once
+                    version = hashlib.sha1(
+                        f"{current_source_sig}|{current_mtime}|{st.session_state.get('remote_mtime')}|{len(df)}".encode()
+                    )
+                    if hasattr(file_to_load, 'getbuffer'):
+                        # Uploads have no mtime: two files with the same name and size must differ
+                        version.update(file_to_load.getbuffer())
+                    st.session_state.data_version = version.hexdigest()
+                    st.session_state.out_of_core_path = file_to_load if out_of_core else None
+                    # Appended rows are parsed on their own; a reset or replaced rows parse every row again
+                    list_columns = st.session_state.get('list_columns')
+                    if out_of_core:
+                        list_columns = {}
+                    elif (reader is not None and not reader.last_reset and not reader.last_dropped
+                            and list_columns is not None and st.session_state.get('last_source') == current_source_sig):
+                        list_columns = extend_list_columns(list_columns, df, reader.last_delta)
+                    else:
+                        list_columns = extract_list_columns(df)
+                    st.session_state.list_columns = list_columns
+                    # Sorted once per load: time-range questions use binary search instead of a mask.
+                    # Appended rows are added to the previous index unless they are older than it
+                    time_index = st.session_state.get('time_index')
+                    if out_of_core:
+                        time_index = None
+                    elif (reader is None or reader.last_reset or reader.last_dropped or time_index is None
+                            or st.session_state.get('last_source') != current_source_sig
+                            or not time_index.extend(df, reader.last_delta)):
+                        time_index = build_time_index(df)
+                    st.session_state.time_index = time_index
                     st.session_state.last_source = current_source_sig
                     st.session_state.last_mtime = current_mtime
                     
-                    # Generate Schema
-                    st.session_state.schema_desc = generate_schema_description(df)
-                    st.session_state.schema_dict = analyze_schema(df)
+                    # Generate Schema: appended rows only update the previous statistics
+                    stats = st.session_state.get('schema_stats')
+                    # Rows replaced by the refresh (a partial last line parsed again) cannot be
+                    # taken out of the sketches: rebuild then
+                    if (reader is not None and not reader.last_reset and not reader.last_dropped and stats is not None
+                            and st.session_state.get('schema_stats_sig') == current_source_sig):
+                        stats.update(reader.last_delta)
+                    else:
+                        stats = SchemaStats.from_frame(df)
+                    st.session_state.schema_stats = stats
+                    st.session_state.schema_stats_sig = current_source_sig
+                    st.session_state.schema_desc = describe_schema()
+                    st.session_state.schema_dict = stats.to_dict()
+
+                    # A new layout gets a new fingerprint; code cached for the previous one is
+                    # kept, since other sessions (or files) with that layout still use it
+                    st.session_state.schema_fingerprint = schema_fingerprint(
+                        st.session_state.schema_dict, "chunked" if out_of_core else "")
                     
                     # Clear conversation ONLY if source changed entirely, potentially? 
                     # If it's just an update (live mode), we might want to KEEP history but update last charts.
@@ -205,8 +385,10 @@ with st.sidebar:
                             if msg["role"] == "assistant" and "code" in msg and msg["code"]:
                                 try:
                                     # Re-execute
-                                    res_obj = execute_code(msg["code"], df)
+                                    res_obj = run_generated_code(msg["code"])
                                     if res_obj.success:
+                                        if "timings" in msg:
+                                            msg["timings"] = dict(msg["timings"], profile=res_obj.profile, render_time=None)
                                         # Format again
                                         formatted = format_result(res_obj)
                                         # Update msg content
@@ -234,10 +416,59 @@ with st.sidebar:
 
     # Schema Preview
     if st.session_state.df is not None:
+        memory_report = st.session_state.get('memory_report')
+        if memory_report:
+            st.caption(
+                f"Memoria: {memory_report['before_bytes'] / 1e6:.1f} MB → "
+                f"{memory_report['after_bytes'] / 1e6:.1f} MB"
+            )
         with st.expander("📊 Ver Estructura"):
             st.json(st.session_state.schema_dict)
 
     st.divider()
+    st.toggle("⚡ Candidatos en paralelo", value=False, key='speculative',
+              help="Pide varios programas a la vez y usa el primero que funcione. "
+                   "Se ejecutan en procesos aislados para detener los que pierden.")
+    if st.session_state.speculative:
+        spec_stats = get_speculative_stats()
+        st.caption(f"Paralelo: {spec_stats['successes']}/{spec_stats['runs']} resueltas, "
+                   f"{spec_stats['saved_round_trips']} reintentos evitados")
+    st.toggle("🛡️ Ejecución aislada", value=False, key='isolated_execution',
+              help="Ejecuta el código en un proceso aparte con límite de tiempo y memoria.")
+    if st.session_state.isolated_execution:
+        pool_stats = get_execution_pool().stats
+        st.caption(f"Aislada: {pool_stats['runs']} ejecuciones, {pool_stats['timeouts']} por tiempo, "
+                   f"{pool_stats['crashes']} caídas")
+    st.toggle("🔬 Perfilar código", value=False, key='profile_code',
+              help="Muestra las funciones más lentas del código generado (cProfile).")
+    exec_stats = get_executor_stats()
+    st.caption(f"Ejecución: {exec_stats['result_hit_rate']:.0%} resultados y "
+               f"{exec_stats['compile_hit_rate']:.0%} compilaciones reutilizadas "
+               f"({exec_stats['result_bytes'] / 1e6:.1f} MB en caché)")
+    cache_stats = get_response_cache().stats()
+    st.caption(f"Caché LLM: {cache_stats['hits']} aciertos, {cache_stats['misses']} fallos ({cache_stats['entries']} respuestas)")
+
+    code_cache = get_code_cache()
+    with st.expander("🗂️ Caché de código"):
+        st.caption(f"{code_cache.hits} aciertos, {code_cache.misses} fallos en esta sesión del servidor")
+        entries = code_cache.entries()
+        if entries:
+            current = st.session_state.get('schema_fingerprint')
+            st.dataframe(pd.DataFrame([{
+                "pregunta": e["question"],
+                "esquema": e["fingerprint"][:8] + (" (actual)" if e["fingerprint"] == current else ""),
+                "usos": e["uses"],
+                "último uso": pd.to_datetime(e["last_used"], unit="s").strftime("%Y-%m-%d %H:%M")
+            } for e in entries]), hide_index=True)
+            col_a, col_b = st.columns(2)
+            if current and col_a.button("Borrar esquema actual"):
+                code_cache.delete(current)
+                st.rerun()
+            if col_b.button("Vaciar caché"):
+                code_cache.clear()
+                st.rerun()
+        else:
+            st.caption("Sin entradas.")
     st.divider()
     col1, col2 = st.columns(2)
     with col1:
@@ -278,7 +509,7 @@ else:
 
     # Initialize LLM
     try:
-        llm = LLMClient(api_key=st.session_state.api_key)
+        llm = LLMClient(api_key=st.session_state.api_key, cache=get_response_cache())
     except Exception as e:
         st.error(f"Error inicializando LLM: {e}")
         st.stop()
@@ -292,8 +523,13 @@ else:
             if "dataframe" in msg:
                 st.dataframe(msg["dataframe"])
             if "code" in msg:
+                timings = msg.get("timings")
+                if timings:
+                    st.caption(format_timings(timings["profile"], timings.get("llm_time"), timings.get("render_time")))
                 with st.expander("Ver código"):
                     st.code(msg["code"], language="python")
+                    if timings and timings["profile"].get("top"):
+                        st.dataframe(pd.DataFrame(timings["profile"]["top"]), hide_index=True)
 
     # User Input
     if prompt := st.chat_input("Escribe tu pregunta sobre los datos..."):
@@ -306,7 +542,12 @@ else:
             with st.spinner("Analizando y generando código..."):
                 try:
                     # A. Build Prompt
-                    system_msg = build_system_prompt(st.session_state.schema_desc)
+                    system_msg = build_system_prompt(
+                        describe_schema(prompt),
+                        st.session_state.get('list_columns'),
+                        chunked=bool(st.session_state.out_of_core_path),
+                        time_index=st.session_state.get('time_index')
+                    )
                     
                     # --- RETRY LOOP START ---
                     max_retries = 2
@@ -314,8 +555,43 @@ else:
                     result_obj = None
                     final_code = ""
                     last_error = ""
+                    llm_time = 0.0
+                    code_placeholder = st.empty()
+                    optimize = snapshot_optimizer()
+
+                    # Same question on the same schema: reuse the code, no LLM call
+                    fingerprint = st.session_state.get('schema_fingerprint')
+                    cached_code = get_code_cache().get(fingerprint, prompt) if fingerprint else None
+                    if cached_code:
+                        print("DEBUG: Reusing cached code for this question")
+                        result_obj = run_generated_code(cached_code)
+                        final_code = cached_code
+                        code_placeholder.code(final_code, language="python")
+                        if not result_obj.success:
+                            get_code_cache().delete(fingerprint, prompt)
+                            result_obj = None
 
-                    while current_try <= max_retries:
+                    if st.session_state.get('speculative') and result_obj is None:
+                        # Several candidates at once; the serial loop only runs if all fail
+                        speculative_start = time.perf_counter()
+                        # Candidates run in the isolated pool, so the losers can be stopped
+                        execute = snapshot_executor(isolated=True)
+                        cancel = threading.Event()
+                        outcome = run_speculative(llm, prompt, system_msg,
+                                                  lambda code: execute(optimize(code), cancel), cancel=cancel)
+                        # Candidates overlap: count the wait not spent executing the winner
+                        llm_time += time.perf_counter() - speculative_start
+                        if outcome.result is not None:
+                            llm_time -= outcome.result.profile.get("wall_time", 0.0)
+                            result_obj = outcome.result
+                            final_code = optimize(outcome.code)
+                            code_placeholder.code(final_code, language="python")
+                            if not outcome.success:
+                                llm.forget(prompt, system=system_msg)
+                                last_error = result_obj.error
+                                current_try = 1
+
+                    while current_try <= max_retries and not (result_obj is not None and result_obj.success):
                         if current_try == 0:
                             # First attempt
                             prompt_to_send = prompt
@@ -324,26 +600,40 @@ else:
                             st.warning(f"⚠️ Intento {current_try}: Hubo un error, reintentando...")
                             prompt_to_send = build_correction_prompt(prompt, last_error, final_code)
                         
-                        # B. Get Code from LLM
-                        code_response = llm.query(prompt_to_send, system=system_msg)
+                        # B. Get Code from LLM, showing it while it is generated
+                        code_response = ""
+                        llm_start = time.perf_counter()
+                        for token in llm.stream_query(prompt_to_send, system=system_msg):
+                            code_response += token
+                            code_placeholder.code(extract_code(code_response), language="python")
+                        llm_time += time.perf_counter() - llm_start
                         
-                        # Clean code (remove markdown backticks if present)
-                        code = code_response.replace("```python", "").replace("```", "").strip()
+                        # Keep only the code block (no markdown fences or prose), with row-wise
+                        # loops and apply(axis=1) rewritten as column operations when equivalent
+                        code = optimize(extract_code(code_response))
+                        code_placeholder.code(code, language="python")
                         final_code = code # Store for potential correction prompt
                         
                         # C. Execute Code
-                        result_obj = execute_code(code, st.session_state.df)
+                        result_obj = run_generated_code(code)
                         
                         if result_obj.success:
                             break # Success!
                         else:
+                            # Do not serve code that failed from the cache again
+                            llm.forget(prompt_to_send, system=system_msg)
                             last_error = result_obj.error
                             current_try += 1
                     
                     # --- RETRY LOOP END ---
+
+                    if result_obj.success and fingerprint and final_code != cached_code:
+                        get_code_cache().put(fingerprint, prompt, final_code)
                     
                     # D. Format Output
+                    render_start = time.perf_counter()
                     formatted = format_result(result_obj)
+                    timings = {"profile": result_obj.profile, "llm_time": llm_time or None}
                     
                     # E. Display output
                     if formatted["type"] == "error":
@@ -353,35 +643,41 @@ else:
                     
                     elif formatted["type"] == "plot":
                         st.plotly_chart(formatted["value"], use_container_width=True)
+                        timings["render_time"] = time.perf_counter() - render_start
                         content_to_save = "Gráfico generado."
                         # Add to history with specific marker
                         st.session_state.messages.append({
                             "role": "assistant", 
                             "content": "Aquí tienes el gráfico:", 
                             "image": formatted["value"],
-                            "code": final_code
+                            "code": final_code,
+                            "timings": timings
                         })
                         # Avoid double appending
                         st.rerun() 
                         
                     elif formatted["type"] == "dataframe":
                         st.dataframe(formatted["value"])
+                        timings["render_time"] = time.perf_counter() - render_start
                         content_to_save = formatted["summary"]
                         st.session_state.messages.append({
                             "role": "assistant", 
                             "content": "Aquí están los datos:", 
                             "dataframe": formatted["value"],
-                            "code": final_code
+                            "code": final_code,
+                            "timings": timings
                         })
                         st.rerun()
 
                     else:
                         st.markdown(formatted["value"])
+                        timings["render_time"] = time.perf_counter() - render_start
                         content_to_save = str(formatted["value"])
                         st.session_state.messages.append({
                             "role": "assistant", 
                             "content": formatted["value"],
-                            "code": final_code
+                            "code": final_code,
+                            "timings": timings
                         })
                         st.rerun()
 
@@ -0,0 +1,138 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import unicodedata
+from typing import List, Optional
+from .sqlite_store import SQLiteStore, shared_store
+
+# Shared by every user of the server: one file, bounded by entry count
+CACHE_PATH = os.getenv(
+    "CODE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "csv_data_agent_code.sqlite")
+)
+MAX_ENTRIES = int(os.getenv("CODE_CACHE_MAX_ENTRIES", "1000"))
+
+def _dtype_family(dtype: str) -> str:
+    """
+    Coarse type of a column. Compaction picks float32/int32/sparse/category
+    depending on each day's values, which must not change the fingerprint.
+    """
+    dtype = dtype.lower()
+    if "datetime" in dtype:
+        return "datetime"
+    if "bool" in dtype:
+        return "bool"
+    if any(kind in dtype for kind in ("int", "float")):
+        return "number"
+    return "text"
+
+def schema_fingerprint(schema: dict, mode: str = "") -> str:
+    """
+    Fingerprint of a schema (as returned by `analyze_schema`): column names
+    and type families, in order, plus the execution mode (e.g. out-of-core).
+    """
+    parts = [f"{col['name']}:{_dtype_family(col['dtype'])}" for col in schema["columns"]]
+    return hashlib.sha1("|".join([mode] + parts).encode("utf-8")).hexdigest()
+
+def normalize_question(question: str) -> str:
+    """Lowercase, without accents, punctuation or repeated spaces."""
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+class CodeCache(SQLiteStore):
+    """
+    SQLite store of generated code that ran successfully, keyed by schema
+    fingerprint and normalized question. Shared by every session; the least
+    recently used entries are dropped beyond `max_entries`.
+    """
+
+    NAME = "Code cache"
+    TABLE = "code"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS code ("
+        "fingerprint TEXT NOT NULL, question TEXT NOT NULL, code TEXT NOT NULL, "
+        "created REAL NOT NULL, last_used REAL NOT NULL, uses INTEGER NOT NULL DEFAULT 0, "
+        "PRIMARY KEY (fingerprint, question))",
+    )
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        super().__init__(path)
+
+    def get(self, fingerprint: str, question: str) -> Optional[str]:
+        """Code that answered this question on a schema with the same fingerprint, or None."""
+        key = (fingerprint, normalize_question(question))
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT code FROM code WHERE fingerprint = ? AND question = ?", key
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE code SET last_used = ?, uses = uses + 1 WHERE fingerprint = ? AND question = ?",
+                        (time.time(),) + key
+                    )
+        except sqlite3.Error:
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, fingerprint: str, question: str, code: str):
+        """
+        Stores code that executed successfully. A database error only means the
+        question goes to the model again next time.
+        """
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO code (fingerprint, question, code, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (fingerprint, normalize_question(question), code, now, now)
+                )
+                conn.execute(
+                    "DELETE FROM code WHERE rowid IN ("
+                    "SELECT rowid FROM code ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            print(f"DEBUG: Could not store code in cache: {e}")
+
+    def delete(self, fingerprint: str, question: str = None):
+        """Removes one entry, or every entry of a schema if `question` is None."""
+        try:
+            with self._connect() as conn:
+                if question is None:
+                    conn.execute("DELETE FROM code WHERE fingerprint = ?", (fingerprint,))
+                else:
+                    conn.execute(
+                        "DELETE FROM code WHERE fingerprint = ? AND question = ?",
+                        (fingerprint, normalize_question(question))
+                    )
+        except sqlite3.Error:
+            pass
+
+    def entries(self, limit: int = 200) -> List[dict]:
+        """Most recently used entries, for the admin view."""
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT fingerprint, question, code, created, last_used, uses FROM code "
+                    "ORDER BY last_used DESC LIMIT ?", (limit,)
+                ).fetchall()
+        except sqlite3.Error:
+            return []
+        keys = ("fingerprint", "question", "code", "created", "last_used", "uses")
+        return [dict(zip(keys, row)) for row in rows]
+
+def get_code_cache() -> CodeCache:
+    """The code cache of this server, at CODE_CACHE_PATH."""
+    return shared_store(CodeCache)
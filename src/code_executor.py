@@ -3,26 +3,138 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 import io
+import os
+import time
+import pickle
+import pstats
+import cProfile
+import hashlib
+import functools
 import contextlib
+import threading
 import traceback
+import tracemalloc
+from collections import OrderedDict
+from typing import Iterable, Optional
+from src.rf_helpers import HELPERS
+
+# Chunk partials are combined every N chunks to keep memory bounded
+FOLD_EVERY = 16
+
+# Compiled programs kept by source hash, results by (source hash, data version)
+COMPILE_CACHE_SIZE = 256
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_MB", "256")) * 1024 ** 2
+# Functions listed in the cProfile summary of each run (0 disables cProfile)
+PROFILE_TOP_N = int(os.getenv("EXEC_PROFILE_TOP", "0"))
+
+# Copy-on-write while generated code runs: a shallow copy of the session frame
+# behaves as an independent copy, and only the columns the code writes get
+# materialized. pandas options are process-wide, so the option stays on while
+# any run (in any session thread) is active
+_COW_LOCK = threading.Lock()
+_COW_RUNS = 0
+_COW_CONTEXT = None
+
+@contextlib.contextmanager
+def _copy_on_write():
+    """Turns pandas copy-on-write on for the duration of the block."""
+    global _COW_RUNS, _COW_CONTEXT
+    with _COW_LOCK:
+        if _COW_RUNS == 0:
+            _COW_CONTEXT = pd.option_context("mode.copy_on_write", True)
+            _COW_CONTEXT.__enter__()
+        _COW_RUNS += 1
+    try:
+        yield
+    finally:
+        with _COW_LOCK:
+            _COW_RUNS -= 1
+            if _COW_RUNS == 0:
+                _COW_CONTEXT.__exit__(None, None, None)
+                _COW_CONTEXT = None
 
 class ExecutionResult:
-    def __init__(self, success: bool, result: any, error: str = None):
+    def __init__(self, success: bool, result: any, error: str = None, mutated_columns: list = None,
+                 profile: dict = None):
         self.success = success
         self.result = result
         self.error = error
+        self.mutated_columns = mutated_columns or []  # Columns of `df` the code added, replaced or dropped
+        self.profile = profile or {}  # Cost of the run, see `RunProfile`
 
-def execute_code(code: str, df: pd.DataFrame) -> ExecutionResult:
+# tracemalloc is process-wide: it stays on while any run is being measured
+_TRACE_LOCK = threading.Lock()
+_TRACE_ACTIVE = set()  # RunProfiles being measured
+_TRACE_OWNED = False
+
+class RunProfile:
     """
-    Executes Python code in a restricted namespace.
-    
-    Args:
-        code: The python code to execute.
-        df: The pandas DataFrame available as 'df'.
-        
-    Returns:
-        ExecutionResult: Object containing success status, result/figure, or error.
+    Measures one run of generated code: wall time, CPU time of the running
+    thread, peak Python allocation (tracemalloc) and, with `top_n`, the
+    functions with the highest cumulative time (cProfile).
+
+    The allocation peak is process-wide: runs measured at the same time in
+    other threads add to it. The peak is only reset when a run starts, and
+    the peak reached so far is first recorded for the runs already active,
+    so overlapping runs never under-report.
     """
+
+    def __init__(self, top_n: int = 0):
+        self.top_n = top_n
+        self.profile = {}
+        self._profiler = None
+
+    def __enter__(self):
+        global _TRACE_OWNED
+        with _TRACE_LOCK:
+            if not _TRACE_ACTIVE and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _TRACE_OWNED = True
+            peak = tracemalloc.get_traced_memory()[1]
+            for other in _TRACE_ACTIVE:
+                other._peak = max(other._peak, peak)
+            _TRACE_ACTIVE.add(self)
+            tracemalloc.reset_peak()
+            self._start_memory = self._peak = tracemalloc.get_traced_memory()[0]
+        if self.top_n:
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Another profiler is active (only one at a time)
+                self._profiler = None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        global _TRACE_OWNED
+        self.profile["wall_time"] = time.perf_counter() - self._start_wall
+        self.profile["cpu_time"] = time.thread_time() - self._start_cpu
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.profile["top"] = _top_functions(self._profiler, self.top_n)
+        with _TRACE_LOCK:
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            self.profile["peak_bytes"] = max(0, peak - self._start_memory)
+            _TRACE_ACTIVE.discard(self)
+            if not _TRACE_ACTIVE and _TRACE_OWNED:
+                tracemalloc.stop()
+                _TRACE_OWNED = False
+        return False
+
+def _top_functions(profiler: cProfile.Profile, top_n: int) -> list:
+    """The `top_n` functions by cumulative time, as dicts for display."""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    return [
+        {"function": func if path == "~" else f"{func} ({os.path.basename(path)}:{line})",
+         "calls": calls, "cumtime": cumtime}
+        for (path, line, func), (_, calls, _, cumtime, _) in rows
+    ]
+
+def _build_globals(df: pd.DataFrame, extra_globals: dict = None, stdout: io.StringIO = None) -> dict:
+    """Namespace for generated code: allowed libraries, analysis helpers, `df` and safe builtins."""
     # 1. Prepare global namespace with allowed libraries
     allowed_globals = {
         "pd": pd,
@@ -32,6 +144,9 @@ def execute_code(code: str, df: pd.DataFrame) -> ExecutionResult:
         "df": df,
         "result": None # Placeholder for output
     }
+    allowed_globals.update(HELPERS)
+    if extra_globals:
+        allowed_globals.update(extra_globals)
     
     # 2. Add restrictions (naive sandbox)
     # Removing builtins that are dangerous
@@ -39,7 +154,9 @@ def execute_code(code: str, df: pd.DataFrame) -> ExecutionResult:
     safe_builtins = {
         "len": len,
         "range": range,
-        "print": print, # allowed but captured
+        # allowed but captured; bound to a buffer instead of redirecting sys.stdout,
+        # which is process-wide and breaks when several programs run in threads
+        "print": functools.partial(print, file=stdout),
         "str": str,
         "int": int,
         "float": float,
@@ -61,24 +178,244 @@ def execute_code(code: str, df: pd.DataFrame) -> ExecutionResult:
     }
     
     allowed_globals["__builtins__"] = safe_builtins
-    
-    # Capture stdout just in case
-    stdout_buffer = io.StringIO()
-    
+    return allowed_globals
+
+def code_hash(code: str) -> str:
+    return hashlib.sha1(code.encode("utf-8")).hexdigest()
+
+# Shared by every session (and thread) of the process
+_COMPILED = OrderedDict()   # code hash -> code object
+_RESULTS = OrderedDict()    # (code hash, data version) -> (result value, bytes)
+_CACHE_LOCK = threading.Lock()
+_STATS = {"compile_hits": 0, "compile_misses": 0, "result_hits": 0, "result_misses": 0, "result_bytes": 0}
+
+def _compile(code: str):
+    """Code object for `code`, compiled once per distinct source."""
+    key = code_hash(code)
+    with _CACHE_LOCK:
+        compiled = _COMPILED.get(key)
+        if compiled is not None:
+            _COMPILED.move_to_end(key)
+            _STATS["compile_hits"] += 1
+            return compiled
+        _STATS["compile_misses"] += 1
+    # Same filename as exec(str), so tracebacks look the same
+    compiled = compile(code, "<string>", "exec")
+    with _CACHE_LOCK:
+        _COMPILED[key] = compiled
+        while len(_COMPILED) > COMPILE_CACHE_SIZE:
+            _COMPILED.popitem(last=False)
+    return compiled
+
+def _result_nbytes(value) -> Optional[int]:
+    """Approximate memory held by a result, or None if it cannot be cached."""
+    if value is None or isinstance(value, (int, float, bool, str, np.number)):
+        return 64 + (len(value) if isinstance(value, str) else 0)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
     try:
+        # Figures, lists, dicts...
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+def cached_result(code: str, data_version: str) -> Optional[ExecutionResult]:
+    """Stored result of `code` on this data version, or None."""
+    key = (code_hash(code), data_version)
+    with _CACHE_LOCK:
+        entry = _RESULTS.get(key)
+        if entry is None:
+            _STATS["result_misses"] += 1
+            return None
+        _RESULTS.move_to_end(key)
+        _STATS["result_hits"] += 1
+    return ExecutionResult(success=True, result=entry[0], mutated_columns=entry[2],
+                           profile={"cached": True, "result_bytes": entry[1]})
+
+def store_result(code: str, data_version: str, result: ExecutionResult, max_bytes: int = None):
+    """Keeps a successful result; least recently used ones are dropped beyond `max_bytes`."""
+    max_bytes = RESULT_CACHE_BYTES if max_bytes is None else max_bytes
+    if not result.success:
+        return
+    nbytes = _result_nbytes(result.result)
+    # Very large results would evict everything else
+    if nbytes is None or nbytes > max_bytes // 4:
+        return
+    key = (code_hash(code), data_version)
+    with _CACHE_LOCK:
+        old = _RESULTS.pop(key, None)
+        if old is not None:
+            _STATS["result_bytes"] -= old[1]
+        _RESULTS[key] = (result.result, nbytes, result.mutated_columns)
+        _STATS["result_bytes"] += nbytes
+        while _STATS["result_bytes"] > max_bytes:
+            _, (_, dropped, _) = _RESULTS.popitem(last=False)
+            _STATS["result_bytes"] -= dropped
+
+def get_executor_stats() -> dict:
+    """Hit rates of the compiled-code and result caches and the bytes held by results."""
+    with _CACHE_LOCK:
+        stats = dict(_STATS, compiled_entries=len(_COMPILED), result_entries=len(_RESULTS))
+    for kind in ("compile", "result"):
+        lookups = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+        stats[f"{kind}_hit_rate"] = stats[f"{kind}_hits"] / lookups if lookups else 0.0
+    return stats
+
+def clear_executor_caches():
+    with _CACHE_LOCK:
+        _COMPILED.clear()
+        _RESULTS.clear()
+        _STATS["result_bytes"] = 0
+
+def _same_data(a: pd.Series, b: pd.Series) -> bool:
+    """True if both columns still hold the same data (cheap: no values are compared)."""
+    if isinstance(a.dtype, np.dtype) and isinstance(b.dtype, np.dtype):
+        return a.dtype == b.dtype and np.may_share_memory(a.to_numpy(), b.to_numpy())
+    return a.array is b.array
 
+def _same_index(a: pd.Index, b: pd.Index) -> bool:
+    if isinstance(a, pd.RangeIndex) and isinstance(b, pd.RangeIndex):
+        return a.equals(b)
+    return len(a) == len(b) and np.may_share_memory(a.to_numpy(), b.to_numpy())
 
+def mutated_columns(original: pd.DataFrame, view: pd.DataFrame) -> list:
+    """Columns added, replaced or dropped in `view`, a shallow copy of `original`."""
+    if not _same_index(original.index, view.index):
+        # Filtered or reordered in place: every column changed
+        return list(dict.fromkeys(list(original.columns) + list(view.columns)))
+    changed = [col for col in original.columns if col not in view.columns or not _same_data(original[col], view[col])]
+    return changed + [col for col in view.columns if col not in original.columns]
+
+def execute_code(code: str, df: pd.DataFrame, extra_globals: dict = None, copy_on_write: bool = True,
+                 data_version: str = None, profile_top: int = PROFILE_TOP_N) -> ExecutionResult:
+    """
+    Executes Python code in a restricted namespace.
+    
+    Args:
+        code: The python code to execute.
+        df: The pandas DataFrame available as 'df'.
+        extra_globals: Additional names exposed to the code (e.g. 'list_columns').
+        copy_on_write: Give the code a shallow copy of `df`, so its writes never
+            reach the caller's frame; only written columns are copied.
+        data_version: Identity of the data in `df`. When given (with
+            copy_on_write), a previous result of the same code is returned
+            without running it, and successful results are stored.
+        profile_top: Number of functions in the cProfile summary (0: no cProfile).
         
-        with contextlib.redirect_stdout(stdout_buffer):
+    Returns:
+        ExecutionResult: Object containing success status, result/figure, or
+        error, and the `profile` of the run.
+    """
+    use_cache = data_version is not None and copy_on_write
+    if use_cache:
+        cached = cached_result(code, data_version)
+        if cached is not None:
+            return cached
+
+    # Capture stdout just in case
+    stdout_buffer = io.StringIO()
+
+    with _copy_on_write():
+        # 1. Prepare restricted global namespace
+        view = df.copy(deep=False) if copy_on_write and df is not None else df
+        allowed_globals = _build_globals(view, extra_globals, stdout_buffer)
+        run = RunProfile(profile_top)
+    
+        try:
             # Execute
-            exec(code, allowed_globals)
+            with run:
+                exec(_compile(code), allowed_globals)
             
-        # Extract 'result'
-        result_value = allowed_globals.get("result")
-        
-        return ExecutionResult(success=True, result=result_value)
+            # Extract 'result'
+            result_value = allowed_globals.get("result")
+            run.profile["result_bytes"] = _result_nbytes(result_value)
+
+            changed = mutated_columns(df, view) if view is not df else []
+            if changed:
+                print(f"DEBUG: Generated code modified columns {changed} (session data untouched)")
+            result = ExecutionResult(success=True, result=result_value, mutated_columns=changed, profile=run.profile)
+            if use_cache:
+                store_result(code, data_version, result)
+            return result
         
-    except Exception:
-        error_msg = traceback.format_exc()
-        # Clean up traceback to hide internal path details if possible, or just return as is
-        return ExecutionResult(success=False, result=None, error=error_msg)
+        except Exception:
+            error_msg = traceback.format_exc()
+            # Clean up traceback to hide internal path details if possible, or just return as is
+            return ExecutionResult(success=False, result=None, error=error_msg, profile=run.profile)
+
+def merge_partials(partials: list, how: str = 'sum'):
+    """
+    Combines chunk partials of the same kind, for use in `reduce_partials`:
+    numbers with sum/min/max, Series/DataFrames (e.g. groupby results) by
+    aligning on their index and aggregating with `how`.
+    """
+    partials = [p for p in partials if p is not None]
+    if not partials:
+        return None
+    if isinstance(partials[0], (pd.Series, pd.DataFrame)):
+        combined = pd.concat(partials)
+        return combined.groupby(level=list(range(combined.index.nlevels))).agg(how)
+    if how == 'sum':
+        return sum(partials)
+    if how == 'min':
+        return min(partials)
+    if how == 'max':
+        return max(partials)
+    raise ValueError(f"Unsupported merge for scalars: {how}")
+
+def execute_chunked(code: str, chunks: Iterable[pd.DataFrame], extra_globals: dict = None,
+                    fold_every: int = FOLD_EVERY, data_version: str = None,
+                    profile_top: int = PROFILE_TOP_N) -> ExecutionResult:
+    """
+    Executes generated code as a map/reduce over DataFrame chunks (out-of-core mode).
+
+    The code must define:
+        map_chunk(chunk) -> partial
+        reduce_partials(partials) -> partial of the same kind (associative)
+        finalize(partial) -> final result (optional)
+    Partials are folded every `fold_every` chunks, so memory is bounded by the
+    chunk size plus the size of the partials. With `data_version`, results are
+    cached as in `execute_code`.
+    """
+    if data_version is not None:
+        cached = cached_result(code, data_version)
+        if cached is not None:
+            return cached
+
+    stdout_buffer = io.StringIO()
+    allowed_globals = _build_globals(None, extra_globals, stdout_buffer)
+    allowed_globals["merge_partials"] = merge_partials
+    run = RunProfile(profile_top)
+
+    with _copy_on_write():
+        try:
+            with run:
+                exec(_compile(code), allowed_globals)
+
+                map_chunk = allowed_globals.get("map_chunk")
+                reduce_partials = allowed_globals.get("reduce_partials")
+                finalize = allowed_globals.get("finalize")
+                if not callable(map_chunk) or not callable(reduce_partials):
+                    raise NameError("Out-of-core code must define map_chunk(chunk) and reduce_partials(partials)")
+
+                partials = []
+                for chunk in chunks:
+                    partials.append(map_chunk(chunk))
+                    if len(partials) >= fold_every:
+                        partials = [reduce_partials(partials)]
+
+                combined = reduce_partials(partials) if partials else None
+                result_value = finalize(combined) if callable(finalize) else combined
+            run.profile["result_bytes"] = _result_nbytes(result_value)
+
+            result = ExecutionResult(success=True, result=result_value, profile=run.profile)
+            if data_version is not None:
+                store_result(code, data_version, result)
+            return result
+
+        except Exception:
+            error_msg = traceback.format_exc()
+            return ExecutionResult(success=False, result=None, error=error_msg, profile=run.profile)
@@ -0,0 +1,844 @@
+import os
+import ast
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from src.code_executor import execute_code
+from src.rf_helpers import HELPERS
+
+# Rows used to check that a rewrite gives the same result, and to time it
+SAMPLE_ROWS = int(os.getenv("OPTIMIZER_SAMPLE_ROWS", "2000"))
+# Decisions kept per (code, schema), so LIVE reruns do not validate again
+MAX_DECISIONS = 512
+
+# Row methods with a vectorized equivalent under `.str` / `.dt`
+STR_METHODS = {"lower", "upper", "strip", "lstrip", "rstrip", "title", "capitalize", "startswith",
+               "endswith", "replace", "isdigit", "isalpha", "isnumeric", "zfill"}
+DT_ATTRIBUTES = {"year", "month", "day", "hour", "minute", "second", "microsecond", "dayofweek", "dayofyear",
+                 "quarter"}
+DT_METHODS = {"weekday": "weekday", "date": "date", "time": "time", "strftime": "strftime"}
+BOOLEAN_CALLS = {"startswith", "endswith", "isdigit", "isalpha", "isnumeric", "isna", "notna", "isnull",
+                 "notnull", "isin"}
+
+@dataclass
+class OptimizedCode:
+    code: str                                          # Code to run (the original if nothing was rewritten)
+    rewrites: List[str] = field(default_factory=list)  # Description of each rewrite applied
+    speedup: Optional[float] = None                    # Original / optimized time on the sample
+
+class _Unsupported(Exception):
+    """The pattern is not one we can rewrite safely."""
+
+def _name(node: ast.AST) -> Optional[str]:
+    return node.id if isinstance(node, ast.Name) else None
+
+def _const_str(node: ast.AST) -> Optional[str]:
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+def _column(frame: str, col: str) -> ast.AST:
+    return ast.Subscript(value=ast.Name(id=frame, ctx=ast.Load()), slice=ast.Constant(value=col), ctx=ast.Load())
+
+def _attr(value: ast.AST, *names: str) -> ast.AST:
+    for name in names:
+        value = ast.Attribute(value=value, attr=name, ctx=ast.Load())
+    return value
+
+def _call(func: ast.AST, args: list = (), **keywords) -> ast.AST:
+    return ast.Call(func=func, args=list(args),
+                    keywords=[ast.keyword(arg=k, value=ast.Constant(value=v)) for k, v in keywords.items()])
+
+def _and(left: Optional[ast.AST], right: ast.AST) -> ast.AST:
+    return right if left is None else ast.BinOp(left=left, op=ast.BitAnd(), right=right)
+
+def _invert(node: ast.AST) -> ast.AST:
+    return ast.UnaryOp(op=ast.Invert(), operand=node)
+
+def _is_boolean(node: ast.AST) -> bool:
+    """True if the expression is a comparison-like value (safe to combine with & and |)."""
+    if isinstance(node, (ast.Compare, ast.BoolOp)):
+        return True
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return True
+    if isinstance(node, ast.Constant) and isinstance(node.value, bool):
+        return True
+    if isinstance(node, ast.Call):
+        func = node.func
+        return isinstance(func, ast.Attribute) and func.attr in BOOLEAN_CALLS
+    return False
+
+class _RowTranslator:
+    """
+    Translates an expression computed for one row into the same expression
+    over whole columns of `frame`. Raises _Unsupported on anything else.
+
+    Row access depends on `mode`:
+        "row":      `row['col']` / `row.col` (apply axis=1 and iterrows)
+        "tuple":    `row.col` (itertuples)
+        "position": `frame['col'].iloc[i]`, `frame.iloc[i]['col']` and, with a
+                    default RangeIndex, the label forms (range(len(frame)))
+        "label":    `frame.loc[i, 'col']`, `frame.at[i, 'col']`, `frame['col'][i]` (frame.index)
+    """
+
+    def __init__(self, frame: str, row: str, mode: str, columns=(), forbidden=(), range_index: bool = False):
+        self.frame = frame
+        self.row = row
+        self.mode = mode
+        self.columns = set(columns)
+        self.forbidden = set(forbidden) | {row}
+        self.range_index = range_index
+        self.read = set()  # Columns read by the translated expressions
+
+    def column_access(self, node: ast.AST) -> Optional[str]:
+        """Column read by `node` if it is a row access, else None."""
+        col = None
+        if self.mode in ("row", "tuple") and isinstance(node, ast.Attribute) and _name(node.value) == self.row:
+            # `row.name`, `row.index`... are Series attributes, not columns
+            if node.attr in self.columns and (self.mode == "tuple" or not hasattr(pd.Series, node.attr)):
+                col = node.attr
+            else:
+                raise _Unsupported(f"attribute {node.attr} of the row")
+        elif self.mode == "row" and isinstance(node, ast.Subscript) and _name(node.value) == self.row:
+            col = _const_str(node.slice)
+            if col is None:
+                raise _Unsupported("row indexed by a non-literal")
+        elif self.mode in ("position", "label") and isinstance(node, ast.Subscript):
+            col = self._indexed_access(node)
+        if col is not None:
+            self.read.add(col)
+        return col
+
+    def _indexed_access(self, node: ast.Subscript) -> Optional[str]:
+        value, index = node.value, node.slice
+        by_label = by_position = None
+        if _name(index) == self.row:
+            if isinstance(value, ast.Subscript) and _name(value.value) == self.frame:
+                by_label = _const_str(value.slice)                    # frame['col'][i]
+            elif (isinstance(value, ast.Attribute) and isinstance(value.value, ast.Subscript)
+                  and _name(value.value.value) == self.frame):
+                col = _const_str(value.value.slice)
+                if value.attr == "iloc":
+                    by_position = col                                 # frame['col'].iloc[i]
+                elif value.attr == "loc":
+                    by_label = col                                    # frame['col'].loc[i]
+        elif (isinstance(index, ast.Tuple) and len(index.elts) == 2 and _name(index.elts[0]) == self.row
+              and isinstance(value, ast.Attribute) and value.attr in ("loc", "at") and _name(value.value) == self.frame):
+            by_label = _const_str(index.elts[1])                      # frame.loc[i, 'col'] / frame.at[i, 'col']
+        elif (isinstance(value, ast.Subscript) and _name(value.slice) == self.row
+              and isinstance(value.value, ast.Attribute) and value.value.attr == "iloc"
+              and _name(value.value.value) == self.frame):
+            by_position = _const_str(index)                           # frame.iloc[i]['col']
+
+        if by_position is not None and self.mode == "position":
+            return by_position
+        if by_label is not None and (self.mode == "label" or self.range_index):
+            return by_label
+        return None
+
+    def translate(self, node: ast.AST):
+        """Returns (vectorized node, whether it depends on the row)."""
+        col = self.column_access(node)
+        if col is not None:
+            return _column(self.frame, col), True
+
+        if isinstance(node, ast.Constant):
+            return node, False
+        if isinstance(node, ast.Name):
+            if node.id in self.forbidden:
+                raise _Unsupported(f"{node.id} used as a whole")
+            return node, False
+        if isinstance(node, ast.Attribute):
+            value, dep = self.translate(node.value)
+            if not dep:
+                return ast.Attribute(value=value, attr=node.attr, ctx=ast.Load()), False
+            if node.attr in DT_ATTRIBUTES:
+                return _attr(value, "dt", node.attr), True
+            raise _Unsupported(f"attribute {node.attr} of a row value")
+        if isinstance(node, ast.BinOp):
+            left, dl = self.translate(node.left)
+            right, dr = self.translate(node.right)
+            return ast.BinOp(left=left, op=node.op, right=right), dl or dr
+        if isinstance(node, ast.UnaryOp):
+            operand, dep = self.translate(node.operand)
+            if isinstance(node.op, ast.Not) and dep:
+                if not _is_boolean(node.operand):
+                    raise _Unsupported("`not` of a non-boolean value")
+                return _invert(operand), True
+            return ast.UnaryOp(op=node.op, operand=operand), dep
+        if isinstance(node, ast.BoolOp):
+            values = [self.translate(v) for v in node.values]
+            if not any(dep for _, dep in values):
+                return ast.BoolOp(op=node.op, values=[v for v, _ in values]), False
+            if not all(_is_boolean(v) for v in node.values):
+                # `a or b` returns one of the operands, not a boolean
+                raise _Unsupported("and/or of non-boolean values")
+            op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+            result = values[0][0]
+            for value, _ in values[1:]:
+                result = ast.BinOp(left=result, op=op, right=value)
+            return result, True
+        if isinstance(node, ast.Compare):
+            return self._compare(node)
+        if isinstance(node, ast.IfExp):
+            test, dt = self.translate(node.test)
+            body, db = self.translate(node.body)
+            orelse, do = self.translate(node.orelse)
+            if not dt:
+                return ast.IfExp(test=test, body=body, orelse=orelse), db or do
+            where = _call(_attr(ast.Name(id="np", ctx=ast.Load()), "where"), [test, body, orelse])
+            return self.as_series(where), True
+        if isinstance(node, ast.Call):
+            return self._call(node)
+        if isinstance(node, ast.Subscript):
+            value, dep = self.translate(node.value)
+            index, di = self.translate(node.slice) if not isinstance(node.slice, ast.Slice) else (node.slice, False)
+            if di:
+                raise _Unsupported("subscript with a row-dependent index")
+            if dep:
+                return ast.Subscript(value=_attr(value, "str"), slice=index, ctx=ast.Load()), True
+            return ast.Subscript(value=value, slice=index, ctx=ast.Load()), False
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            elts = [self.translate(e) for e in node.elts]
+            if any(dep for _, dep in elts):
+                raise _Unsupported("container of row values")
+            return node, False
+        raise _Unsupported(type(node).__name__)
+
+    def as_series(self, node: ast.AST) -> ast.AST:
+        """Wraps an array result so it aligns with the frame like the rest of the columns."""
+        return ast.Call(func=_attr(ast.Name(id="pd", ctx=ast.Load()), "Series"), args=[node],
+                        keywords=[ast.keyword(arg="index", value=_attr(ast.Name(id=self.frame, ctx=ast.Load()), "index"))])
+
+    def _compare(self, node: ast.Compare):
+        parts = []
+        any_dep = False
+        left, dl = self.translate(node.left)
+        left_node = node.left
+        for op, right_node in zip(node.ops, node.comparators):
+            right, dr = self.translate(right_node)
+            any_dep = any_dep or dl or dr
+            parts.append(self._pair(left, dl, left_node, op, right, dr, right_node))
+            left, dl, left_node = right, dr, right_node
+        if not any_dep:
+            return ast.Compare(left=self.translate(node.left)[0], ops=node.ops,
+                               comparators=[self.translate(c)[0] for c in node.comparators]), False
+        result = parts[0]
+        for part in parts[1:]:
+            result = ast.BinOp(left=result, op=ast.BitAnd(), right=part)
+        return result, True
+
+    def _pair(self, left, dl, left_node, op, right, dr, right_node) -> ast.AST:
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not dl and dr and _const_str(left_node) is not None:
+                test = _call(_attr(right, "str", "contains"), [left], regex=False, na=False)
+            elif dl and not dr and isinstance(right_node, (ast.List, ast.Tuple, ast.Set)):
+                test = _call(_attr(left, "isin"), [ast.List(elts=right_node.elts, ctx=ast.Load())])
+            elif dl or dr:
+                raise _Unsupported("membership test")
+            else:
+                return ast.Compare(left=left, ops=[op], comparators=[right])
+            return _invert(test) if isinstance(op, ast.NotIn) else test
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            if dl and isinstance(right_node, ast.Constant) and right_node.value is None:
+                return _call(_attr(left, "isna" if isinstance(op, ast.Is) else "notna"))
+            if dl or dr:
+                raise _Unsupported("identity test")
+        return ast.Compare(left=left, ops=[op], comparators=[right])
+
+    def _call(self, node: ast.Call):
+        if any(k.arg is None for k in node.keywords) or any(isinstance(a, ast.Starred) for a in node.args):
+            raise _Unsupported("*args/**kwargs")
+        args = [self.translate(a) for a in node.args]
+        keywords = [(k.arg, self.translate(k.value)) for k in node.keywords]
+        if any(dep for _, (_, dep) in keywords):
+            raise _Unsupported("row value passed by keyword")
+        new_args = [a for a, _ in args]
+        new_keywords = [ast.keyword(arg=k, value=v) for k, (v, _) in keywords]
+        func = node.func
+
+        if isinstance(func, ast.Attribute):
+            value, dep = self.translate(func.value)
+            if dep:
+                if any(d for _, d in args):
+                    raise _Unsupported("row values as method arguments")
+                if func.attr in STR_METHODS:
+                    extra = []
+                    if func.attr in ("startswith", "endswith"):
+                        extra = [ast.keyword(arg="na", value=ast.Constant(value=False))]
+                    elif func.attr == "replace":
+                        extra = [ast.keyword(arg="regex", value=ast.Constant(value=False))]
+                    return ast.Call(func=_attr(value, "str", func.attr), args=new_args,
+                                    keywords=new_keywords + extra), True
+                if func.attr in DT_METHODS:
+                    method = _attr(value, "dt", DT_METHODS[func.attr])
+                    if func.attr == "strftime":
+                        return ast.Call(func=method, args=new_args, keywords=new_keywords), True
+                    if new_args or new_keywords:
+                        raise _Unsupported(f"{func.attr} with arguments")
+                    return method, True
+                raise _Unsupported(f"method {func.attr} of a row value")
+
+            module = _name(func.value)
+            if module == "pd" and func.attr in ("isna", "notna", "isnull", "notnull") and len(args) == 1 and args[0][1]:
+                return _call(_attr(args[0][0], func.attr)), True
+            if module == "np" and isinstance(getattr(np, func.attr, None), np.ufunc):
+                return ast.Call(func=func, args=new_args, keywords=new_keywords), any(d for _, d in args)
+            if any(d for _, d in args):
+                raise _Unsupported(f"call to {ast.unparse(func)} with row values")
+            return ast.Call(func=ast.Attribute(value=value, attr=func.attr, ctx=ast.Load()),
+                            args=new_args, keywords=new_keywords), False
+
+        name = _name(func)
+        deps = [d for _, d in args]
+        if not any(deps):
+            if name in self.forbidden:
+                raise _Unsupported(f"call to {name}")
+            return ast.Call(func=func, args=new_args, keywords=new_keywords), False
+        if name in ("abs", "round"):
+            # Series implement __abs__ and __round__
+            return ast.Call(func=func, args=new_args, keywords=new_keywords), True
+        if name in ("max", "min") and len(args) == 2 and not keywords:
+            ufunc = "maximum" if name == "max" else "minimum"
+            return _call(_attr(ast.Name(id="np", ctx=ast.Load()), ufunc), new_args), True
+        if name == "len" and len(args) == 1:
+            return _call(_attr(new_args[0], "str", "len")), True
+        if name in ("float", "int", "str", "bool") and len(args) == 1:
+            return _call(_attr(new_args[0], "astype"), [ast.Name(id=name, ctx=ast.Load())]), True
+        raise _Unsupported(f"call to {name} with row values")
+
+def _is_axis_one(call: ast.Call) -> bool:
+    keywords = {k.arg: k.value for k in call.keywords}
+    axis = keywords.pop("axis", None)
+    return (not keywords and len(call.args) == 1 and isinstance(axis, ast.Constant)
+            and axis.value in (1, "columns"))
+
+def _rewrite_apply(call: ast.Call, columns) -> Optional[ast.AST]:
+    """`frame.apply(lambda row: expr, axis=1)` -> the expression over columns."""
+    func = call.func
+    frame = _name(func.value)
+    lam = call.args[0]
+    if (frame is None or not isinstance(lam, ast.Lambda) or len(lam.args.args) != 1
+            or lam.args.vararg or lam.args.kwarg or lam.args.kwonlyargs or lam.args.defaults):
+        return None
+    translator = _RowTranslator(frame, lam.args.args[0].arg, "row", columns)
+    node, dep = translator.translate(lam.body)
+    if not dep:
+        return None
+    return node
+
+class _LoopRewriter:
+    """
+    Rewrites a `for` loop over the rows of a frame whose body only
+    accumulates sums/counts, appends to lists or assigns a column of the
+    current row (optionally under if/elif/else) into masked column operations.
+    """
+
+    def __init__(self, loop: ast.For, columns, range_index: bool, used_outside: set):
+        self.loop = loop
+        self.columns = columns
+        self.range_index = range_index
+        self.used_outside = used_outside
+        self.statements = []
+        self.written = set()
+        self.masks = 0
+
+    def rewrite(self) -> List[ast.stmt]:
+        loop = self.loop
+        if loop.orelse:
+            raise _Unsupported("loop with else")
+        if (isinstance(loop.iter, ast.Attribute) and loop.iter.attr == "index" and _name(loop.iter.value)
+                and isinstance(loop.target, ast.Name)):
+            # for i in frame.index
+            frame, row, index, mode = loop.iter.value.id, loop.target.id, None, "label"
+        elif isinstance(loop.iter, ast.Call):
+            frame, row, index, mode = self._iteration(loop)
+        else:
+            raise _Unsupported("not a loop over rows")
+        if {row, index} & self.used_outside:
+            raise _Unsupported("loop variable used after the loop")
+        self.frame = frame
+        self.index = index
+
+        assigned = set()
+        for node in ast.walk(ast.Module(body=loop.body, type_ignores=[])):
+            if isinstance(node, (ast.Name,)) and isinstance(node.ctx, ast.Store):
+                assigned.add(node.id)
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "append"
+                    and _name(node.func.value)):
+                assigned.add(node.func.value.id)
+        forbidden = assigned | ({index} if index else set())
+        # Labels equal positions only in the session frame, and only with a default index
+        self.range_index = self.range_index and frame == "df"
+        self.translator = _RowTranslator(frame, row, mode, self.columns, forbidden, self.range_index)
+
+        for stmt in loop.body:
+            self._statement(stmt, None)
+        if self.written & self.translator.read:
+            raise _Unsupported("loop reads a column it writes")
+        if not self.statements:
+            raise _Unsupported("empty loop")
+        return self.statements
+
+    def _iteration(self, loop: ast.For):
+        call = loop.iter
+        func = call.func
+        if isinstance(func, ast.Attribute) and _name(func.value) and func.attr == "iterrows" and not call.args:
+            target = loop.target
+            if (isinstance(target, ast.Tuple) and len(target.elts) == 2
+                    and all(isinstance(e, ast.Name) for e in target.elts)):
+                return func.value.id, target.elts[1].id, target.elts[0].id, "row"
+        if isinstance(func, ast.Attribute) and _name(func.value) and func.attr == "itertuples" and not call.args:
+            if all(k.arg == "index" for k in call.keywords) and isinstance(loop.target, ast.Name):
+                return func.value.id, loop.target.id, None, "tuple"
+        if (isinstance(func, ast.Attribute) and func.attr == "tolist" and isinstance(func.value, ast.Attribute)
+                and func.value.attr == "index" and _name(func.value.value) and isinstance(loop.target, ast.Name)):
+            return func.value.value.id, loop.target.id, None, "label"
+        if _name(func) == "range" and isinstance(loop.target, ast.Name):
+            args = call.args
+            if len(args) == 2 and isinstance(args[0], ast.Constant) and args[0].value == 0:
+                args = args[1:]
+            if (len(args) == 1 and isinstance(args[0], ast.Call) and _name(args[0].func) == "len"
+                    and len(args[0].args) == 1 and _name(args[0].args[0])):
+                return args[0].args[0].id, loop.target.id, None, "position"
+        raise _Unsupported("not a loop over rows")
+
+    def _mask(self, test: ast.AST) -> ast.AST:
+        """Stores a condition once in a variable; returns its name."""
+        node, dep = self.translator.translate(test)
+        if not dep:
+            raise _Unsupported("condition independent of the row")
+        self.masks += 1
+        name = f"_row_mask{self.masks}"
+        self.statements.append(ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=node))
+        return ast.Name(id=name, ctx=ast.Load())
+
+    def _count(self, mask: Optional[ast.AST]) -> ast.AST:
+        if mask is None:
+            return _call(ast.Name(id="len", ctx=ast.Load()), [ast.Name(id=self.frame, ctx=ast.Load())])
+        return _call(ast.Name(id="int", ctx=ast.Load()), [_call(_attr(mask, "sum"))])
+
+    def _selected(self, value: ast.AST, mask: Optional[ast.AST]) -> ast.AST:
+        return value if mask is None else ast.Subscript(value=value, slice=mask, ctx=ast.Load())
+
+    def _statement(self, stmt: ast.stmt, mask: Optional[ast.AST]):
+        if isinstance(stmt, ast.Pass):
+            return
+        if isinstance(stmt, ast.If):
+            test = self._mask(stmt.test)
+            self._block(stmt.body, _and(mask, test))
+            if stmt.orelse:
+                self._block(stmt.orelse, _and(mask, _invert(test)))
+            return
+
+        # total += expr / total = total + expr
+        target = op = value = None
+        if isinstance(stmt, ast.AugAssign) and isinstance(stmt.target, ast.Name):
+            target, op, value = stmt.target.id, stmt.op, stmt.value
+        elif (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name)
+              and isinstance(stmt.value, ast.BinOp) and _name(stmt.value.left) == stmt.targets[0].id):
+            target, op, value = stmt.targets[0].id, stmt.value.op, stmt.value.right
+        if target is not None:
+            if not isinstance(op, (ast.Add, ast.Sub)):
+                raise _Unsupported("accumulator other than a sum")
+            vector, dep = self.translator.translate(value)
+            if dep:
+                # The loop carries NaN through; Series.sum() would skip it
+                skipna = ast.keyword(arg="skipna", value=ast.Constant(value=False))
+                total = ast.Call(func=_attr(self._selected(vector, mask), "sum"), args=[], keywords=[skipna])
+            elif isinstance(vector, ast.Constant) and vector.value == 1:
+                total = self._count(mask)
+            else:
+                total = ast.BinOp(left=vector, op=ast.Mult(), right=self._count(mask))
+            self.statements.append(ast.AugAssign(target=ast.Name(id=target, ctx=ast.Store()), op=op, value=total))
+            return
+
+        # values.append(expr)
+        if (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)
+                and isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == "append"
+                and _name(stmt.value.func.value) and len(stmt.value.args) == 1 and not stmt.value.keywords):
+            vector, dep = self.translator.translate(stmt.value.args[0])
+            if dep:
+                items = _call(_attr(self._selected(vector, mask), "tolist"))
+            else:
+                items = ast.BinOp(left=ast.List(elts=[vector], ctx=ast.Load()), op=ast.Mult(), right=self._count(mask))
+            extend = _call(_attr(stmt.value.func.value, "extend"), [items])
+            self.statements.append(ast.Expr(value=extend))
+            return
+
+        # frame.at[index, 'col'] = expr / frame.loc[index, 'col'] = expr
+        if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1:
+            col = self._row_cell(stmt.targets[0])
+            if col is not None:
+                vector, _ = self.translator.translate(stmt.value)
+                if mask is None:
+                    target = _column(self.frame, col)
+                else:
+                    target = ast.Subscript(value=_attr(ast.Name(id=self.frame, ctx=ast.Load()), "loc"),
+                                           slice=ast.Tuple(elts=[mask, ast.Constant(value=col)], ctx=ast.Load()),
+                                           ctx=ast.Load())
+                target.ctx = ast.Store()
+                self.statements.append(ast.Assign(targets=[target], value=vector))
+                self.written.add(col)
+                return
+        raise _Unsupported(type(stmt).__name__)
+
+    def _block(self, body: list, mask: ast.AST):
+        for stmt in body:
+            self._statement(stmt, mask)
+
+    def _row_cell(self, target: ast.AST) -> Optional[str]:
+        """Column of `frame.at[index, 'col']` (or .loc) when `index` is the current row."""
+        if not (isinstance(target, ast.Subscript) and isinstance(target.value, ast.Attribute)
+                and target.value.attr in ("at", "loc") and _name(target.value.value) == self.frame
+                and isinstance(target.slice, ast.Tuple) and len(target.slice.elts) == 2):
+            return None
+        key = _name(target.slice.elts[0])
+        by_row_label = key is not None and (key == self.index or (key == self.translator.row
+                                                                   and self.translator.mode == "label"))
+        by_position = key is not None and key == self.translator.row and self.translator.mode == "position"
+        if by_row_label or (by_position and self.range_index):
+            return _const_str(target.slice.elts[1])
+        raise _Unsupported("assignment to another row")
+
+def _names_outside(tree: ast.Module, loop: ast.For) -> set:
+    inside = {id(node) for node in ast.walk(loop)}
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and id(node) not in inside}
+
+def _find_rewrites(tree: ast.Module, columns, range_index: bool) -> list:
+    """(node, replacement source, description) for each rewritable pattern, outermost only."""
+    rewrites = []
+
+    def visit(node):
+        if isinstance(node, ast.For):
+            try:
+                statements = _LoopRewriter(node, columns, range_index, _names_outside(tree, node)).rewrite()
+                source = "\n".join(ast.unparse(ast.fix_missing_locations(s)) for s in statements)
+                rewrites.append((node, source, f"row loop at line {node.lineno}"))
+                return
+            except _Unsupported:
+                pass
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "apply"
+                and _is_axis_one(node)):
+            try:
+                vector = _rewrite_apply(node, columns)
+            except _Unsupported:
+                vector = None
+            if vector is not None:
+                rewrites.append((node, f"({ast.unparse(ast.fix_missing_locations(vector))})",
+                                 f"apply(axis=1) at line {node.lineno}"))
+                return
+        for child in ast.iter_child_nodes(node):
+            visit(child)
+
+    visit(tree)
+    return rewrites
+
+def _splice(code: str, rewrites: list) -> str:
+    """Replaces the source of each node, keeping the rest of the code (and its comments) as written."""
+    lines = [line.encode("utf-8") for line in code.splitlines(keepends=True)]
+    for node, source, _ in sorted(rewrites, key=lambda r: (r[0].lineno, r[0].col_offset), reverse=True):
+        start, end = node.lineno - 1, node.end_lineno - 1
+        if isinstance(node, ast.stmt):
+            indent = lines[start][:node.col_offset].decode("utf-8")
+            text = "".join(indent + line + "\n" for line in source.splitlines())
+            lines[start:end + 1] = [text.encode("utf-8")]
+        else:
+            head = lines[start][:node.col_offset]
+            tail = lines[end][node.end_col_offset:]
+            lines[start:end + 1] = [head + source.encode("utf-8") + tail]
+    return b"".join(lines).decode("utf-8")
+
+def _same_value(a, b) -> bool:
+    """Result equality tolerant to dtype changes (int vs float, object vs str) and rounding."""
+    try:
+        if isinstance(a, pd.DataFrame) or isinstance(b, pd.DataFrame):
+            pd.testing.assert_frame_equal(a, b, check_dtype=False, check_index_type=False,
+                                          check_column_type=False, check_exact=False)
+            return True
+        if isinstance(a, pd.Series) or isinstance(b, pd.Series):
+            pd.testing.assert_series_equal(a, b, check_dtype=False, check_index_type=False,
+                                           check_names=False, check_exact=False)
+            return True
+        if isinstance(a, go.Figure) and isinstance(b, go.Figure):
+            return _same_value(a.to_dict(), b.to_dict())
+        if isinstance(a, dict) and isinstance(b, dict):
+            return a.keys() == b.keys() and all(_same_value(a[k], b[k]) for k in a)
+        if isinstance(a, (list, tuple, np.ndarray)) and isinstance(b, (list, tuple, np.ndarray)):
+            return len(a) == len(b) and all(_same_value(x, y) for x, y in zip(a, b))
+        if isinstance(a, (int, float, np.number)) and isinstance(b, (int, float, np.number)):
+            return bool(np.isclose(a, b, equal_nan=True))
+        return bool(a == b)
+    except (AssertionError, TypeError, ValueError):
+        return False
+
+_DECISIONS = OrderedDict()  # (code hash, schema) -> OptimizedCode
+_DECISIONS_LOCK = threading.Lock()
+
+def optimize_code(code: str, df: pd.DataFrame, extra_globals: dict = None,
+                  sample_rows: int = SAMPLE_ROWS, runner: Callable = None) -> OptimizedCode:
+    """
+    Rewrites row-wise pandas patterns in generated code (apply with axis=1,
+    iterrows/itertuples/range(len(df)) loops that sum, count, append or set
+    a column) into column operations.
+
+    The rewrite is kept only if it gives the same result as the original on
+    the first `sample_rows` rows and is not slower there; otherwise the
+    original code is returned. Decisions are cached per code and schema.
+
+    Both versions are untrusted code: `runner(code, sample)` runs them and
+    returns an `ExecutionResult` with a profile (default: `execute_code` in
+    this process; pass the isolated pool's runner when isolation is on).
+    """
+    if df is None:
+        return OptimizedCode(code)
+    range_index = isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1
+    schema = tuple((str(col), str(dtype)) for col, dtype in df.dtypes.items())
+    key = (hashlib.sha1(code.encode("utf-8")).hexdigest(), schema, range_index)
+    with _DECISIONS_LOCK:
+        if key in _DECISIONS:
+            _DECISIONS.move_to_end(key)
+            return _DECISIONS[key]
+
+    if runner is None:
+        runner = lambda program, sample: execute_code(program, sample, extra_globals, profile_top=0)
+    decision = _optimize(code, df, runner, sample_rows, range_index)
+    with _DECISIONS_LOCK:
+        _DECISIONS[key] = decision
+        while len(_DECISIONS) > MAX_DECISIONS:
+            _DECISIONS.popitem(last=False)
+    return decision
+
+def _optimize(code: str, df: pd.DataFrame, runner: Callable, sample_rows: int, range_index: bool) -> OptimizedCode:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return OptimizedCode(code)
+    rewrites = _find_rewrites(tree, [str(col) for col in df.columns], range_index)
+    if not rewrites:
+        return OptimizedCode(code)
+
+    candidate = _splice(code, rewrites)
+    descriptions = [description for _, _, description in rewrites]
+    try:
+        ast.parse(candidate)
+    except SyntaxError:
+        print(f"DEBUG: Optimizer produced invalid code for {descriptions}, keeping the original")
+        return OptimizedCode(code)
+
+    # Same sample for both, with the cache off so each one really runs
+    sample = df.head(sample_rows)
+    original = runner(code, sample)
+    if not original.success:
+        # Nothing to compare against: the original error is more useful
+        return OptimizedCode(code)
+    optimized = runner(candidate, sample)
+    if not optimized.success or not _same_value(original.result, optimized.result):
+        print(f"DEBUG: Rewrite of {descriptions} changed the result, keeping the original")
+        return OptimizedCode(code)
+
+    speedup = original.profile["wall_time"] / max(optimized.profile["wall_time"], 1e-6)
+    if speedup < 1.0:
+        print(f"DEBUG: Rewrite of {descriptions} was not faster (x{speedup:.2f}), keeping the original")
+        return OptimizedCode(code)
+    for description in descriptions:
+        print(f"DEBUG: Vectorized {description} (x{speedup:.1f} faster on {len(sample)} rows)")
+    return OptimizedCode(candidate, descriptions, speedup)
+
+# Frame methods that keep rows/columns as they are (column names in their
+# arguments are recorded); dropna/drop_duplicates look at every column unless `subset` is given
+ROW_METHODS = {"sort_values", "nlargest", "nsmallest", "head", "tail", "sample", "reset_index", "set_index",
+               "sort_index", "dropna", "drop_duplicates", "copy"}
+# Plotly Express keywords that never name a column
+PLOT_OPTIONS = {"title", "labels", "template", "height", "width", "nbins", "color_discrete_sequence",
+                "color_discrete_map", "color_continuous_scale", "markers", "barmode", "log_x", "log_y",
+                "histnorm", "orientation", "text_auto", "range_x", "range_y", "category_orders"}
+# Plotly Express keywords that choose the plotted data. Without one of them (`px.line(df)`,
+# `px.scatter_matrix(df, color='a')`, `px.imshow(df)`) the plot takes every column (wide form)
+PLOT_DATA_ARGS = {"x", "y", "z", "dimensions", "values", "names", "path", "ids", "parents", "r", "theta",
+                  "lat", "lon", "locations", "a", "b", "c"}
+
+def _literal_strings(node: ast.AST) -> Optional[List[str]]:
+    """Column names of `'col'` or `['a', 'b']`, else None."""
+    if _const_str(node) is not None:
+        return [node.value]
+    if isinstance(node, (ast.List, ast.Tuple)) and node.elts and all(_const_str(e) is not None for e in node.elts):
+        return [e.value for e in node.elts]
+    return None
+
+def _literals(nodes) -> Optional[List[str]]:
+    """Every string in `nodes` if they only contain literals (numbers, strings, lists, dicts), else None."""
+    found = []
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Constant):
+                if isinstance(child.value, str):
+                    found.append(child.value)
+            elif not isinstance(child, (ast.List, ast.Tuple, ast.Dict, ast.UnaryOp, ast.USub, ast.Load)):
+                return None
+    return found
+
+def _is_row_filter(node: ast.AST) -> bool:
+    """`df[<mask>]` with a mask expression (comparison, &, |, ~, isin(...))."""
+    if isinstance(node, (ast.Compare, ast.BoolOp)):
+        return True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+        return True
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+        return True
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in BOOLEAN_CALLS | {
+        "between", "contains"}
+
+class _ColumnUsage:
+    """Follows each use of a frame up the expression tree until a column is selected."""
+
+    def __init__(self, tree: ast.Module, columns):
+        self.columns = set(columns)
+        self.parents = {}
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+        self.found = set()
+        self.aliases = set()
+
+    def record(self, names):
+        self.found.update(name for name in names if name in self.columns)
+
+    def follow(self, node: ast.AST):
+        """Checks one use of a frame; raises _Unsupported if all columns may be needed."""
+        cur = node
+        while True:
+            parent = self.parents.get(cur)
+            if isinstance(parent, ast.Subscript) and parent.value is cur:
+                cols = _literal_strings(parent.slice)
+                if cols is not None:
+                    self.record(cols)
+                    return
+                if not (_is_row_filter(parent.slice) or isinstance(parent.slice, ast.Slice)):
+                    raise _Unsupported("frame indexed by a variable")
+                cur = parent
+                continue
+
+            if isinstance(parent, ast.Attribute) and parent.value is cur:
+                cur = self._attribute(parent)
+                if cur is None:
+                    return
+                continue
+
+            if isinstance(parent, ast.Call) and cur in parent.args:
+                func = parent.func
+                if _name(func) == "len":
+                    return
+                if isinstance(func, ast.Attribute) and _name(func.value) == "px":
+                    if parent.args[0] is not cur:
+                        raise _Unsupported(f"frame passed to {ast.unparse(func)}")
+                    # Positional arguments after the frame are x, y... (names, values for pie)
+                    positional = parent.args[1:]
+                    keywords = [k.value for k in parent.keywords if k.arg not in PLOT_OPTIONS]
+                    names = _literals(positional + keywords)
+                    if names is None or any(k.arg is None for k in parent.keywords):
+                        raise _Unsupported("plot with computed columns")
+                    if not positional and not any(k.arg in PLOT_DATA_ARGS for k in parent.keywords):
+                        raise _Unsupported("plot of every column (wide form)")
+                    self.record(names)
+                    return
+                if isinstance(func, ast.Attribute) and _name(func.value) == "time_index" and func.attr == "slice":
+                    # time_index.slice(df, ...) returns rows of the frame: keep following
+                    cur = parent
+                    continue
+                if _name(func) in HELPERS and parent.args[0] is cur:
+                    # Analysis helpers only read the columns named in their arguments
+                    names = _literals(parent.args[1:] + [k.value for k in parent.keywords])
+                    if names is None or any(k.arg is None for k in parent.keywords):
+                        raise _Unsupported(f"{func.id} with computed arguments")
+                    self.record(names)
+                    return
+                raise _Unsupported(f"frame passed to {ast.unparse(func)}")
+
+            if (isinstance(parent, ast.Assign) and parent.value is cur and len(parent.targets) == 1
+                    and isinstance(parent.targets[0], ast.Name) and parent.targets[0].id != "result"):
+                # filtered = df[...]: uses of `filtered` are followed too
+                self.aliases.add(parent.targets[0].id)
+                return
+            raise _Unsupported(f"frame used in {type(parent).__name__}")
+
+    def _attribute(self, node: ast.Attribute) -> Optional[ast.AST]:
+        """Next frame-valued node after `frame.attr`, or None once the columns are known."""
+        attr = node.attr
+        parent = self.parents.get(node)
+        if attr in self.columns and not hasattr(pd.DataFrame, attr):
+            self.record([attr])
+            return None
+        if attr == "index":
+            return None
+        if attr == "shape":
+            if isinstance(parent, ast.Subscript) and isinstance(parent.slice, ast.Constant) and parent.slice.value == 0:
+                return None
+            raise _Unsupported("shape")
+        if attr in ("loc", "iloc") and isinstance(parent, ast.Subscript):
+            if isinstance(parent.slice, ast.Tuple):
+                cols = _literal_strings(parent.slice.elts[1]) if attr == "loc" and len(parent.slice.elts) == 2 else None
+                if cols is None:
+                    raise _Unsupported(f"{attr} with computed columns")
+                self.record(cols)
+                return None
+            return parent
+        if not isinstance(parent, ast.Call) or parent.func is not node:
+            raise _Unsupported(f"attribute {attr}")
+
+        names = _literals(parent.args + [k.value for k in parent.keywords])
+        if names is None:
+            raise _Unsupported(f"{attr} with computed arguments")
+        if attr in ROW_METHODS:
+            if attr in ("dropna", "drop_duplicates") and not any(k.arg == "subset" for k in parent.keywords):
+                raise _Unsupported(f"{attr} over every column")
+            self.record(names)
+            return parent
+        if attr == "groupby":
+            self.record(names)
+            after = self.parents.get(parent)
+            if isinstance(after, ast.Subscript) and after.value is parent:
+                cols = _literal_strings(after.slice)
+                if cols is not None:
+                    self.record(cols)
+                    return None
+            if isinstance(after, ast.Attribute) and after.attr in ("size", "ngroups", "groups", "indices"):
+                return None
+            raise _Unsupported("groupby over every column")
+        raise _Unsupported(f"method {attr}")
+
+def extract_referenced_columns(code: str, columns, frames=("df",)) -> Optional[List[str]]:
+    """
+    Columns of the data the code reads: `df['a']`, `df[['a', 'b']]`, `df.a`,
+    `df.loc[..., 'a']`, `df.groupby('a')['b']`, `px.line(df, x='a', y='b')`...
+    Variables assigned from a filtered frame are followed, and so is the
+    chunk argument of `map_chunk` in out-of-core code.
+
+    Returns None when the code may need every column (the whole frame is
+    returned or displayed, columns are chosen by variables, `df.columns`,
+    `describe()`...). Otherwise the columns in frame order, possibly empty.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    usage = _ColumnUsage(tree, [str(col) for col in columns])
+    usage.aliases.update(frames)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef) and node.name == "map_chunk" and node.args.args:
+            usage.aliases.add(node.args.args[0].arg)
+
+    followed = set()
+    try:
+        while usage.aliases - followed:
+            names = usage.aliases - followed
+            followed |= names
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Name) and node.id in names and isinstance(node.ctx, ast.Load):
+                    usage.follow(node)
+    except _Unsupported:
+        return None
+    return [str(col) for col in columns if str(col) in usage.found]
@@ -1,85 +1,874 @@
 import pandas as pd
+import numpy as np
 import io
+import os
 import csv
-from typing import Union
+import codecs
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Union, Tuple, Dict, List, Optional, Iterator
+from .frame_cache import fingerprint, get_frame_cache
 
-def load_csv(file: Union[str, io.BytesIO]) -> pd.DataFrame:
+# Bytes inspected at the start (and end) of a file to sniff its format
+SNIFF_BYTES = 64 * 1024
+SNIFF_TAIL_BYTES = 16 * 1024
+
+# Explicit datetime formats tried on a sample of each text column, in order.
+# 'ISO8601' covers the detection logs, including rows without microseconds.
+# Day-first is tried before month-first (Spanish data).
+DATETIME_FORMATS = [
+    'ISO8601',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d',
+    '%d-%m-%Y %H:%M:%S',
+    '%d-%m-%Y',
+]
+DATETIME_SAMPLE_SIZE = 50
+_DATE_LIKE = re.compile(r'^\s*(\d{4}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}[-/]\d{1,2}[-/]\d{2,4})([ T]\d{1,2}:\d{2}.*)?\s*$')
+
+# Winning format per (source, column name), least recently used first; None
+# means "not a date". The source includes a hash of the header and first row,
+# so another file uploaded with the same name is detected again.
+DATETIME_FORMAT_CACHE_SIZE = 512
+_DATETIME_FORMAT_CACHE = OrderedDict()
+_DATETIME_FORMAT_LOCK = threading.Lock()
+
+# Encoding of the whole file per fingerprint, once a UTF-8 guess from the
+# samples has been checked against every byte (see `_settled_encoding`)
+ENCODING_CACHE_SIZE = 64
+_ENCODING_CACHE = OrderedDict()
+_ENCODING_LOCK = threading.Lock()
+
+# A list literal of plain values such as "[-1]", "[]" or "[0.5, 2]"
+_LIST_LITERAL = re.compile(r'^\s*\[[^\[\]]*\]\s*$')
+LIST_SAMPLE_SIZE = 50
+
+# Rows per chunk in out-of-core mode
+CHUNK_ROWS = 250_000
+
+# Spare rows allocated for appended rows in LIVE mode, as a fraction of the frame
+APPEND_HEADROOM = 0.25
+
+@dataclass
+class CSVDialect:
+    encoding: str
+    sep: str
+    quotechar: str
+    n_cols: int     # Number of header columns
+    headers: List[str] = field(default_factory=list)  # Header names, as written
+
+    def read_csv_kwargs(self) -> dict:
+        return dict(
+            sep=self.sep,
+            quotechar=self.quotechar,
+            encoding=self.encoding,
+            # Strict: a non-UTF-8 byte outside the sampled head/tail raises
+            # UnicodeDecodeError and the file is read again as latin-1
+        )
+
+def load_csv(file: Union[str, io.BytesIO], compact: bool = False, cache: bool = False) -> pd.DataFrame:
     """
     Load a CSV file with robust handling for:
     - Extra trailing commas/columns (misalignment)
     - Encoding detection
     - Date parsing
+    - Optional memory compaction (see `compact_dataframe`); the before/after
+      memory report is stored in `df.attrs["memory_report"]`
+    - The encoding the whole file was read with is stored in `df.attrs["encoding"]`
+    - Optional on-disk cache of the parsed frame for file paths (see `src.frame_cache`)
     """
+    if cache and isinstance(file, str):
+        return _load_csv_cached(file, compact)
+
     try:
-        # 1. Determine Separation & Header Count
-        # We need to peek at the first line to count headers
-        if isinstance(file, str):
-            with open(file, 'r', encoding='latin-1') as f:
-                first_line = f.readline()
-                file_obj = file
-        else:
-            file.seek(0)
-            first_line = file.read().decode('latin-1').splitlines()[0]
+        # 1. Sniff encoding, separator, quoting & header count from a bounded sample
+        dialect = sniff_csv(file)
+        if not isinstance(file, str):
             file.seek(0)
-            file_obj = file
-        
-        # Simple detector for delimiter
-        sep = ';' if ';' in first_line and first_line.count(';') > first_line.count(',') else ','
-        
-        # Count headers
-        headers = first_line.split(sep)
-        n_cols = len(headers)
         
-        # 2. Load with strict column usage
+        # 2. Load with strict column usage, in a single pass
         # usecols=range(n_cols) forces pandas to read only the first N columns, 
         # ignoring any trailing extra delimiters in the data rows.
         # index_col=False forces it NOT to use the first column as index even if counts mismatch.
+        read_kwargs = dict(usecols=range(dialect.n_cols), index_col=False, low_memory=False)
         try:
-           df = pd.read_csv(
-               file_obj, 
-               sep=sep, 
-               encoding='utf-8', 
-               usecols=range(n_cols),
-               index_col=False,
-               low_memory=False
-           )
+            df = pd.read_csv(file, **read_kwargs, **dialect.read_csv_kwargs())
         except UnicodeDecodeError:
-            if hasattr(file_obj, 'seek'): file_obj.seek(0)
-            df = pd.read_csv(
-               file_obj, 
-               sep=sep, 
-               encoding='latin-1', 
-               usecols=range(n_cols),
-               index_col=False,
-               low_memory=False
-           )
-           
+            # Only the head and tail were sampled: the rest is not UTF-8
+            dialect.encoding = 'latin-1'
+            if not isinstance(file, str):
+                file.seek(0)
+            df = pd.read_csv(file, **read_kwargs, **dialect.read_csv_kwargs())
+
         # 3. Post-Process
-        df = _convert_datetimes(df)
+        df = _convert_datetimes(df, _source_key(file))
+        df = _convert_list_columns(df)
+
+        if compact:
+            df, report = compact_dataframe(df)
+            df.attrs["memory_report"] = report
+        df.attrs["encoding"] = dialect.encoding
         
         return df
 
     except Exception as e:
         raise ValueError(f"Failed to load CSV: {str(e)}")
 
-def _convert_datetimes(df: pd.DataFrame) -> pd.DataFrame:
+def iter_csv_chunks(file: Union[str, io.BytesIO], chunksize: int = CHUNK_ROWS,
+                    columns: List[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams a CSV in chunks of `chunksize` rows with the same sniffing and
+    post-processing as `load_csv`, for files that do not fit in memory.
+    With `columns`, only those columns are parsed (all of them if a name is
+    not in the header).
+    """
+    dialect = sniff_csv(file)
+    # Chunks already yielded cannot be parsed again: check the whole file first
+    dialect.encoding = _settled_encoding(file, dialect.encoding)
+    source = _source_key(file)
+
+    usecols = range(dialect.n_cols)
+    if columns is not None:
+        positions = [i for i, name in enumerate(dialect.headers) if name in set(columns)]
+        # Duplicated or renamed headers: fall back to every column
+        if len(positions) == len(set(columns)):
+            # At least one column, so chunks keep their row count
+            usecols = positions or [0]
+
+    reader = pd.read_csv(
+        file,
+        usecols=usecols,
+        index_col=False,
+        chunksize=chunksize,
+        **dialect.read_csv_kwargs()
+    )
+    with reader:
+        for chunk in reader:
+            # Datetime formats are cached per source, so every chunk converts alike
+            chunk = _convert_datetimes(chunk, source)
+            yield _convert_list_columns(chunk)
+
+def _load_csv_cached(path: str, compact: bool) -> pd.DataFrame:
+    """load_csv() through the frame cache, keyed by the file fingerprint."""
+    frame_cache = get_frame_cache()
+    options = f"compact={compact}"
+    key = fingerprint(path, options)
+
+    df = frame_cache.get(key)
+    if df is not None:
+        return df
+
+    df = load_csv(path, compact=compact)
+    # Only store if the file did not change while it was being parsed
+    if fingerprint(path, options) == key:
+        frame_cache.put(key, df)
+    return df
+
+def sniff_csv(file: Union[str, io.BytesIO]) -> CSVDialect:
+    """
+    Decides encoding, separator, quoting and header width by inspecting only
+    the first SNIFF_BYTES (and the last SNIFF_TAIL_BYTES) of the file.
+    """
+    head, tail = _read_sample(file)
+    if not head.strip():
+        raise ValueError("empty file")
+
+    encoding = 'utf-8' if _is_utf8(head) and _is_utf8(tail, from_middle=True) else 'latin-1'
+    lines = head.decode(encoding, errors='replace').splitlines()
+    # The last line of the sample may be cut
+    sample_lines = lines[:-1] if len(lines) > 1 else lines
+    first_line = lines[0]
+
+    try:
+        sniffed = csv.Sniffer().sniff("\n".join(sample_lines[:50]), delimiters=",;\t|")
+        sep, quotechar = sniffed.delimiter, sniffed.quotechar or '"'
+    except csv.Error:
+        sep, quotechar = _detect_separator(first_line), '"'
+
+    # Parse the header properly so quoted separators are not counted
+    headers = next(csv.reader([first_line], delimiter=sep, quotechar=quotechar))
+    return CSVDialect(encoding=encoding, sep=sep, quotechar=quotechar, n_cols=len(headers), headers=headers)
+
+def _read_sample(file: Union[str, io.BytesIO]) -> Tuple[bytes, bytes]:
+    """Reads the bounded head and tail samples of a path or binary file object."""
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            return _read_sample(f)
+
+    file.seek(0)
+    head = file.read(SNIFF_BYTES)
+    tail = b""
+    if len(head) == SNIFF_BYTES:
+        end = file.seek(0, io.SEEK_END)
+        start = max(SNIFF_BYTES, end - SNIFF_TAIL_BYTES)
+        file.seek(start)
+        tail = file.read(end - start)
+    file.seek(0)
+    return head, tail
+
+def _is_utf8(sample: bytes, from_middle: bool = False) -> bool:
+    """UTF-8 check tolerant to multi-byte characters cut at the sample edges."""
+    if from_middle:
+        # Skip continuation bytes of a character that started before the sample
+        skip = 0
+        while skip < min(3, len(sample)) and 0x80 <= sample[skip] <= 0xBF:
+            skip += 1
+        sample = sample[skip:]
+    try:
+        sample.decode('utf-8')
+        return True
+    except UnicodeDecodeError as e:
+        return e.reason == 'unexpected end of data' and e.start >= len(sample) - 3
+
+def _is_utf8_stream(file: Union[str, io.BytesIO], block_size: int = 1024 ** 2) -> bool:
+    """Decodes the whole file as UTF-8 block by block, without keeping it in memory."""
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            return _is_utf8_stream(f, block_size)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    file.seek(0)
+    try:
+        while True:
+            block = file.read(block_size)
+            decoder.decode(block, final=not block)
+            if not block:
+                return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        file.seek(0)
+
+def _settled_encoding(file: Union[str, io.BytesIO], encoding: str) -> str:
+    """
+    Encoding of the whole file from the one sniffed on its samples: a UTF-8
+    guess is checked against every byte, and becomes latin-1 if it fails.
+    For a path the result is kept per file fingerprint, so each version of
+    the file is decoded once however many times it is streamed.
+    """
+    if encoding != 'utf-8':
+        return encoding
+    key = fingerprint(file) if isinstance(file, str) else None
+    if key is not None:
+        with _ENCODING_LOCK:
+            if key in _ENCODING_CACHE:
+                _ENCODING_CACHE.move_to_end(key)
+                return _ENCODING_CACHE[key]
+
+    settled = 'utf-8' if _is_utf8_stream(file) else 'latin-1'
+    if key is not None:
+        with _ENCODING_LOCK:
+            _ENCODING_CACHE[key] = settled
+            if len(_ENCODING_CACHE) > ENCODING_CACHE_SIZE:
+                _ENCODING_CACHE.popitem(last=False)
+    return settled
+
+def _detect_separator(first_line: str) -> str:
+    """Simple detector for delimiter based on the header line (fallback of the sniffer)."""
+    return ';' if ';' in first_line and first_line.count(';') > first_line.count(',') else ','
+
+def _convert_datetimes(df: pd.DataFrame, source: str = None) -> pd.DataFrame:
     """
     Attempts to convert object/string columns to datetime.
+    The format is decided on a small sample (see `_datetime_format`) and the
+    whole column is then converted in one vectorized call with that format.
     """
     for col in df.columns:
         if df[col].dtype == 'object':
-            # Heuristic: Check first non-null value
-            first_valid = df[col].dropna().iloc[0] if not df[col].dropna().empty else None
-            if first_valid and isinstance(first_valid, str):
-                # Check if looks like date
-                # Very naive check: starts with 20xx
-                if first_valid.strip().startswith('20') or '-' in first_valid or '/' in first_valid:
-                    try:
-                        # Attempt conversion
-                        # new behavior: try catch instead of errors='ignore'
-                        new_col = pd.to_datetime(df[col], errors='raise')
-                        df[col] = new_col
-                    except (ValueError, TypeError, pd.errors.ParserError):
-                        # Keep original if conversion fails
-                        pass
+            fmt = _datetime_format(df[col], source)
+            if fmt is None:
+                continue
+            try:
+                df[col] = pd.to_datetime(df[col], format=fmt, errors='raise')
+            except (ValueError, TypeError, pd.errors.ParserError):
+                # Keep original if conversion fails, and re-detect next time
+                with _DATETIME_FORMAT_LOCK:
+                    _DATETIME_FORMAT_CACHE.pop((source, col), None)
     return df
+
+def _datetime_format(series: pd.Series, source: str = None):
+    """
+    Explicit datetime format for a text column, or None if it is not a date.
+    The result is remembered per (source, column name) so reloads and appended
+    rows of the same file skip the detection.
+    """
+    key = (source, series.name)
+    if source is not None:
+        # Sessions load files in their own threads
+        with _DATETIME_FORMAT_LOCK:
+            if key in _DATETIME_FORMAT_CACHE:
+                _DATETIME_FORMAT_CACHE.move_to_end(key)
+                return _DATETIME_FORMAT_CACHE[key]
+
+    fmt = _detect_datetime_format(series)
+    # An all-null column (e.g. the first chunk) decides nothing yet
+    if source is not None and (fmt is not None or series.notna().any()):
+        with _DATETIME_FORMAT_LOCK:
+            _DATETIME_FORMAT_CACHE[key] = fmt
+            if len(_DATETIME_FORMAT_CACHE) > DATETIME_FORMAT_CACHE_SIZE:
+                _DATETIME_FORMAT_CACHE.popitem(last=False)
+    return fmt
+
+def _source_key(file: Union[str, io.BytesIO], head: bytes = None) -> Optional[str]:
+    """
+    Key of `file` in the datetime format cache: its name plus a hash of the
+    header and first row, which appends do not change. None for unnamed buffers.
+    `head` is the start of the file, if already read.
+    """
+    name = file if isinstance(file, str) else getattr(file, 'name', None)
+    if name is None:
+        return None
+    if head is None:
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                head = f.readline() + f.readline()
+        else:
+            file.seek(0)
+            head = file.readline() + file.readline()
+            file.seek(0)
+    end = head.find(b'\n', head.find(b'\n') + 1)
+    first_lines = head if end < 0 else head[:end + 1]
+    return f"{name}:{hashlib.sha1(first_lines).hexdigest()}"
+
+def _detect_datetime_format(series: pd.Series):
+    """Tests a small sample of non-null values against DATETIME_FORMATS."""
+    sample = series.iloc[:DATETIME_SAMPLE_SIZE * 20].dropna().head(DATETIME_SAMPLE_SIZE)
+    if sample.empty:
+        sample = series.dropna().head(DATETIME_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+
+    # Cheap shape check first: rules out ids, list literals, free text...
+    if not all(isinstance(v, str) and _DATE_LIKE.match(v) for v in sample):
+        return None
+
+    for fmt in DATETIME_FORMATS:
+        try:
+            pd.to_datetime(sample, format=fmt, errors='raise')
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+class ListColumn:
+    """
+    Numeric list-literal column ('[-1]', '[]', '[0.5, 2]') stored as a flat
+    float array plus offsets: row i holds values[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray, index: pd.Index, name: str = None):
+        self.values = values
+        self.offsets = offsets
+        self.index = index
+        self.name = name
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def lengths(self) -> pd.Series:
+        return pd.Series(np.diff(self.offsets), index=self.index, name=self.name)
+
+    def is_scalar(self) -> bool:
+        """True if no row has more than one value."""
+        return len(self) == 0 or int(np.diff(self.offsets).max()) <= 1
+
+    def first(self) -> pd.Series:
+        """First value of each row (NaN for empty lists)."""
+        lengths = np.diff(self.offsets)
+        out = np.full(len(self), np.nan)
+        out[lengths > 0] = self.values[self.offsets[:-1][lengths > 0]]
+        return pd.Series(out, index=self.index, name=self.name)
+
+    def reduce(self, how: str = 'sum') -> pd.Series:
+        """Per-row 'sum', 'mean', 'min' or 'max' (NaN for empty lists)."""
+        ufuncs = {'sum': np.add, 'mean': np.add, 'min': np.minimum, 'max': np.maximum}
+        if how not in ufuncs:
+            raise ValueError(f"Unknown reduction: {how}")
+        lengths = np.diff(self.offsets)
+        non_empty = lengths > 0
+        out = np.full(len(self), np.nan)
+        if non_empty.any():
+            # Values of non-empty rows are contiguous, so reduceat segments are exact
+            out[non_empty] = ufuncs[how].reduceat(self.values, self.offsets[:-1][non_empty])
+            if how == 'mean':
+                out[non_empty] /= lengths[non_empty]
+        return pd.Series(out, index=self.index, name=self.name)
+
+    def explode(self) -> pd.Series:
+        """One row per value, indexed by the original row label."""
+        return pd.Series(self.values, index=self.index.repeat(np.diff(self.offsets)), name=self.name)
+
+    def append(self, other: 'ListColumn', index: pd.Index) -> 'ListColumn':
+        """This column followed by the rows of `other`; `index` labels all the rows."""
+        offsets = np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]])
+        return ListColumn(np.concatenate([self.values, other.values]), offsets, index, self.name)
+
+def extract_list_columns(df: pd.DataFrame) -> Dict[str, ListColumn]:
+    """
+    Parses the list-literal columns that hold more than one value per row
+    (single-value ones are already converted to floats by `load_csv`).
+    """
+    list_columns = {}
+    for col in df.columns:
+        if df[col].dtype == 'object' or isinstance(df[col].dtype, pd.CategoricalDtype):
+            parsed = _parse_list_literals(df[col])
+            if parsed is not None:
+                list_columns[col] = parsed
+    return list_columns
+
+def extend_list_columns(list_columns: Dict[str, ListColumn], df: pd.DataFrame,
+                        delta: pd.DataFrame) -> Dict[str, ListColumn]:
+    """
+    List columns of `df` from those of the frame it extends (`df` minus the
+    appended `delta` rows): only the new rows are parsed. Columns whose new
+    rows are not list literals are dropped, as a full parse would.
+    """
+    if delta.empty:
+        return {col: ListColumn(parsed.values, parsed.offsets, df.index, parsed.name)
+                for col, parsed in list_columns.items()}
+    previous = len(df) - len(delta)
+    extended = {}
+    for col in df.columns:
+        if not (df[col].dtype == 'object' or isinstance(df[col].dtype, pd.CategoricalDtype)):
+            continue
+        if col in list_columns:
+            parsed = _parse_list_literals(delta[col], sniff=False)
+            if parsed is not None:
+                extended[col] = list_columns[col].append(parsed, df.index)
+        elif previous < LIST_SAMPLE_SIZE * 20:
+            # The new rows are part of the sample that decides if it is a list column
+            parsed = _parse_list_literals(df[col])
+            if parsed is not None:
+                extended[col] = parsed
+    return extended
+
+def _convert_list_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts list-literal columns with at most one value per row to floats."""
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            parsed = _parse_list_literals(df[col])
+            if parsed is not None and parsed.is_scalar():
+                df[col] = parsed.first()
+    return df
+
+def _parse_list_literals(series: pd.Series, sniff: bool = True) -> Optional[ListColumn]:
+    """
+    Parses a column of numeric list literals, or returns None if it is not one.
+    Only distinct values are parsed in Python; rows are then gathered with NumPy.
+    `sniff=False` skips the sample check, for rows of a known list column.
+    """
+    if sniff:
+        sample = series.iloc[:LIST_SAMPLE_SIZE * 20].dropna().head(LIST_SAMPLE_SIZE)
+        if sample.empty or not all(isinstance(v, str) and _LIST_LITERAL.match(v) for v in sample):
+            return None
+
+    codes, uniques = pd.factorize(series)
+    parsed = []
+    for text in uniques:
+        if not isinstance(text, str) or not _LIST_LITERAL.match(text):
+            return None
+        inner = text.strip()[1:-1].strip()
+        try:
+            parsed.append(np.array([float(v) for v in inner.split(',')]) if inner else np.empty(0))
+        except ValueError:
+            return None
+
+    # Extra trailing entry so null rows (code -1) get an empty list
+    unique_lengths = np.array([len(a) for a in parsed] + [0], dtype=np.int64)
+    unique_offsets = np.concatenate([[0], np.cumsum(unique_lengths)])
+    flat_uniques = np.concatenate(parsed + [np.empty(0)])
+
+    lengths = unique_lengths[codes]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    # Position of every output value inside flat_uniques
+    starts = unique_offsets[np.where(codes < 0, len(parsed), codes)]
+    positions = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, lengths)
+    return ListColumn(flat_uniques[positions], offsets, series.index, series.name)
+
+def compact_dataframe(df: pd.DataFrame, category_ratio: float = 0.5, float_tolerance: float = 1e-6,
+                      sparse_threshold: float = 0.95) -> Tuple[pd.DataFrame, dict]:
+    """
+    Reduces the memory footprint of a loaded DataFrame:
+    - Text columns with few distinct values (<= category_ratio of the non-null
+      values) or mostly null become `category`.
+    - float64 columns become float32 when every value stays within a relative
+      `float_tolerance` (0 means exact). int64 columns are downcast to int32 at
+      most, so generated arithmetic does not overflow small integer types.
+    - Numeric columns with at least `sparse_threshold` nulls are stored sparse.
+
+    Returns the compacted frame and a report with memory before/after (bytes).
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    changes = {}
+
+    for col in df.columns:
+        series = df[col]
+        old_dtype = str(series.dtype)
+        if len(series) == 0:
+            continue
+
+        null_ratio = series.isna().mean()
+
+        if series.dtype == 'object':
+            non_null = len(series) - series.isna().sum()
+            if null_ratio >= sparse_threshold or series.nunique() <= category_ratio * non_null:
+                # Categories cost one small integer code per row (-1 for nulls)
+                df[col] = series.astype('category')
+
+        elif pd.api.types.is_float_dtype(series.dtype) and not isinstance(series.dtype, pd.SparseDtype):
+            target = series
+            values = series.to_numpy()
+            downcast = values.astype(np.float32)
+            if np.array_equal(values, downcast, equal_nan=True) or (
+                float_tolerance > 0 and np.allclose(downcast, values, rtol=float_tolerance, atol=0, equal_nan=True)
+            ):
+                target = series.astype(np.float32)
+            if null_ratio >= sparse_threshold:
+                target = target.astype(pd.SparseDtype(target.dtype, np.nan))
+            df[col] = target
+
+        elif series.dtype == 'int64':
+            if series.min() >= np.iinfo(np.int32).min and series.max() <= np.iinfo(np.int32).max:
+                df[col] = series.astype(np.int32)
+
+        if str(df[col].dtype) != old_dtype:
+            changes[col] = f"{old_dtype} -> {df[col].dtype}"
+
+    after = int(df.memory_usage(deep=True).sum())
+    return df, {"before_bytes": before, "after_bytes": after, "converted": changes}
+
+class IncrementalCSVReader:
+    """
+    Keeps a DataFrame in sync with a CSV file that grows by appending rows
+    (e.g. the live detection logs).
+
+    The first load goes through `load_csv()`. After that, only the bytes
+    appended since the last call are parsed and appended, reusing the
+    header, delimiter and dtypes of the existing frame. Truncation, rotation
+    (new inode or different header) or incompatible dtypes trigger a full reload.
+    Appended rows go to arrays with spare capacity (see `_AppendStore`), so a
+    refresh copies the new rows, not the whole frame.
+    """
+
+    def __init__(self, path: str = None, compact: bool = False, cache: bool = False, name: str = None):
+        self.path = path
+        self.name = name or path  # Identifies the source in the datetime format cache
+        self._source = None   # Its key in that cache (see `_source_key`)
+        self.compact = compact
+        self.cache = cache    # Use the on-disk frame cache for full loads of `path`
+        self.df = None
+        self.header = b""     # Raw header line, used to detect rotation
+        self.offset = 0       # Byte offset right after the last complete line
+        self.size = 0         # Total bytes parsed (may include an unterminated line)
+        self.last_delta = None  # Rows added by the last load/refresh
+        self.last_dropped = 0   # Rows of the previous frame replaced by the last refresh
+        self.last_reset = False # True if the last call did a full reload
+        self._dialect = None
+        self._columns = []
+        self._tail_rows = 0   # Rows parsed from an unterminated last line
+        self._inode = None
+        self._store = None    # Column arrays appended rows are written to
+
+    def load(self) -> pd.DataFrame:
+        """Full (re)load of the local file."""
+        with open(self.path, 'rb') as f:
+            file_stat = os.fstat(f.fileno())
+            self._inode = file_stat.st_ino
+            if not self.cache:
+                return self.load_bytes(f.read(file_stat.st_size))
+
+            frame_cache = get_frame_cache()
+            key = fingerprint(self.path, f"compact={self.compact}", file_stat)
+            cached = frame_cache.get(key)
+            if cached is not None:
+                # Only the head (header, dialect) and the last line (offset) are needed
+                df = self._load_cached(f, file_stat.st_size, cached)
+                if df is not None:
+                    return df
+            f.seek(0)
+            data = f.read(file_stat.st_size)
+
+        df = self.load_bytes(data, parsed=cached)
+        if cached is None and os.stat(self.path).st_mtime_ns == file_stat.st_mtime_ns:
+            frame_cache.put(key, df)
+        return df
+
+    def _load_cached(self, f, size: int, df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """
+        Sets the reader state for a cached frame of the first `size` bytes of `f`
+        without reading the whole file. None if the head has no complete header line.
+        """
+        head = f.read(min(SNIFF_BYTES, size))
+        header_end = head.find(b'\n') + 1
+        if header_end == 0:
+            return None
+
+        # Walk back from the end until the last newline
+        tail_start, tail = size, b""
+        while tail_start > len(head) and b'\n' not in tail:
+            tail_start = max(len(head), tail_start - SNIFF_TAIL_BYTES)
+            f.seek(tail_start)
+            tail = f.read(size - tail_start)
+        if b'\n' not in tail:
+            tail_start, tail = 0, head
+        offset = tail_start + tail.rfind(b'\n') + 1
+
+        # Encoding from the head only: appended bytes that are not UTF-8
+        # switch it to latin-1 in _parse_rows
+        self._set_loaded(df, head, sniff_csv(io.BytesIO(head)), offset, size,
+                         tail_rows=1 if tail[offset - tail_start:].strip() else 0)
+        return df
+
+    def load_bytes(self, data: bytes, parsed: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Full (re)load from the complete file contents.
+        `parsed` is the already-parsed frame for `data` (e.g. from the cache), if known.
+        """
+        header_end = data.find(b'\n') + 1
+        if header_end == 0:
+            raise ValueError("Failed to load CSV: missing header line")
+
+        if parsed is None:
+            buffer = io.BytesIO(data)
+            buffer.name = self.name
+            parsed = load_csv(buffer, compact=self.compact)
+
+        dialect = sniff_csv(io.BytesIO(data))
+        if "encoding" in parsed.attrs:
+            # The encoding load_csv settled on: no second decode of the data
+            dialect.encoding = parsed.attrs["encoding"]
+        else:
+            dialect.encoding = _settled_encoding(io.BytesIO(data), dialect.encoding)
+        offset = data.rfind(b'\n') + 1
+        self._set_loaded(parsed, data, dialect, offset, len(data),
+                         tail_rows=1 if offset < len(data) and data[offset:].strip() else 0)
+        return parsed
+
+    def _set_loaded(self, df: pd.DataFrame, head: bytes, dialect: CSVDialect,
+                    offset: int, size: int, tail_rows: int):
+        """Reader state after a full load; `head` is the start of the file."""
+        self.header = head[:head.find(b'\n') + 1]
+        self._source = _source_key(self.name, head) if self.name else None
+        self._dialect = dialect
+        self._columns = list(df.columns)
+        self.offset = offset
+        self.size = size
+        self._tail_rows = tail_rows
+
+        self.df = df
+        self._store = None
+        self.last_delta = df
+        self.last_dropped = 0
+        self.last_reset = True
+
+    def refresh(self) -> pd.DataFrame:
+        """Parses only what was appended to the local file since the last call."""
+        if self.df is None:
+            return self.load()
+
+        file_stat = os.stat(self.path)
+        if file_stat.st_ino != self._inode or file_stat.st_size < self.size:
+            # Rotated or truncated
+            return self.load()
+
+        if file_stat.st_size <= self.offset or file_stat.st_size == self.size:
+            return self._no_changes()
+
+        with open(self.path, 'rb') as f:
+            if f.read(len(self.header)) != self.header:
+                return self.load()
+            f.seek(self.offset)
+            data = f.read(file_stat.st_size - self.offset)
+
+        return self.append_bytes(data)
+
+    def append_bytes(self, data: bytes) -> pd.DataFrame:
+        """
+        Appends the bytes found from `self.offset` to the end of the file.
+        An unterminated last line is treated as a row still being written
+        and is left for the next call.
+        """
+        if self.df is None:
+            raise ValueError("append_bytes() called before the initial load")
+
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return self._no_changes()
+
+        delta = self._parse_rows(data[:end])
+        if delta is None:
+            # Dtypes diverged from the current frame: rebuild from scratch
+            if self.path:
+                return self.load()
+            raise ValueError("Appended rows do not match the loaded schema, a full reload is required")
+
+        if self._store is None:
+            # First append after a full load: copy the frame once into arrays with
+            # spare rows. The unterminated line of that load is included again in `data`
+            base = self.df.iloc[:len(self.df) - self._tail_rows] if self._tail_rows else self.df
+            self._store = _AppendStore(base)
+        self.last_dropped = self._tail_rows
+        self._tail_rows = 0
+        self.offset += end
+        self.size = self.offset
+
+        delta = _extend_categories(self.df, delta)
+        self.df = self._store.append(delta)
+        self.last_delta = delta
+        self.last_reset = False
+        return self.df
+
+    def _no_changes(self) -> pd.DataFrame:
+        self.last_delta = self.df.iloc[0:0]
+        self.last_dropped = 0
+        self.last_reset = False
+        return self.df
+
+    def _parse_rows(self, data: bytes):
+        """
+        Parses header-less rows with the state of the initial load.
+        Returns None when the result cannot be concatenated without changing dtypes.
+        """
+        # Text columns are read as raw strings so values match a full parse
+        text_cols = {
+            c: str for c in self._columns
+            if self.df[c].dtype == 'object' or isinstance(self.df[c].dtype, pd.CategoricalDtype)
+        }
+        read_kwargs = dict(header=None, names=self._columns, usecols=range(len(self._columns)),
+                           index_col=False, dtype=text_cols, low_memory=False)
+        try:
+            delta = pd.read_csv(io.BytesIO(data), **read_kwargs, **self._dialect.read_csv_kwargs())
+        except UnicodeDecodeError:
+            # Appended bytes are not UTF-8: this and later appends are latin-1
+            self._dialect.encoding = 'latin-1'
+            delta = pd.read_csv(io.BytesIO(data), **read_kwargs, **self._dialect.read_csv_kwargs())
+
+        for col in self._columns:
+            base_dtype = self.df[col].dtype
+            if pd.api.types.is_datetime64_any_dtype(base_dtype):
+                fmt = _datetime_format(delta[col], self._source) or 'ISO8601'
+                converted = pd.to_datetime(delta[col], format=fmt, errors='coerce')
+                if converted.isna().sum() > delta[col].isna().sum():
+                    return None
+                delta[col] = converted
+            elif pd.api.types.is_numeric_dtype(base_dtype):
+                if delta[col].dtype == 'object':
+                    # Single-value list literal columns ('[-1]') were loaded as floats
+                    parsed = _parse_list_literals(delta[col])
+                    if parsed is not None and parsed.is_scalar():
+                        delta[col] = parsed.first()
+                if not pd.api.types.is_numeric_dtype(delta[col]):
+                    return None
+                if base_dtype == delta[col].dtype:
+                    continue
+                # Keep compacted float32/sparse/int32 columns compact
+                if isinstance(base_dtype, pd.SparseDtype) or pd.api.types.is_float_dtype(base_dtype):
+                    delta[col] = delta[col].astype(base_dtype)
+                elif pd.api.types.is_integer_dtype(base_dtype) and pd.api.types.is_integer_dtype(delta[col].dtype):
+                    limits = np.iinfo(base_dtype)
+                    if delta.empty or (delta[col].min() >= limits.min and delta[col].max() <= limits.max):
+                        delta[col] = delta[col].astype(base_dtype)
+
+        return delta
+
+def _extend_categories(base: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """
+    Gives categorical columns of `delta` the categories of `base` followed by
+    its new values, so the existing codes stay valid.
+    """
+    for col in base.columns:
+        dtype = base[col].dtype
+        if not isinstance(dtype, pd.CategoricalDtype):
+            continue
+        new_values = pd.Index(delta[col].dropna().unique()).difference(dtype.categories)
+        if len(new_values):
+            dtype = pd.CategoricalDtype(dtype.categories.append(new_values), ordered=dtype.ordered)
+        delta[col] = delta[col].astype(dtype)
+    return delta
+
+class _AppendStore:
+    """
+    Columns of an IncrementalCSVReader frame with spare capacity at the end,
+    so appending k rows copies k rows (arrays grow by APPEND_HEADROOM when
+    full). Frames handed out view the first `rows` entries, which later
+    appends never write to. NumPy columns and categorical codes are stored
+    this way; sparse and other extension columns are concatenated.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.columns = list(df.columns)
+        self.rows = len(df)
+        self.arrays = {}  # column -> over-allocated values (codes for categoricals)
+        self.dtypes = {}  # column -> dtype of the frame column
+        self.others = {}  # column -> Series, for columns not held in an array
+        for col in self.columns:
+            self._seed(col, df[col])
+
+    def _seed(self, col, series: pd.Series):
+        values = _store_values(series)
+        self.arrays.pop(col, None)
+        self.others.pop(col, None)
+        if values is None:
+            self.others[col] = series.reset_index(drop=True)
+            return
+        array = np.empty(_capacity(len(values)), dtype=values.dtype)
+        array[:len(values)] = values
+        self.arrays[col] = array
+        self.dtypes[col] = series.dtype
+
+    def append(self, delta: pd.DataFrame) -> pd.DataFrame:
+        total = self.rows + len(delta)
+        for col in self.columns:
+            series = delta[col]
+            array = self.arrays.get(col)
+            if array is None or not _extends(self.dtypes[col], series.dtype):
+                # Not held in an array, or the dtypes diverged: same result as a concat
+                self._seed(col, pd.concat([self.column(col), series], ignore_index=True))
+                continue
+            values = _store_values(series)
+            if len(array) < total or not np.can_cast(values.dtype, array.dtype, 'safe'):
+                grown = np.empty(_capacity(total), dtype=np.result_type(array.dtype, values.dtype))
+                grown[:self.rows] = array[:self.rows]
+                self.arrays[col] = array = grown
+            array[self.rows:total] = values
+            self.dtypes[col] = series.dtype
+        self.rows = total
+        return pd.DataFrame({col: self.column(col) for col in self.columns}, columns=self.columns, copy=False)
+
+    def column(self, col):
+        if col not in self.arrays:
+            return self.others[col]
+        values, dtype = self.arrays[col][:self.rows], self.dtypes[col]
+        if isinstance(dtype, pd.CategoricalDtype):
+            return pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        return values
+
+def _capacity(rows: int) -> int:
+    return rows + max(int(rows * APPEND_HEADROOM), 1024)
+
+def _store_values(series: pd.Series) -> Optional[np.ndarray]:
+    """The values kept in an _AppendStore array (codes for categoricals), or None."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy()
+    if isinstance(series.dtype, np.dtype):
+        return series.to_numpy()
+    return None
+
+def _extends(stored, dtype) -> bool:
+    """True if values of `dtype` can be written after values of `stored` (same or more categories)."""
+    if not isinstance(stored, pd.CategoricalDtype) or not isinstance(dtype, pd.CategoricalDtype):
+        return stored == dtype
+    old = stored.categories
+    return (dtype.ordered == stored.ordered and len(dtype.categories) >= len(old)
+            and dtype.categories[:len(old)].equals(old))
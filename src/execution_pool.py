@@ -0,0 +1,420 @@
+import os
+import queue
+import pickle
+import time
+import atexit
+import threading
+import traceback
+import multiprocessing as mp
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from src.code_executor import ExecutionResult, cached_result, store_result
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+# Pool size, per-run wall-clock limit and per-run memory budget
+POOL_SIZE = int(os.getenv("EXEC_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXEC_TIMEOUT = float(os.getenv("EXEC_TIMEOUT", "30"))
+MEMORY_LIMIT = int(os.getenv("EXEC_MEMORY_LIMIT_MB", "4096")) * 1024 ** 2
+# Frames kept published in shared memory (one per data version in use)
+MAX_PUBLISHED_FRAMES = 4
+
+SHM_DIR = "/dev/shm"
+# Worker reply asking for the frame metadata again
+NEED_FRAME = "need_frame"
+# Seconds between checks of a run's `cancel` event while waiting for it
+CANCEL_POLL = 0.05
+# _roundtrip() result of a run stopped through its `cancel` event
+CANCELLED = "cancelled"
+
+class SharedFrame:
+    """
+    A DataFrame copied once into shared memory blocks: numeric, datetime,
+    categorical codes and sparse values are mapped by the workers without
+    pickling. Text columns are the exception and travel pickled in the metadata.
+
+    `frame_globals` are objects derived from the frame (list columns, time
+    index) published with it: their numpy arrays go to shared memory as
+    out-of-band pickle buffers, the rest is pickled once in the metadata.
+    """
+
+    def __init__(self, df: pd.DataFrame, frame_globals: dict = None):
+        self.blocks = []
+        self.meta = {"columns": [_share_column(self, df[col]) for col in df.columns]}
+        if isinstance(df.index, pd.RangeIndex):
+            self.meta["index"] = ("range", df.index.start, df.index.stop, df.index.step)
+        else:
+            self.meta["index"] = ("pickled", pickle.dumps(df.index))
+        if frame_globals:
+            buffers = []
+            data = pickle.dumps(frame_globals, protocol=5, buffer_callback=buffers.append)
+            self.meta["globals"] = {
+                "pickled": data,
+                "buffers": [self.share(np.frombuffer(buffer.raw(), dtype=np.uint8)) for buffer in buffers],
+            }
+
+    def share(self, values: np.ndarray) -> dict:
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        self.blocks.append(block)
+        return {"shm": block.name, "dtype": values.dtype.str, "count": len(values)}
+
+    def release(self):
+        for block in self.blocks:
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocks = []
+
+def _share_column(frame: SharedFrame, series: pd.Series) -> dict:
+    dtype = series.dtype
+    info = {"name": series.name}
+    if isinstance(dtype, pd.CategoricalDtype):
+        info.update(kind="category", codes=frame.share(series.cat.codes.to_numpy()),
+                    categories=pickle.dumps(dtype.categories), ordered=bool(dtype.ordered))
+    elif isinstance(dtype, pd.SparseDtype) and dtype.subtype.kind in "biufc":
+        values = series.array
+        info.update(kind="sparse", values=frame.share(values.sp_values),
+                    indices=frame.share(values.sp_index.indices), length=len(values),
+                    fill_value=values.fill_value)
+    elif isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        info.update(kind="numpy", values=frame.share(series.to_numpy()))
+    else:
+        # Text and other Python objects cannot live in a flat buffer
+        info.update(kind="pickled", values=pickle.dumps(series.array))
+    return info
+
+def _attach_array(block: dict, handles: list) -> np.ndarray:
+    dtype = np.dtype(block["dtype"])
+    if block["count"] == 0:
+        return np.empty(0, dtype=dtype)
+    path = os.path.join(SHM_DIR, block["shm"])
+    if os.path.exists(path):
+        # Private copy-on-write mapping: generated code may modify its frame
+        # without touching the shared copy, and no resource tracker is involved
+        return np.memmap(path, dtype=dtype, mode="c", shape=(block["count"],))
+
+    shm = shared_memory.SharedMemory(name=block["shm"])
+    try:
+        # Only the parent owns (and unlinks) the block
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    handles.append(shm)
+    values = np.ndarray((block["count"],), dtype=dtype, buffer=shm.buf)
+    values.flags.writeable = False
+    return values
+
+def attach_frame(meta: dict):
+    """
+    Rebuilds a shared DataFrame in a worker.
+    Returns (df, frame globals, shared memory handles to keep open).
+    """
+    handles = []
+    data = {}
+    for info in meta["columns"]:
+        kind = info["kind"]
+        if kind == "numpy":
+            data[info["name"]] = _attach_array(info["values"], handles)
+        elif kind == "category":
+            codes = _attach_array(info["codes"], handles)
+            dtype = pd.CategoricalDtype(pickle.loads(info["categories"]), ordered=info["ordered"])
+            data[info["name"]] = pd.Categorical.from_codes(codes, dtype=dtype)
+        elif kind == "sparse":
+            values = _attach_array(info["values"], handles)
+            indices = _attach_array(info["indices"], handles)
+            # No public constructor takes the stored positions: scatter into a
+            # dense column, which SparseArray compresses again
+            dense = np.full(info["length"], info["fill_value"], dtype=values.dtype)
+            dense[indices] = values
+            data[info["name"]] = pd.arrays.SparseArray(dense, fill_value=info["fill_value"], kind="integer")
+        else:
+            data[info["name"]] = pickle.loads(info["values"])
+
+    kind, *args = meta["index"]
+    index = pd.RangeIndex(*args) if kind == "range" else pickle.loads(args[0])
+    # copy=False keeps the mapped arrays instead of consolidating them
+    df = pd.DataFrame(data, columns=[info["name"] for info in meta["columns"]], copy=False)
+    df.index = index
+
+    frame_globals = {}
+    if "globals" in meta:
+        buffers = [_attach_array(block, handles) for block in meta["globals"]["buffers"]]
+        frame_globals = pickle.loads(meta["globals"]["pickled"], buffers=buffers)
+    return df, frame_globals, handles
+
+def _current_vm() -> int:
+    """Virtual memory size of this process, or 0 if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def _limit_memory(budget: int):
+    """Lets the process allocate `budget` more bytes; beyond that allocations raise MemoryError."""
+    if resource is None or not budget:
+        return
+    current = _current_vm()
+    if not current:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    soft = current + budget
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+def _worker_main(conn, memory_limit: int):
+    """Worker loop: attach the requested frame (cached per key), run the code, send the result."""
+    from src.code_executor import execute_code, execute_chunked
+    from src.csv_loader import iter_csv_chunks
+
+    frames = OrderedDict()  # key -> (df, frame globals, handles)
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+
+        try:
+            # Lift the previous run's limit before mapping new data
+            if resource is not None and memory_limit:
+                _, hard = resource.getrlimit(resource.RLIMIT_AS)
+                resource.setrlimit(resource.RLIMIT_AS, (hard, hard))
+
+            if task.get("chunked_path"):
+                _limit_memory(memory_limit)
+                chunks = iter_csv_chunks(task["chunked_path"], columns=task["columns"])
+                result = execute_chunked(task["code"], chunks, task["extra_globals"], profile_top=task["profile_top"])
+            else:
+                key = task["frame_key"]
+                if key not in frames and task["frame_meta"] is None:
+                    # Evicted here but the parent assumed it was still mapped
+                    conn.send(NEED_FRAME)
+                    continue
+                if key not in frames:
+                    frames[key] = attach_frame(task["frame_meta"])
+                    while len(frames) > MAX_PUBLISHED_FRAMES:
+                        _, (_, _, handles) = frames.popitem(last=False)
+                        for shm in handles:
+                            shm.close()
+                frames.move_to_end(key)
+                _limit_memory(memory_limit)
+                # Copy-on-write view: changes do not leak into the next run
+                frame, frame_globals, _ = frames[key]
+                if task["columns"] is not None:
+                    frame = frame[task["columns"]]
+                run_globals = dict(frame_globals, **(task["extra_globals"] or {}))
+                result = execute_code(task["code"], frame, run_globals, profile_top=task["profile_top"])
+        except BaseException:
+            result = ExecutionResult(success=False, result=None, error=traceback.format_exc())
+
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send(ExecutionResult(success=False, result=None,
+                                      error=f"The result could not be sent back from the worker: {e}"))
+
+class _Worker:
+    def __init__(self, ctx, memory_limit: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.frames = set()  # Frame keys already sent to this worker
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        finally:
+            self.conn.close()
+
+class ExecutionPool:
+    """
+    Warm worker processes running generated code outside the Streamlit
+    process. Frames are published once in shared memory per data version.
+    A run that exceeds `timeout` seconds gets its worker killed and
+    replaced. A run that allocates more than `memory_limit` bytes gets a
+    MemoryError. On Windows there is no per-run memory limit.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = EXEC_TIMEOUT, memory_limit: int = MEMORY_LIMIT):
+        # spawn: forking the multi-threaded Streamlit process is unsafe
+        self._ctx = mp.get_context("spawn")
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._idle = queue.Queue()
+        self._frames = OrderedDict()  # key -> SharedFrame
+        self._frames_lock = threading.Lock()  # Also guards `stats`: sessions run code from their own threads
+        self.stats = {"runs": 0, "timeouts": 0, "crashes": 0, "recycled": 0, "cancelled": 0}
+        for _ in range(size):
+            self._idle.put(_Worker(self._ctx, memory_limit))
+
+    def publish(self, key: str, df: pd.DataFrame, frame_globals: dict = None) -> SharedFrame:
+        """Copies `df` (and its `frame_globals`) into shared memory once per `key` (e.g. a data version)."""
+        with self._frames_lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                frame = SharedFrame(df, frame_globals)
+                self._frames[key] = frame
+                while len(self._frames) > MAX_PUBLISHED_FRAMES:
+                    # Workers keep their mappings; the name is just removed
+                    _, old = self._frames.popitem(last=False)
+                    old.release()
+            self._frames.move_to_end(key)
+            return frame
+
+    def execute(self, code: str, df: pd.DataFrame = None, frame_key: str = None, extra_globals: dict = None,
+                chunked_path: str = None, profile_top: int = 0, columns: list = None,
+                cache: bool = True, frame_globals: dict = None,
+                cancel: threading.Event = None) -> ExecutionResult:
+        """
+        Runs `code` in a worker, against `df` (published under `frame_key`) or
+        chunk by chunk over `chunked_path`, optionally on some `columns` only.
+        Same result shape as `execute_code`. `frame_globals` are derived from
+        the frame (list columns, time index) and published with it once per
+        `frame_key`; `extra_globals` are sent with every run.
+        An explicit `frame_key` is a data version: results are cached under it
+        unless `cache` is False (e.g. runs that must be timed).
+        Setting `cancel` stops the run: its worker is killed and replaced.
+        """
+        if frame_key is not None and cache:
+            cached = cached_result(code, frame_key)
+            if cached is not None:
+                return cached
+            result = self._execute(code, df, frame_key, extra_globals, chunked_path, profile_top, columns,
+                                   frame_globals, cancel)
+            store_result(code, frame_key, result)
+            return result
+        return self._execute(code, df, frame_key, extra_globals, chunked_path, profile_top, columns,
+                             frame_globals, cancel)
+
+    def _execute(self, code: str, df: pd.DataFrame, frame_key: str, extra_globals: dict,
+                 chunked_path: str, profile_top: int, columns: list, frame_globals: dict,
+                 cancel: threading.Event = None) -> ExecutionResult:
+        task = {"code": code, "extra_globals": extra_globals, "chunked_path": chunked_path,
+                "profile_top": profile_top, "columns": columns}
+        if chunked_path is None:
+            frame_key = frame_key or str(id(df))
+            task["frame_key"] = frame_key
+            task["frame_meta"] = self.publish(frame_key, df, frame_globals).meta
+        elif frame_globals:
+            # No frame to publish them with
+            task["extra_globals"] = dict(frame_globals, **(extra_globals or {}))
+
+        worker = self._wait_idle(cancel)
+        if worker is None:
+            if cancel is not None and cancel.is_set():
+                return _cancelled_result()
+            return ExecutionResult(success=False, result=None,
+                                   error="RuntimeError: All execution workers are busy, try again later.")
+
+        with self._frames_lock:
+            self.stats["runs"] += 1
+        try:
+            if chunked_path is None and frame_key in worker.frames:
+                # The worker already mapped this frame: skip sending the metadata again
+                result = self._roundtrip(worker, dict(task, frame_meta=None), cancel)
+                if result == NEED_FRAME:
+                    result = self._roundtrip(worker, task, cancel)
+            else:
+                result = self._roundtrip(worker, task, cancel)
+            if result == CANCELLED:
+                with self._frames_lock:
+                    self.stats["cancelled"] += 1
+                self._replace(worker)
+                worker = None
+                return _cancelled_result()
+            if result is None:
+                with self._frames_lock:
+                    self.stats["timeouts"] += 1
+                print(f"DEBUG: Execution exceeded {self.timeout}s, killing worker {worker.process.pid}")
+                self._replace(worker)
+                worker = None
+                return ExecutionResult(success=False, result=None,
+                                       error=f"TimeoutError: La ejecución superó el límite de {self.timeout:.0f}s.")
+            if chunked_path is None:
+                worker.frames.add(frame_key)
+            return result
+        except (EOFError, OSError):
+            with self._frames_lock:
+                self.stats["crashes"] += 1
+            print("DEBUG: Execution worker died, replacing it")
+            self._replace(worker)
+            worker = None
+            return ExecutionResult(success=False, result=None,
+                                   error="MemoryError: El proceso de ejecución terminó inesperadamente (¿memoria agotada?).")
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+
+    def _wait_idle(self, cancel: threading.Event = None):
+        """An idle worker, or None if none got free within the timeout or `cancel` was set."""
+        deadline = time.monotonic() + self.timeout
+        while cancel is None or not cancel.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                return self._idle.get(timeout=remaining if cancel is None else min(remaining, CANCEL_POLL))
+            except queue.Empty:
+                continue
+        return None
+
+    def _roundtrip(self, worker: _Worker, task: dict, cancel: threading.Event = None):
+        """Sends one task and waits for its reply; None if it timed out, CANCELLED if `cancel` was set."""
+        worker.conn.send(task)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if worker.conn.poll(remaining if cancel is None else min(remaining, CANCEL_POLL)):
+                return worker.conn.recv()
+            if cancel is not None and cancel.is_set():
+                return CANCELLED
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        with self._frames_lock:
+            self.stats["recycled"] += 1
+        self._idle.put(_Worker(self._ctx, self.memory_limit))
+
+    def close(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.kill()
+        with self._frames_lock:
+            for frame in self._frames.values():
+                frame.release()
+            self._frames.clear()
+
+def _cancelled_result() -> ExecutionResult:
+    return ExecutionResult(success=False, result=None, error="CancelledError: La ejecución fue cancelada.")
+
+_DEFAULT_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_execution_pool() -> ExecutionPool:
+    """Process-wide pool shared by every session (started on first use)."""
+    global _DEFAULT_POOL
+    with _POOL_LOCK:
+        if _DEFAULT_POOL is None:
+            _DEFAULT_POOL = ExecutionPool()
+            atexit.register(_DEFAULT_POOL.close)
+    return _DEFAULT_POOL
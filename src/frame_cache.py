@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+
+# One sub-directory per parsed file, bounded by total size on disk
+CACHE_DIR = os.getenv("CSV_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "csv_data_agent"))
+MAX_CACHE_BYTES = int(os.getenv("CSV_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Bytes hashed from the start and the end of the file for the fingerprint
+HASH_BYTES = 64 * 1024
+# Bump when the on-disk layout or the parsing logic changes
+FORMAT_VERSION = 2
+
+def fingerprint(path: str, options: str = "", file_stat: os.stat_result = None) -> str:
+    """
+    Cache key for a CSV file: absolute path, size, mtime, a hash of its first
+    and last bytes, and the load options that change the parsed frame.
+    """
+    file_stat = file_stat or os.stat(path)
+    digest = hashlib.sha1()
+    digest.update(f"v{FORMAT_VERSION}|{os.path.abspath(path)}|{file_stat.st_size}|{file_stat.st_mtime_ns}|{options}".encode())
+
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(HASH_BYTES, file_stat.st_size)))
+        if file_stat.st_size > HASH_BYTES:
+            tail_start = max(HASH_BYTES, file_stat.st_size - HASH_BYTES)
+            f.seek(tail_start)
+            digest.update(f.read(file_stat.st_size - tail_start))
+
+    return digest.hexdigest()
+
+class FrameCache:
+    """
+    Directory of already-parsed DataFrames, one sub-directory per key with a
+    `.npy` file per column. Numeric, datetime and categorical codes are
+    memory-mapped on load, so a warm load does not parse any text.
+    Least recently used entries are evicted when the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str, columns: List[str] = None) -> Optional[pd.DataFrame]:
+        """Returns the cached frame (optionally only some columns), or None."""
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+
+            wanted = meta["columns"]
+            if columns is not None:
+                wanted = [c for c in wanted if c["name"] in set(columns)]
+
+            data = {c["name"]: _load_column(entry_dir, c, meta["rows"]) for c in wanted}
+            # copy=False keeps the memory-mapped arrays instead of consolidating them
+            df = pd.DataFrame(data, columns=[c["name"] for c in wanted], copy=False)
+            df.attrs.update(meta.get("attrs", {}))
+
+            # Mark as recently used for LRU eviction
+            os.utime(meta_path)
+            self.hits += 1
+            return df
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+    def put(self, key: str, df: pd.DataFrame):
+        """
+        Stores a parsed frame. If it cannot be written (disk full, a column type
+        that cannot be saved) the next load just parses the CSV again.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+        try:
+            columns = [_save_column(tmp_dir, i, df[col]) for i, col in enumerate(df.columns)]
+            meta = {
+                "rows": len(df),
+                "columns": columns,
+                "attrs": _json_safe(df.attrs),
+                "bytes": _dir_size(tmp_dir),
+                "created": time.time()
+            }
+            with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+            # Atomic publish so concurrent sessions never see half-written entries
+            os.replace(tmp_dir, self._entry_dir(key))
+        except Exception:
+            # Another session published the same key first, disk full, unsupported column...
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        # Also retries entries that could not be deleted before
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in `max_bytes`.
+        Entries whose files cannot be deleted yet (memory-mapped by a live frame
+        on Windows) lose their `meta.json`, so they are no longer served, and
+        are retried on every later eviction; their size still counts.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(".tmp-"):
+                continue
+            entry_dir = self._entry_dir(name)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    size = json.load(f).get("bytes", 0)
+                entries.append((os.path.getmtime(meta_path), size, name))
+                total += size
+            except (OSError, ValueError):
+                # Left over by an earlier eviction (or corrupt)
+                if os.path.isdir(entry_dir) and not _remove_entry(entry_dir):
+                    total += _dir_size(entry_dir)
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove_entry(self._entry_dir(name))
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+def _save_column(entry_dir: str, index: int, series: pd.Series) -> dict:
+    """Writes one column and returns its metadata."""
+    base = os.path.join(entry_dir, str(index))
+    info = {"name": series.name, "dtype": str(series.dtype)}
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        info["kind"] = "category"
+        info["ordered"] = bool(dtype.ordered)
+        np.save(base + ".codes.npy", series.cat.codes.to_numpy())
+        np.save(base + ".categories.npy", dtype.categories.to_numpy(), allow_pickle=True)
+    elif isinstance(dtype, pd.SparseDtype):
+        info["kind"] = "sparse"
+        info["subtype"] = str(dtype.subtype)
+        values = series.array
+        np.save(base + ".values.npy", values.sp_values)
+        np.save(base + ".index.npy", values.sp_index.indices)
+    elif isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        info["kind"] = "numpy"
+        np.save(base + ".npy", series.to_numpy())
+    else:
+        # Text and other Python objects: pickled, cannot be memory-mapped
+        info["kind"] = "object"
+        np.save(base + ".npy", series.to_numpy(dtype=object), allow_pickle=True)
+
+    info["index"] = index
+    return info
+
+def _load_column(entry_dir: str, info: dict, rows: int):
+    base = os.path.join(entry_dir, str(info["index"]))
+    kind = info["kind"]
+
+    if kind == "numpy":
+        # Copy-on-write mapping: generated code can modify it without touching the file
+        return np.load(base + ".npy", mmap_mode='c')
+    if kind == "category":
+        codes = np.load(base + ".codes.npy", mmap_mode='c')
+        categories = np.load(base + ".categories.npy", allow_pickle=True)
+        dtype = pd.CategoricalDtype(categories, ordered=info["ordered"])
+        return pd.Categorical.from_codes(codes, dtype=dtype)
+    if kind == "sparse":
+        dense = np.full(rows, np.nan, dtype=info["subtype"])
+        dense[np.load(base + ".index.npy")] = np.load(base + ".values.npy")
+        return pd.arrays.SparseArray(dense, fill_value=np.nan)
+    return np.load(base + ".npy", allow_pickle=True)
+
+def _remove_entry(entry_dir: str) -> bool:
+    """Deletes an entry, `meta.json` first so it stops being served. False if files remain."""
+    try:
+        os.remove(os.path.join(entry_dir, "meta.json"))
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    return not os.path.exists(entry_dir)
+
+def _dir_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def _json_safe(attrs: dict) -> dict:
+    """Keeps only the attrs that survive a JSON round trip."""
+    try:
+        return json.loads(json.dumps(attrs))
+    except (TypeError, ValueError):
+        return {}
+
+_DEFAULT_CACHE = None
+
+def get_frame_cache() -> FrameCache:
+    """The frame cache of this server, at CSV_CACHE_DIR."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = FrameCache()
+    return _DEFAULT_CACHE
@@ -0,0 +1,116 @@
+import os
+import time
+import sqlite3
+import hashlib
+from typing import Optional
+from .sqlite_store import SQLiteStore, shared_store
+
+# Responses are reused across restarts for CACHE_TTL seconds
+CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "csv_data_agent_llm.sqlite")
+)
+CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_CACHE_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 ** 2)))
+
+def make_key(model: str, system: str, prompt: str) -> str:
+    """Cache key for a deterministic completion: model, system prompt hash and user prompt."""
+    system_hash = hashlib.sha256((system or "").encode("utf-8")).hexdigest()
+    digest = hashlib.sha256()
+    digest.update(f"{model}\x00{system_hash}\x00".encode("utf-8"))
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+class ResponseCache(SQLiteStore):
+    """
+    SQLite store of LLM responses shared by every session and process.
+    Entries expire after `ttl` seconds and least recently used entries are
+    evicted when the stored responses exceed `max_bytes`.
+    """
+
+    NAME = "LLM cache"
+    TABLE = "responses"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+        "created REAL NOT NULL, last_used REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)",
+    )
+
+    def __init__(self, path: str = CACHE_PATH, ttl: int = CACHE_TTL, max_bytes: int = MAX_CACHE_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        super().__init__(path)
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response, or None if missing or expired."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    # Mark as recently used for LRU eviction
+                    conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str):
+        """Stores a response and evicts expired and excess entries in the same transaction."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, response, len(response.encode("utf-8")), now, now)
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            print(f"DEBUG: Could not store LLM response in cache: {e}")
+
+    def delete(self, key: str):
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process and the current size of the store."""
+        try:
+            with self._connect() as conn:
+                entries, size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+        except sqlite3.Error:
+            entries, size = 0, 0
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+def get_response_cache() -> ResponseCache:
+    """The response cache of this server, at LLM_CACHE_PATH."""
+    return shared_store(ResponseCache)
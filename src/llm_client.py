@@ -1,55 +1,258 @@
 import os
-import time
-from groq import Groq
+import re
+import queue
+import atexit
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Iterator, Optional
+from groq import AsyncGroq
 from dotenv import load_dotenv
+from src.llm_cache import ResponseCache, make_key
+from src.rate_limiter import RateLimiter
+from src.schema_analyzer import estimate_tokens
 
 # Load env vars once
 load_dotenv()
 
-class LLMClient:
-    def __init__(self, api_key: str = None, model: str = "llama-3.3-70b-versatile"):
+# Requests streaming at the same time across all sessions
+MAX_IN_FLIGHT = int(os.getenv("GROQ_MAX_IN_FLIGHT", "4"))
+# Output tokens reserved per request until the real size is known
+EXPECTED_OUTPUT_TOKENS = 512
+MAX_RETRIES = 3
+BASE_DELAY = 2
+# Seconds LLMClient.stream_query waits for the next token (includes rate limit waits)
+TOKEN_TIMEOUT = float(os.getenv("GROQ_TOKEN_TIMEOUT", "180"))
+# AsyncGroq clients kept open, one per API key
+MAX_CLIENTS = 8
+
+# Process-wide event loop running every LLM request, with the shared limiter
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+_LIMITER = RateLimiter()
+_SEMAPHORE = None
+
+def get_llm_loop() -> asyncio.AbstractEventLoop:
+    """Background event loop shared by all sessions (started on first use)."""
+    global _LOOP, _SEMAPHORE
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+            _SEMAPHORE = asyncio.Semaphore(MAX_IN_FLIGHT)
+            _LOOP = loop
+    return _LOOP
+
+def get_rate_limiter() -> RateLimiter:
+    return _LIMITER
+
+# One AsyncGroq (and its HTTP connection pool) per API key, reused by every rerun
+_CLIENTS = OrderedDict()
+_CLIENTS_LOCK = threading.Lock()
+
+def get_groq_client(api_key: str) -> AsyncGroq:
+    """Shared AsyncGroq for `api_key`; the least recently used beyond MAX_CLIENTS is closed."""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(api_key)
+        if client is None:
+            if not _CLIENTS:
+                atexit.register(close_groq_clients)
+            client = _CLIENTS[api_key] = AsyncGroq(api_key=api_key)
+            while len(_CLIENTS) > MAX_CLIENTS:
+                _, old = _CLIENTS.popitem(last=False)
+                asyncio.run_coroutine_threadsafe(old.close(), get_llm_loop())
+        _CLIENTS.move_to_end(api_key)
+        return client
+
+def close_groq_clients(timeout: float = 5.0):
+    """Closes every shared AsyncGroq on the LLM loop (e.g. on shutdown)."""
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    if not clients:
+        return
+
+    async def close_all():
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+    try:
+        asyncio.run_coroutine_threadsafe(close_all(), get_llm_loop()).result(timeout)
+    except Exception as e:
+        print(f"DEBUG: Could not close LLM clients: {e}")
+
+class AsyncLLMClient:
+    """
+    asyncio client for Groq. Every request goes through the process-wide
+    rate limiter and in-flight semaphore, so it must run on `get_llm_loop()`.
+    """
+
+    def __init__(self, api_key: str = None, model: str = "llama-3.3-70b-versatile", cache: ResponseCache = None,
+                 limiter: RateLimiter = None):
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
-        if not self.api_key:
-            # Check if streamlit secrets works (later) or just raise
-            pass
-            
-        self.client = Groq(api_key=self.api_key)
+        # Streamlit builds a client on every rerun: the HTTP client underneath is shared
+        self.client = get_groq_client(self.api_key)
         self.model = model
+        self.cache = cache # Optional persistent response cache
+        self.limiter = limiter or _LIMITER
+
+    async def query(self, prompt: str, system: str = None, temperature: float = 0.0) -> str:
+        return "".join([token async for token in self.stream_query(prompt, system=system, temperature=temperature)])
 
-    def query(self, prompt: str, system: str = None) -> str:
+    async def stream_query(self, prompt: str, system: str = None, temperature: float = 0.0) -> AsyncIterator[str]:
         """
-        Send query to Groq and return response text.
-        Retries on rate limit.
+        Yields the response text as it arrives. The stream is closed as soon
+        as the first code block is complete, so any prose after it is neither
+        generated nor waited for. Only deterministic (temperature 0) answers
+        are cached.
         """
+        cache_key = None
+        if self.cache is not None and temperature == 0:
+            cache_key = make_key(self.model, system, prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print("DEBUG: LLM response served from cache")
+                yield cached
+                return
+
         messages = []
         if system:
             messages.append({"role": "system", "content": system})
-        
+
         messages.append({"role": "user", "content": prompt})
-        
-        # Simple retry logic
-        max_retries = 3
-        base_delay = 2
-        
-        for attempt in range(max_retries):
+
+        get_llm_loop()
+        prompt_tokens = estimate_tokens(system or "") + estimate_tokens(prompt)
+        reserved = prompt_tokens + EXPECTED_OUTPUT_TOKENS
+        content = ""
+        async with _SEMAPHORE:
+            stream = await self._create(messages, reserved, temperature)
             try:
-                chat_completion = self.client.chat.completions.create(
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content or ""
+                    end = _closing_fence_end(content + token)
+                    if end is not None:
+                        # Code block complete: stop generating
+                        token = (content + token)[len(content):end]
+                        content += token
+                        yield token
+                        break
+                    content += token
+                    yield token
+            finally:
+                await stream.close()
+                self.limiter.settle(reserved, prompt_tokens + estimate_tokens(content))
+
+        if cache_key is not None and content:
+            self.cache.put(cache_key, content)
+
+    async def _create(self, messages: list, tokens: int, temperature: float = 0.0):
+        """Opens a streamed completion once the quota allows it, retrying on rate limit."""
+        for attempt in range(MAX_RETRIES):
+            await self.limiter.acquire(tokens)
+            try:
+                return await self.client.chat.completions.create(
                     messages=messages,
                     model=self.model,
-                    temperature=0.0, # Deterministic for code
+                    temperature=temperature, # 0 = deterministic for code
                     max_tokens=4096, # Huge window for code
                     stop=None,
-                    stream=False,
+                    stream=True,
                 )
-                return chat_completion.choices[0].message.content
-            
+
             except Exception as e:
-                # Naive error handling, primarily for rate limits
+                # Primarily for rate limits: every session waits for the server's retry-after
                 if "429" in str(e) or "rate limit" in str(e).lower():
-                    sleep_time = base_delay * (2 ** attempt)
-                    print(f"Rate limit hit, retrying in {sleep_time}s...")
-                    time.sleep(sleep_time)
+                    self.limiter.settle(tokens, 0)
+                    self.limiter.pause(_retry_after(e) or BASE_DELAY * (2 ** attempt))
                 else:
                     raise e
-                    
+
         raise Exception("Max retries exceeded for LLM query")
+
+class LLMClient:
+    """Synchronous wrapper running `AsyncLLMClient` on the shared background loop."""
+
+    def __init__(self, api_key: str = None, model: str = "llama-3.3-70b-versatile", cache: ResponseCache = None):
+        self.async_client = AsyncLLMClient(api_key=api_key, model=model, cache=cache)
+        self.model = model
+        self.cache = cache
+
+    def query(self, prompt: str, system: str = None, temperature: float = 0.0) -> str:
+        """
+        Send query to Groq and return response text.
+        Retries on rate limit. Deterministic answers (temperature 0) are
+        served from the cache when one is configured.
+        """
+        return "".join(self.stream_query(prompt, system=system, temperature=temperature))
+
+    def stream_query(self, prompt: str, system: str = None, temperature: float = 0.0) -> Iterator[str]:
+        """Send query to Groq and yield the response text as it arrives."""
+        tokens = queue.Queue()
+
+        async def pump():
+            try:
+                async for token in self.async_client.stream_query(prompt, system=system, temperature=temperature):
+                    tokens.put(("token", token))
+                tokens.put(("done", None))
+            except BaseException as e:
+                tokens.put(("error", e))
+                raise
+
+        future = asyncio.run_coroutine_threadsafe(pump(), get_llm_loop())
+        try:
+            while True:
+                try:
+                    kind, value = tokens.get(timeout=TOKEN_TIMEOUT)
+                except queue.Empty:
+                    raise TimeoutError(f"No response from the LLM in {TOKEN_TIMEOUT:.0f}s")
+                if kind == "token":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            # Consumer stopped early: close the request on the loop
+            if not future.done():
+                future.cancel()
+
+    def forget(self, prompt: str, system: str = None):
+        """Drops a cached answer (e.g. code that failed to run)."""
+        if self.cache is not None:
+            self.cache.delete(make_key(self.model, system, prompt))
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds requested by the server in the Retry-After header of a 429, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+_FENCE = re.compile(r"```[^\n`]*\n")
+
+def _closing_fence_end(text: str) -> Optional[int]:
+    """Position right after the fence closing the first code block, if it arrived."""
+    opening = _FENCE.search(text)
+    if opening is None:
+        return None
+    closing = text.find("```", opening.end())
+    if closing == -1:
+        return None
+    return closing + 3
+
+def extract_code(response: str) -> str:
+    """
+    Code of the first fenced block of a response, or the whole response
+    without stray backticks if it has no fences. Works on partial responses.
+    """
+    opening = _FENCE.search(response)
+    if opening is None:
+        # Fence not finished yet, or plain code
+        return response.replace("```python", "").replace("```", "").strip()
+    closing = response.find("```", opening.end())
+    code = response[opening.end():] if closing == -1 else response[opening.end():closing]
+    return code.strip()
@@ -9,8 +9,22 @@ REGLAS ESTRICTAS DE RESPUESTA:
 5. NO uses `print()`, la interfaz mostrará el contenido de `result`.
 6. Librerías disponibles: `pd` (pandas), `np` (numpy), `px` (plotly.express), `go` (plotly.graph_objects). NO necesitas importarlas.
 
+FUNCIONES DE ANÁLISIS (ya disponibles, optimizadas; úsalas en lugar de bucles o código propio):
+- `per_interval(df, time_col, freq='1min', by=None, value=None, agg='count')` -> Series indexada por (`by`..., inicio del intervalo)
+  con el número de filas por intervalo, o `agg` de `value` ('mean', 'max'...). Ej.: detecciones por sectorid y minuto:
+  `per_interval(df, 'time', '1min', by='sectorid')`.
+- `group_stats(df, by, value, stats=('count', 'mean', 'max'))` -> DataFrame con una columna por estadística.
+- `gaps_per_entity(df, entity, time_col)` -> Series alineada con `df`: segundos desde la fila anterior de la misma entidad
+  (ej. tiempo entre detecciones de cada `uuid`); NaN en la primera.
+- `rolling_window(df, time_col, value, window='5min', agg='mean', by=None)` -> Series alineada con `df` con `agg` de `value`
+  en la ventana temporal que termina en cada fila (por grupo si se da `by`).
+- `histogram(df, column, bins=50, range=None)` -> Series de conteos indexada por el inicio de cada intervalo.
+Para graficar una Series usa `.reset_index()`: `px.bar(histogram(df, 'Fc').reset_index(), x='Fc_bin', y='count')`.
+
 MANEJO DE FECHAS:
 - Asegúrate de convertir columnas a datetime si es necesario: `df['col'] = pd.to_datetime(df['col'])`.
+- Los cambios que hagas en `df` (columnas nuevas, conversiones, filtros) solo valen para esta ejecución:
+  la siguiente pregunta recibe los datos originales, así que repite las conversiones que necesites.
 
 TIPOS DE RESPUESTA ESPERADOS:
 - Si la pregunta pide un número o texto -> `result = ...`
@@ -39,9 +53,74 @@ result = fig
 ```
 """
 
-def build_system_prompt(schema_description: str) -> str:
-    """Injects schema into the system prompt."""
-    return SYSTEM_PROMPT_TEMPLATE.format(schema_description=schema_description)
+LIST_COLUMNS_TEMPLATE = """
+COLUMNAS DE LISTAS:
+Las columnas {names} contienen listas de números (texto como "[1.5, 2]").
+NO las parsees con `eval`/`apply`: ya están disponibles como datos numéricos en `list_columns['<columna>']`:
+- `.values` (array plano de valores) y `.offsets` (la fila i es values[offsets[i]:offsets[i+1]])
+- `.lengths()`, `.first()`, `.reduce('sum'|'mean'|'min'|'max')` -> Series alineadas con `df`
+- `.explode()` -> Series con un valor por fila, indexada por la fila original
+"""
+
+TIME_INDEX_TEMPLATE = """
+ÍNDICE TEMPORAL:
+`time_index` tiene las filas de `df` ordenadas por `{time_col}`.
+Para filtrar por un intervalo de tiempo NO uses máscaras sobre `df['{time_col}']` (recorren todas las filas); usa búsqueda binaria:
+- `time_index.slice(df, start, end{sector_arg})` -> filas con start <= {time_col} < end (None = sin límite), en orden temporal.
+- `time_index.count(start, end{sector_arg})` -> número de esas filas, sin crearlas.
+- `time_index.first` / `time_index.last` -> primer y último instante (Timestamp).{sector_help}
+Ej.: última hora: `ultima = time_index.slice(df, time_index.last - pd.Timedelta('1h'), None)`
+"""
+
+CHUNKED_PROMPT_TEMPLATE = """
+MODO FUERA DE MEMORIA (IMPORTANTE):
+El archivo es demasiado grande para cargarlo entero. La variable `df` NO existe.
+Los datos se procesan por bloques (map/reduce). Tu código debe DEFINIR estas funciones:
+- `map_chunk(chunk)`: recibe un bloque (DataFrame con las columnas del esquema) y devuelve un resultado parcial
+  pequeño (número, Series, DataFrame agregado). NUNCA devuelvas las filas del bloque.
+- `reduce_partials(partials)`: recibe una lista de parciales y devuelve UN parcial del mismo tipo.
+  Debe ser asociativa: se aplica varias veces sobre parciales ya combinados.
+- `finalize(partial)` (opcional): convierte el parcial combinado en el resultado final (número, tabla o gráfico).
+NO asignes `result`: el resultado es lo que devuelve `finalize` (o el parcial combinado).
+Para combinar parciales puedes usar `merge_partials(partials, how)` con how='sum', 'min' o 'max'
+(los Series/DataFrames se alinean por índice). Para medias acumula suma y conteo y divide en `finalize`.
+`per_interval` (con agg 'count', 'sum', 'min' o 'max') e `histogram` (con `range` fijo) sobre cada bloque dan parciales
+que se combinan con `merge_partials`. `gaps_per_entity` y `rolling_window` solo ven un bloque: no las uses en este modo.
+
+Ejemplo: media de power por protocolType
+```python
+def map_chunk(chunk):
+    return chunk.groupby('protocolType')['power'].agg(['sum', 'count'])
+
+def reduce_partials(partials):
+    return merge_partials(partials, 'sum')
+
+def finalize(partial):
+    return (partial['sum'] / partial['count']).rename('power_media')
+```
+"""
+
+def build_system_prompt(schema_description: str, list_columns: dict = None, chunked: bool = False,
+                        time_index=None) -> str:
+    """
+    Injects schema (and the parsed list columns and time index, if any) into
+    the system prompt. With `chunked`, the out-of-core map/reduce contract is appended.
+    """
+    prompt = SYSTEM_PROMPT_TEMPLATE.format(schema_description=schema_description)
+    if list_columns:
+        names = ", ".join(f"`{name}`" for name in list_columns)
+        prompt += LIST_COLUMNS_TEMPLATE.format(names=names)
+    if time_index is not None and len(time_index):
+        partitioned = bool(time_index.sectors)
+        prompt += TIME_INDEX_TEMPLATE.format(
+            time_col=time_index.time_col,
+            sector_arg=", sector=None" if partitioned else "",
+            sector_help=(f"\n- `sector=<valor de {time_index.partition_col}>` limita a ese sector sin recorrer los demás."
+                         if partitioned else "")
+        )
+    if chunked:
+        prompt += CHUNKED_PROMPT_TEMPLATE
+    return prompt
 
 def build_user_prompt(question: str) -> str:
     """Constructs the user prompt."""
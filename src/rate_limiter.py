@@ -0,0 +1,81 @@
+import os
+import time
+import asyncio
+
+# Groq quota of the account, shared by every session of the process
+REQUESTS_PER_MINUTE = int(os.getenv("GROQ_RPM", "30"))
+TOKENS_PER_MINUTE = int(os.getenv("GROQ_TPM", "12000"))
+
+class TokenBucket:
+    """Bucket of `capacity` units refilled continuously at `capacity` per `period` seconds."""
+
+    def __init__(self, capacity: int, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (a request larger than the bucket waits for a full one)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter for asyncio code.
+    Callers are served in arrival order: the first waiter reserves its share
+    and everyone behind it queues, instead of all retrying at once.
+    A 429 with retry-after pauses every caller until the server accepts again.
+    """
+
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self._lock = None  # Created on the event loop that uses the limiter
+        self.waited = 0.0  # Total seconds spent queueing, for monitoring
+
+    async def acquire(self, tokens: int):
+        """Waits until one request of `tokens` tokens fits in the quota and reserves it."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # asyncio.Lock wakes waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.blocked_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now)
+                )
+                if wait <= 0:
+                    break
+                self.waited += wait
+                await asyncio.sleep(wait)
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+
+    def settle(self, reserved: int, used: int):
+        """Adjusts the token bucket once the real size of the request is known."""
+        if used < reserved:
+            self.tokens.give_back(reserved - used)
+        else:
+            self.tokens.take(used - reserved, time.monotonic())
+
+    def pause(self, seconds: float):
+        """Blocks every caller for `seconds` (server-side rate limit hit)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        print(f"DEBUG: Rate limit hit, pausing LLM requests for {seconds:.1f}s")
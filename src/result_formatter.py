@@ -45,3 +45,31 @@ def format_result(execution_result: ExecutionResult) -> dict:
         "type": "text",
         "value": f"Result: {val}"
     }
+
+def _format_bytes(nbytes: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GB"
+
+def format_timings(profile: dict, llm_time: float = None, render_time: float = None) -> str:
+    """
+    One-line summary of where an answer spent its time: LLM, execution
+    (from `ExecutionResult.profile`) and rendering.
+    """
+    parts = []
+    if llm_time is not None:
+        parts.append(f"LLM {llm_time:.2f} s")
+    if profile.get("cached"):
+        parts.append("ejecución en caché")
+    elif "wall_time" in profile:
+        details = [f"CPU {profile['cpu_time']:.2f} s"]
+        if "peak_bytes" in profile:
+            details.append(f"pico {_format_bytes(profile['peak_bytes'])}")
+        if profile.get("result_bytes") is not None:
+            details.append(f"resultado {_format_bytes(profile['result_bytes'])}")
+        parts.append(f"ejecución {profile['wall_time']:.2f} s ({', '.join(details)})")
+    if render_time is not None:
+        parts.append(f"render {render_time:.2f} s")
+    return "⏱️ " + " · ".join(parts) if parts else ""
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+def _times(df: pd.DataFrame, time_col: str) -> pd.Series:
+    """The time column as datetimes (text timestamps are parsed, invalid ones become NaT)."""
+    times = df[time_col]
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, errors="coerce", format="ISO8601")
+    return times
+
+def _keys(df: pd.DataFrame, by) -> list:
+    if by is None:
+        return []
+    return [df[col] for col in ([by] if isinstance(by, str) else by)]
+
+def per_interval(df: pd.DataFrame, time_col: str, freq: str = "1min", by=None,
+                 value: str = None, agg: str = "count") -> pd.Series:
+    """
+    Rows per time interval (`agg='count'`), or `agg` of `value` per interval,
+    optionally per group(s) `by`. Indexed by (`by`..., interval start); only
+    intervals with rows appear. Rows without time are ignored.
+    """
+    buckets = _times(df, time_col).dt.floor(freq)
+    grouped = df.groupby(_keys(df, by) + [buckets], observed=True)
+    if value is None:
+        if agg != "count":
+            raise ValueError(f"agg '{agg}' needs a value column")
+        return grouped.size().rename("count")
+    return grouped[value].agg(agg).rename(f"{value}_{agg}")
+
+def group_stats(df: pd.DataFrame, by, value: str, stats=("count", "mean", "max")) -> pd.DataFrame:
+    """Statistics of `value` per group, one column per statistic (categories without rows are left out)."""
+    return df.groupby(by, observed=True)[value].agg(list(stats))
+
+def gaps_per_entity(df: pd.DataFrame, entity: str, time_col: str) -> pd.Series:
+    """
+    Seconds since the previous row of the same `entity` (e.g. time between
+    detections of a uuid), aligned with `df`. NaN for the first row of each
+    entity and for rows without entity or time.
+    """
+    times = _times(df, time_col)
+    valid = (times.notna() & df[entity].notna()).to_numpy()
+    codes, _ = pd.factorize(df[entity][valid])
+    ns = times[valid].to_numpy(dtype="datetime64[ns]").view("i8")
+
+    # One sort by (entity, time) instead of a groupby + diff per entity
+    order = np.lexsort((ns, codes))
+    gaps = np.full(len(order), np.nan)
+    if len(order) > 1:
+        same = codes[order][1:] == codes[order][:-1]
+        gaps[1:] = np.where(same, np.diff(ns[order]) / 1e9, np.nan)
+
+    out = np.full(len(df), np.nan)
+    out[np.flatnonzero(valid)[order]] = gaps
+    return pd.Series(out, index=df.index, name=f"{time_col}_gap_s")
+
+def rolling_window(df: pd.DataFrame, time_col: str, value: str, window: str = "1min",
+                   agg: str = "mean", by: str = None) -> pd.Series:
+    """
+    `agg` of `value` over the trailing time `window` ending at each row
+    (optionally within each group `by`), aligned with `df`. The rows are
+    sorted by (group, time) once; data already in time order is not sorted.
+    """
+    times = _times(df, time_col)
+    valid = times.notna().to_numpy()
+    codes = np.zeros(len(df), dtype="int64")
+    if by is not None:
+        codes, _ = pd.factorize(df[by])
+        valid = valid & (codes >= 0)
+    codes = codes[valid].astype("int64")
+    ns = times[valid].to_numpy(dtype="datetime64[ns]").view("i8")
+    values = df[value].to_numpy(dtype=float, na_value=np.nan)[valid]
+    positions = np.flatnonzero(valid)
+
+    if by is not None or not (np.diff(ns) >= 0).all():
+        order = np.lexsort((ns, codes))
+        ns, values, positions, codes = ns[order], values[order], positions[order], codes[order]
+
+    out = np.full(len(df), np.nan)
+    if len(ns):
+        # Lay the groups end to end on one time axis, further apart than the window,
+        # so a single rolling pass never mixes two groups (~8x faster than groupby().rolling())
+        start = int(ns.min())
+        span = int(ns.max()) - start + pd.Timedelta(window).value + 1
+        if int(codes[-1]) * span < 2 ** 62:
+            rolled = pd.Series(values, index=pd.DatetimeIndex(ns - start + codes * span)).rolling(window).agg(agg)
+        else:
+            # Too many groups over too long a time for one axis
+            frame = pd.DataFrame({"group": codes, "time": pd.DatetimeIndex(ns), "value": values})
+            rolled = frame.groupby("group", sort=False).rolling(window, on="time")["value"].agg(agg)
+        out[positions] = rolled.to_numpy(dtype=float)
+    return pd.Series(out, index=df.index, name=f"{value}_{agg}_{window}")
+
+def histogram(df: pd.DataFrame, column: str, bins: int = 50, range: tuple = None) -> pd.Series:
+    """
+    Counts of `column` per bin, indexed by the bin start. Missing and
+    infinite values are ignored. With a fixed `range`, histograms of
+    different chunks have the same bins and can be added.
+    """
+    values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=bins, range=range)
+    return pd.Series(counts, index=pd.Index(edges[:-1], name=f"{column}_bin"), name="count")
+
+# Exposed to generated code (see code_executor._build_globals)
+HELPERS = {
+    "per_interval": per_interval,
+    "group_stats": group_stats,
+    "gaps_per_entity": gaps_per_entity,
+    "rolling_window": rolling_window,
+    "histogram": histogram,
+}
@@ -1,70 +1,449 @@
 import pandas as pd
+import numpy as np
 import io
+import os
+import re
+from typing import Dict, Union
 
-def analyze_schema(df: pd.DataFrame) -> dict:
+# Distinct values are counted exactly up to this many, then with HyperLogLog
+EXACT_DISTINCT_LIMIT = 4096
+# 2**12 registers: ~1.6% standard error
+HLL_PRECISION = 12
+SAMPLE_SIZE = 5
+# Above this many rows, distinct counts and samples are computed on a row sample
+SAMPLE_THRESHOLD = int(os.getenv("SCHEMA_SAMPLE_THRESHOLD", "1000000"))
+SAMPLE_ROWS = int(os.getenv("SCHEMA_SAMPLE_ROWS", "200000"))
+# Size limits of the schema description sent in the system prompt
+SCHEMA_TOKEN_BUDGET = int(os.getenv("SCHEMA_TOKEN_BUDGET", "600"))
+MAX_SAMPLE_CHARS = 40
+
+class DistinctCounter:
     """
-    Analyze the structure of the DataFrame to provide context for the LLM.
-    
-    Returns:
-        dict: valid JSON-serializable dictionary with schema info.
+    Mergeable distinct-value counter over 64-bit value hashes.
+    Keeps the exact set of hashes while small and switches to a HyperLogLog
+    sketch past EXACT_DISTINCT_LIMIT.
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.registers = None  # HyperLogLog registers once approximate
+
+    @property
+    def approximate(self) -> bool:
+        return self.registers is not None
+
+    def add(self, hashes: np.ndarray):
+        if self.registers is None:
+            self.hashes = _sorted_unique(np.concatenate([self.hashes, hashes]))
+            if len(self.hashes) > EXACT_DISTINCT_LIMIT:
+                self._to_sketch()
+        else:
+            _hll_add(self.registers, hashes)
+
+    def merge(self, other: "DistinctCounter"):
+        if other.registers is None:
+            self.add(other.hashes)
+            return
+        if self.registers is None:
+            self._to_sketch()
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        if self.registers is None:
+            return len(self.hashes)
+        return _hll_estimate(self.registers)
+
+    def _to_sketch(self):
+        self.registers = np.zeros(2 ** HLL_PRECISION, dtype=np.uint8)
+        _hll_add(self.registers, self.hashes)
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+def _sorted_unique(hashes: np.ndarray, return_counts: bool = False):
+    """np.unique via sort: much faster than its hash-table path on 64-bit hashes."""
+    hashes = np.sort(hashes)
+    keep = np.ones(len(hashes), dtype=bool)
+    if len(hashes) > 1:
+        np.not_equal(hashes[1:], hashes[:-1], out=keep[1:])
+    if not return_counts:
+        return hashes[keep]
+    starts = np.flatnonzero(keep)
+    return hashes[starts], np.diff(np.append(starts, len(hashes)))
+
+def _estimate_distinct(counts: np.ndarray, population: int) -> int:
+    """
+    Chao1 estimate of the distinct values of `population` rows from the
+    value frequencies of a row sample, capped at the population size.
     """
-    columns_info = []
-    
-    for col in df.columns:
-        dtype = str(df[col].dtype)
-        null_count = int(df[col].isnull().sum())
-        # Safe unique count (limit simple types)
+    seen = len(counts)
+    once = int(np.count_nonzero(counts == 1))
+    twice = int(np.count_nonzero(counts == 2))
+    if twice:
+        estimate = seen + once * once / (2 * twice)
+    else:
+        estimate = seen + once * (once - 1) / 2
+    return int(min(round(estimate), population))
+
+def _hll_add(registers: np.ndarray, hashes: np.ndarray):
+    """Adds 64-bit hashes to HyperLogLog registers (vectorized)."""
+    if len(hashes) == 0:
+        return
+    rest_bits = 64 - HLL_PRECISION
+    index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << rest_bits) - 1)
+    # frexp gives the exact bit length of integers below 2**53
+    _, bit_length = np.frexp(rest.astype(np.float64))
+    rank = (rest_bits - bit_length + 1).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+
+def _hll_estimate(registers: np.ndarray) -> int:
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Small range correction (linear counting)
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+class ColumnStats:
+    """Mergeable statistics of one column: counts, range, samples and distinct count."""
+
+    def __init__(self, name: str, dtype: str):
+        self.name = name
+        self.dtype = dtype
+        self.null_count = 0
+        self.value_count = 0  # Non-null rows
+        self.min = None
+        self.max = None
+        # Bottom-k sample: the SAMPLE_SIZE distinct values with the smallest hash
+        self.samples = []
+        self.sample_hashes = np.empty(0, dtype=np.uint64)
+        self.distinct = DistinctCounter()
+        # Distinct values extrapolated for rows left out of a row sample
+        self.unseen_distinct = 0
+        self.sampled = False
+        self.hashable = True
+
+    def add_block(self, dtype: str, null_count: int, low, high, values: pd.Series,
+                  population: int = None):
+        """
+        Adds a block of rows: its null count and range (computed by the caller
+        over the whole block) and the non-null `values` to hash. If `values` is
+        a row sample of `population` non-null rows, the distinct count of the
+        block is extrapolated from the sample.
+        """
+        self.dtype = dtype
+        self.null_count += int(null_count)
+        self.value_count += population or len(values)
+        if low is not None:
+            self._update_range(low, high)
+        if values.empty:
+            return
+
+        if self.hashable:
+            try:
+                hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+            except Exception:
+                # Unhashable values (lists, dicts...): no distinct count
+                self.hashable = False
+            else:
+                unique_hashes, counts = _sorted_unique(hashes, return_counts=True)
+                self.distinct.add(unique_hashes)
+                if population and population > len(values):
+                    self.sampled = True
+                    self.unseen_distinct += _estimate_distinct(counts, population) - len(unique_hashes)
+                self._update_samples(unique_hashes, hashes, values)
+                return
+
+        if len(self.samples) < SAMPLE_SIZE:
+            self.samples.extend(values.head(SAMPLE_SIZE - len(self.samples)).tolist())
+
+    def update(self, series: pd.Series):
+        """Adds the values of `series` (e.g. newly appended rows)."""
+        null_count, low, high = _column_summary(series)
+        self.add_block(str(series.dtype), null_count, low, high, series.dropna())
+
+    def merge(self, other: "ColumnStats"):
+        """Combines with the statistics of another block of rows of the same column."""
+        self.null_count += other.null_count
+        self.value_count += other.value_count
+        if other.min is not None:
+            self._update_range(other.min, other.max)
+        self.hashable = self.hashable and other.hashable
+        self.distinct.merge(other.distinct)
+        self.unseen_distinct += other.unseen_distinct
+        self.sampled = self.sampled or other.sampled
+        if len(other.sample_hashes):
+            self._merge_samples(other.sample_hashes, other.samples)
+        elif len(self.samples) < SAMPLE_SIZE:
+            self.samples = (self.samples + other.samples)[:SAMPLE_SIZE]
+
+    def _update_samples(self, unique_hashes: np.ndarray, hashes: np.ndarray, values: pd.Series):
+        # Only the SAMPLE_SIZE smallest distinct hashes of the block can enter the sample
+        smallest = unique_hashes[:SAMPLE_SIZE]
+        rows = [int(np.argmax(hashes == h)) for h in smallest]
+        self._merge_samples(smallest, values.iloc[rows].tolist())
+
+    def _merge_samples(self, hashes: np.ndarray, values: list):
+        all_hashes = np.concatenate([self.sample_hashes, hashes])
+        all_values = self.samples + list(values)
+        # A handful of values: np.unique is fine here
+        unique_hashes, first = np.unique(all_hashes, return_index=True)
+        self.sample_hashes = unique_hashes[:SAMPLE_SIZE]
+        self.samples = [all_values[i] for i in first[:SAMPLE_SIZE]]
+
+    def _update_range(self, low, high):
         try:
-            nunique = df[col].nunique()
-        except:
-            nunique = 0
-            
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        except TypeError:
+            # Incomparable types after a dtype change
+            self.min, self.max = low, high
+
+    def unique_count(self) -> int:
+        if not self.hashable:
+            return 0
+        # Sketch errors must not report more distinct values than rows
+        return min(self.distinct.count() + self.unseen_distinct, self.value_count)
+
+    def to_dict(self) -> dict:
         col_info = {
-            "name": col,
-            "dtype": dtype,
-            "null_count": null_count,
-            "unique_count": nunique
+            "name": self.name,
+            "dtype": self.dtype,
+            "null_count": int(self.null_count),
+            "unique_count": self.unique_count()
         }
-        
-        # Add sample values and range for context
-        try:
-            non_null = df[col].dropna()
-            if not non_null.empty:
-                # Samples
-                samples = non_null.head(5).tolist()
-                col_info["samples"] = samples
-                
-                # Min/Max for numeric/datetime dates
-                if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
-                    col_info["min"] = str(non_null.min())
-                    col_info["max"] = str(non_null.max())
-        except Exception:
-            pass
-            
-        columns_info.append(col_info)
-        
-    return {
-        "columns": columns_info,
-        "row_count": len(df),
-        "column_count": len(df.columns)
-    }
-
-def generate_schema_description(df: pd.DataFrame) -> str:
+        if self.samples:
+            col_info["samples"] = list(self.samples)
+        if self.min is not None:
+            col_info["min"] = str(self.min)
+            col_info["max"] = str(self.max)
+
+        # Fields that are estimates rather than exact values
+        approximate = []
+        if self.hashable and (self.distinct.approximate or self.sampled):
+            approximate.append("unique_count")
+        if self.sampled:
+            approximate.append("samples")
+        if approximate:
+            col_info["approximate"] = approximate
+        return col_info
+
+class SchemaStats:
+    """
+    Schema statistics that can be updated with appended rows or merged with
+    the statistics of another block, instead of re-profiling the whole frame.
+    Shared by the JSON view (`to_dict`) and the prompt description.
+
+    Null counts and min/max are always exact. Above `sample_threshold` rows,
+    samples and distinct counts are estimated from a row sample of
+    `sample_rows` rows and flagged in the column's "approximate" list.
+    """
+
+    def __init__(self, sample_threshold: int = SAMPLE_THRESHOLD, sample_rows: int = SAMPLE_ROWS):
+        self.columns: Dict[str, ColumnStats] = {}
+        self.row_count = 0
+        self.sample_threshold = sample_threshold
+        self.sample_rows = sample_rows
+        self.sampled = False  # True once any block was profiled from a row sample
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **kwargs) -> "SchemaStats":
+        return cls(**kwargs).update(df)
+
+    def update(self, df: pd.DataFrame) -> "SchemaStats":
+        """Adds the rows of `df` (same columns as the profiled frame)."""
+        # Distinct counts and samples only need a row sample on large blocks
+        sample = df
+        sample_size = min(self.sample_rows, len(df))
+        if len(df) > self.sample_threshold and sample_size < len(df):
+            rng = np.random.default_rng(0)
+            rows = np.sort(rng.choice(len(df), size=sample_size, replace=False))
+            sample = df.iloc[rows]
+            self.sampled = True
+
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnStats(col, str(df[col].dtype))
+                # Rows seen before this column existed count as nulls
+                self.columns[col].null_count = self.row_count
+            # Exact fields always cover every row of the block
+            null_count, low, high = _column_summary(df[col])
+            self.columns[col].add_block(str(df[col].dtype), null_count, low, high, sample[col].dropna(),
+                                        population=len(df) - null_count)
+        self.row_count += len(df)
+        return self
+
+    def merge(self, other: "SchemaStats") -> "SchemaStats":
+        for name, stats in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(stats)
+            else:
+                self.columns[name] = stats
+        self.row_count += other.row_count
+        self.sampled = self.sampled or other.sampled
+        return self
+
+    def to_dict(self) -> dict:
+        schema = {
+            "columns": [stats.to_dict() for stats in self.columns.values()],
+            "row_count": self.row_count,
+            "column_count": len(self.columns)
+        }
+        if self.sampled:
+            schema["sampled_rows"] = self.sample_rows
+        return schema
+
+def _has_range(series: pd.Series) -> bool:
+    # Min/Max for numeric/datetime dates
+    return pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)
+
+def _column_summary(series: pd.Series):
+    """
+    Null count and range of a column with vectorized reductions (no copy of
+    the non-null values). Frame-wide reductions are avoided because sparse
+    columns mixed with dense ones give wrong null counts.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "iub":
+        # Integer and boolean arrays cannot hold nulls
+        values = series.to_numpy()
+        if len(values) == 0:
+            return 0, None, None
+        return 0, values.min(), values.max()
+
+    null_count = len(series) - series.count()
+    if not _has_range(series) or null_count == len(series):
+        return null_count, None, None
+    if null_count == 0 and isinstance(dtype, np.dtype):
+        # Plain NumPy reductions are several times faster than the NaN-aware ones
+        values = series.to_numpy()
+        low, high = values.min(), values.max()
+        if dtype.kind == "M":
+            low, high = pd.Timestamp(low), pd.Timestamp(high)
+        return null_count, low, high
+    return null_count, _clean_bound(series.min()), _clean_bound(series.max())
+
+def _clean_bound(value):
+    """Reduction results of all-null columns (NaN/NaT) mean no range."""
+    if value is None or pd.isna(value):
+        return None
+    return value
+
+def analyze_schema(df: Union[pd.DataFrame, SchemaStats]) -> dict:
+    """
+    Analyze the structure of the DataFrame to provide context for the LLM.
+    Accepts already computed `SchemaStats` to avoid profiling twice.
+
+    Returns:
+        dict: valid JSON-serializable dictionary with schema info.
+    """
+    stats = df if isinstance(df, SchemaStats) else SchemaStats.from_frame(df)
+    return stats.to_dict()
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), enough for budgeting."""
+    return (len(text) + 3) // 4
+
+def generate_schema_description(df: Union[pd.DataFrame, SchemaStats], question: str = None,
+                                token_budget: int = SCHEMA_TOKEN_BUDGET) -> str:
     """
     Generate a text description of the schema for the LLM system prompt.
+    Accepts a DataFrame or already computed `SchemaStats`.
+
+    All-null columns are collapsed into one line, long examples are truncated
+    and, if the description exceeds `token_budget`, the least informative
+    columns (given the `question`) are listed by name only.
     """
     schema = analyze_schema(df)
-    
-    desc = [f"DataFrame with {schema['row_count']} rows and {schema['column_count']} columns."]
-    desc.append("Columns:")
-    
-    for col in schema['columns']:
-        line = f"- {col['name']} ({col['dtype']})"
-        if 'min' in col and 'max' in col:
-            line += f", range: [{col['min']} - {col['max']}]"
-        if 'samples' in col:
-            samples_str = ", ".join(map(str, col['samples'][:3]))
-            line += f", examples: {samples_str}..."
-        desc.append(line)
-        
-    return "\n".join(desc)
+    row_count = schema['row_count']
+
+    header = [f"DataFrame with {row_count} rows and {schema['column_count']} columns."]
+    if 'sampled_rows' in schema:
+        header.append(f"(Examples taken from a sample of {schema['sampled_rows']} rows.)")
+    header.append("Columns:")
+
+    empty = [col['name'] for col in schema['columns'] if row_count and col['null_count'] >= row_count]
+    described = [col for col in schema['columns'] if col['name'] not in set(empty)]
+    lines = {col['name']: _describe_column(col) for col in described}
+
+    # All-null columns only need their names, in at most a quarter of the budget
+    footer = []
+    if empty:
+        footer.append(_name_list(f"All-null columns ({len(empty)})", empty, token_budget // 4))
+    used = sum(_line_tokens(line) for line in header + footer)
+
+    # Every column starts as a bare name; the most informative ones get their
+    # full line while it fits in the budget
+    keywords = _question_keywords(question)
+    ranked = sorted(described, key=lambda col: _column_score(col, row_count, keywords), reverse=True)
+    used += sum(_line_tokens(f"{col['name']}, ") for col in described)
+    kept = set()
+    for col in ranked:
+        cost = _line_tokens(lines[col['name']]) - _line_tokens(f"{col['name']}, ")
+        if used + cost <= token_budget:
+            kept.add(col['name'])
+            used += cost
+
+    omitted = [col['name'] for col in ranked if col['name'] not in kept]
+    if omitted:
+        names_budget = token_budget - sum(_line_tokens(lines[name]) for name in kept) \
+            - sum(_line_tokens(line) for line in header + footer)
+        footer.insert(0, _name_list("Other columns (no details)", omitted, names_budget))
+
+    body = [lines[col['name']] for col in described if col['name'] in kept]
+    return "\n".join(header + body + footer)
+
+def _line_tokens(line: str) -> int:
+    # Counting lines separately over-estimates a little, which keeps the total under budget
+    return estimate_tokens(line + "\n")
+
+def _name_list(label: str, names: list, max_tokens: int) -> str:
+    """'- label: a, b, c' cut to `max_tokens`, ending with how many names were left out."""
+    line = f"- {label}: {', '.join(names)}"
+    shown = len(names)
+    while shown > 1 and _line_tokens(line) > max_tokens:
+        shown -= 1
+        line = f"- {label}: {', '.join(names[:shown])}, ... (+{len(names) - shown} more)"
+    return line
+
+def _describe_column(col: dict) -> str:
+    line = f"- {col['name']} ({col['dtype']})"
+    samples = col.get('samples', [])
+    if col['unique_count'] == 1 and samples and 'approximate' not in col:
+        return line + f", constant: {_truncate(samples[0])}"
+    if 'min' in col and 'max' in col:
+        line += f", range: [{col['min']} - {col['max']}]"
+    if samples:
+        samples_str = ", ".join(_truncate(value) for value in samples[:3])
+        line += f", examples: {samples_str}..."
+    return line
+
+def _truncate(value) -> str:
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.6g}"
+    text = str(value)
+    if len(text) > MAX_SAMPLE_CHARS:
+        return text[:MAX_SAMPLE_CHARS - 3] + "..."
+    return text
+
+def _question_keywords(question: str) -> set:
+    if not question:
+        return set()
+    return {word for word in re.findall(r"\w+", question.lower()) if len(word) >= 3}
+
+def _column_score(col: dict, row_count: int, keywords: set) -> float:
+    """Information content of a column: filled, varied and mentioned in the question."""
+    score = (row_count - col['null_count']) / row_count if row_count else 0.0
+    unique = col['unique_count']
+    if unique > 1:
+        score += min(1.0, np.log10(unique) / 3)
+
+    # Column names like "drone_latitude" or "protocolType" split into words
+    name = col['name']
+    name_words = {w.lower() for w in re.findall(r"[A-Z]?[a-z]+|[0-9]+|[A-Z]+(?![a-z])", name)}
+    for word in keywords:
+        if word in name_words or word in name.lower() or any(w.startswith(word) or word.startswith(w) for w in name_words if len(w) >= 3):
+            score += 3.0
+            break
+    return score
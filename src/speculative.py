@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+from src.code_executor import ExecutionResult
+from src.llm_client import LLMClient, extract_code, get_llm_loop
+
+# One candidate per temperature; the first one is the usual deterministic answer
+CANDIDATE_TEMPERATURES = (0.0, 0.4, 0.8)
+
+@dataclass
+class SpeculativeOutcome:
+    result: Optional[ExecutionResult]  # Result of the winning candidate (or of candidate 0 if all failed)
+    code: str                          # Code of the winning candidate (or of candidate 0 if all failed)
+    winner: Optional[int]              # Index of the winning candidate, None if all failed
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (candidate, error) of failed candidates
+
+    @property
+    def success(self) -> bool:
+        return self.winner is not None
+
+# Process-wide counters shared by every session
+_STATS = {"runs": 0, "successes": 0, "saved_round_trips": 0, "wins": {}}
+_STATS_LOCK = threading.Lock()
+
+def get_speculative_stats() -> dict:
+    """
+    Counters of speculative runs. `saved_round_trips` counts the runs where
+    the deterministic candidate failed but another one succeeded, i.e. the
+    correction round trip the serial loop would have needed.
+    """
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+        stats["wins"] = dict(_STATS["wins"])
+    return stats
+
+def run_speculative(llm: LLMClient, prompt: str, system: str, execute: Callable[[str], ExecutionResult],
+                    temperatures: tuple = CANDIDATE_TEMPERATURES,
+                    cancel: threading.Event = None) -> SpeculativeOutcome:
+    """
+    Requests one program per temperature concurrently, runs each one as soon
+    as it arrives and returns the first that succeeds, cancelling the rest.
+
+    `execute` runs in worker threads: it must not touch Streamlit state and
+    must not modify data shared with the other candidates. A thread cannot
+    be stopped, so programs already running when the outcome is decided are
+    only stopped if `execute` watches `cancel` (set on return), as
+    `ExecutionPool.execute` does; otherwise they run to completion in the
+    background.
+    """
+    loop = get_llm_loop()
+    llm_futures = {
+        asyncio.run_coroutine_threadsafe(
+            llm.async_client.query(prompt, system=system, temperature=t), loop
+        ): i
+        for i, t in enumerate(temperatures)
+    }
+    pool = ThreadPoolExecutor(max_workers=len(temperatures), thread_name_prefix="candidate")
+    run_futures = {}
+    codes = {}
+    outcome = SpeculativeOutcome(result=None, code="", winner=None)
+    first_result = None
+
+    try:
+        pending = set(llm_futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in llm_futures:
+                    i = llm_futures[future]
+                    try:
+                        codes[i] = extract_code(future.result())
+                    except Exception as e:
+                        outcome.errors.append((i, f"LLM error: {e}"))
+                        continue
+                    run_future = pool.submit(execute, codes[i])
+                    run_futures[run_future] = i
+                    pending.add(run_future)
+                    continue
+
+                i = run_futures[future]
+                result = future.result()
+                if i == 0:
+                    first_result = result
+                if result.success:
+                    outcome.result, outcome.code, outcome.winner = result, codes[i], i
+                    return outcome
+                outcome.errors.append((i, result.error))
+
+        # Every candidate failed: report the deterministic one for the correction prompt
+        outcome.code = codes.get(0, "")
+        outcome.result = first_result
+        return outcome
+    finally:
+        for future in llm_futures:
+            future.cancel()
+        # Losing programs still running are stopped through `cancel`; their results are ignored
+        if cancel is not None:
+            cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        _record(outcome)
+
+def _record(outcome: SpeculativeOutcome):
+    with _STATS_LOCK:
+        _STATS["runs"] += 1
+        if outcome.success:
+            _STATS["successes"] += 1
+            _STATS["wins"][outcome.winner] = _STATS["wins"].get(outcome.winner, 0) + 1
+            if any(i == 0 for i, _ in outcome.errors):
+                _STATS["saved_round_trips"] += 1
+    if outcome.success:
+        print(f"DEBUG: Speculative run won by candidate {outcome.winner} ({len(outcome.errors)} failed)")
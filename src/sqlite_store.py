@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+
+# Wait this long for another session holding the database lock
+LOCK_TIMEOUT = 5.0
+
+class SQLiteStore:
+    """
+    Base of the caches kept in a SQLite file shared by every session and
+    process (`CodeCache`, `ResponseCache`). Subclasses list their CREATE
+    statements in `SCHEMA` and the table `clear()` empties in `TABLE`.
+    If the file cannot be created the store stays usable: every query fails
+    with `sqlite3.Error`, which callers treat as a miss.
+    """
+
+    NAME = "cache"
+    TABLE = None
+    SCHEMA = ()
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per call: Streamlit runs each session in its own thread
+        return sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+
+    def _init_db(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self._connect() as conn:
+                # WAL lets readers proceed while another session writes
+                conn.execute("PRAGMA journal_mode=WAL")
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+        except (OSError, sqlite3.Error) as e:
+            print(f"DEBUG: {self.NAME} disabled: {e}")
+
+    def clear(self):
+        try:
+            with self._connect() as conn:
+                conn.execute(f"DELETE FROM {self.TABLE}")
+        except sqlite3.Error:
+            pass
+
+_INSTANCES = {}
+_INSTANCES_LOCK = threading.Lock()
+
+def shared_store(cls):
+    """The instance of `cls` (default arguments) used by the whole process, created on first use."""
+    with _INSTANCES_LOCK:
+        if cls not in _INSTANCES:
+            _INSTANCES[cls] = cls()
+        return _INSTANCES[cls]
@@ -2,42 +2,141 @@ import paramiko
 import os
 import io
 import stat
+import socket
+import threading
+from dataclasses import dataclass
 from typing import List, Tuple, Optional
 
+# Seconds between SSH keepalive packets on pooled transports
+KEEPALIVE_INTERVAL = 30
+
+@dataclass
+class RemoteDelta:
+    data: bytes     # Bytes from the requested offset (or the whole file if reset)
+    size: int       # Remote file size at fetch time
+    mtime: float    # Remote modification time at fetch time
+    reset: bool     # True if `data` is the full file (first fetch, truncation or rotation)
+
+class _PooledConnection:
+    """An authenticated SSH transport plus a long-lived SFTP channel."""
+
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.sftp = None
+        # Serializes use of the shared SFTP channel between sessions
+        self.lock = threading.RLock()
+
+    def is_alive(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def get_sftp(self) -> paramiko.SFTPClient:
+        if self.sftp is None or self.sftp.get_channel().closed:
+            self.sftp = self.client.open_sftp()
+        return self.sftp
+
+    def close(self):
+        try:
+            if self.sftp:
+                self.sftp.close()
+        finally:
+            self.sftp = None
+            self.client.close()
+
+# Process-wide pool shared by every Streamlit session, keyed by (host, user)
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+_POOL_STATS = {"handshakes": 0, "reused": 0, "reconnects": 0}
+
+# Errors that mean the pooled transport is dead and worth one reconnect
+_CONNECTION_ERRORS = (paramiko.SSHException, EOFError, socket.error)
+
+def get_pool_stats() -> dict:
+    """Connection pool counters. `reused` is the number of handshakes saved."""
+    with _POOL_LOCK:
+        stats = dict(_POOL_STATS)
+        stats["open_connections"] = sum(1 for conn in _POOL.values() if conn.is_alive())
+    return stats
+
+def close_pool():
+    """Closes every pooled connection (e.g. on shutdown)."""
+    with _POOL_LOCK:
+        for conn in _POOL.values():
+            conn.close()
+        _POOL.clear()
+
 class SSHManager:
     def __init__(self):
         self.host = os.getenv("SSH_HOST")
         self.user = os.getenv("SSH_USER")
         self.password = os.getenv("SSH_PASSWORD")
         self.client = None
+        self._conn = None
 
     def connect(self):
-        """Establishes SSH connection."""
+        """Gets a live connection from the pool, opening one only if needed."""
         if not all([self.host, self.user, self.password]):
             raise ValueError("SSH credentials missing in environment variables.")
-        
+
+        key = (self.host, self.user)
+        with _POOL_LOCK:
+            conn = _POOL.get(key)
+            if conn is not None and conn.is_alive():
+                _POOL_STATS["reused"] += 1
+            else:
+                if conn is not None:
+                    conn.close()
+                    _POOL_STATS["reconnects"] += 1
+                conn = _PooledConnection(self._open_client())
+                _POOL[key] = conn
+                _POOL_STATS["handshakes"] += 1
+
+        self._conn = conn
+        self.client = conn.client
+
+    def _open_client(self) -> paramiko.SSHClient:
         try:
-            self.client = paramiko.SSHClient()
-            self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.client.connect(
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(
                 hostname=self.host,
                 username=self.user,
                 password=self.password,
                 timeout=10
             )
+            client.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+            return client
         except Exception as e:
-            self.client = None
             raise ConnectionError(f"Failed to connect to {self.host}: {e}")
 
+    def _run(self, operation):
+        """
+        Runs `operation(conn)` on the pooled connection.
+        If the transport died in the meantime, reconnects once and retries.
+        """
+        if not self._conn:
+            self.connect()
+
+        for attempt in range(2):
+            conn = self._conn
+            try:
+                with conn.lock:
+                    return operation(conn)
+            except _CONNECTION_ERRORS:
+                if attempt == 1 or conn.is_alive():
+                    raise
+                # Stale transport: drop it and let connect() open a new one
+                self.connect()
+
     def list_files(self, remote_dir: str, pattern: str = "*.csv") -> List[str]:
         """Lists files matching a pattern in a remote directory."""
-        if not self.client:
-            self.connect()
-        
-        try:
+        def operation(conn):
             # Use find to get only files
-            stdin, stdout, stderr = self.client.exec_command(f"find {remote_dir} -maxdepth 1 -name '{pattern}' -type f")
-            files = stdout.read().decode().splitlines()
+            stdin, stdout, stderr = conn.client.exec_command(f"find {remote_dir} -maxdepth 1 -name '{pattern}' -type f")
+            return stdout.read().decode().splitlines()
+
+        try:
+            files = self._run(operation)
             # Return only basenames
             return [os.path.basename(f) for f in files if f.strip()]
         except Exception as e:
@@ -45,36 +144,70 @@ class SSHManager:
 
     def get_file(self, remote_path: str) -> io.BytesIO:
         """Downloads a remote file into memory."""
-        if not self.client:
-            self.connect()
-            
-        try:
-            sftp = self.client.open_sftp()
+        def operation(conn):
             file_obj = io.BytesIO()
-            sftp.getfo(remote_path, file_obj)
+            conn.get_sftp().getfo(remote_path, file_obj)
+            return file_obj
+
+        try:
+            file_obj = self._run(operation)
             file_obj.seek(0)
-            sftp.close()
             # attribute name for app.py logic
-            file_obj.name = os.path.basename(remote_path) 
+            file_obj.name = os.path.basename(remote_path)
             return file_obj
         except Exception as e:
             raise RuntimeError(f"Error downloading file {remote_path}: {e}")
 
+    def get_file_delta(self, remote_path: str, offset: int = 0, prev_size: int = None,
+                       prev_mtime: float = None, expected_head: bytes = b"") -> RemoteDelta:
+        """
+        Downloads only the bytes appended to a remote file since `offset`.
+
+        The whole file is returned instead (reset=True) when there is no previous
+        offset, the file shrank, its mtime went backwards, or its first bytes no
+        longer match `expected_head` (rotated/replaced file).
+        """
+        def operation(conn):
+            sftp = conn.get_sftp()
+            attr = sftp.stat(remote_path)
+            size, mtime = attr.st_size, attr.st_mtime
+
+            reset = (
+                offset <= 0
+                or size < offset
+                or (prev_size is not None and size < prev_size)
+                or (prev_mtime is not None and mtime < prev_mtime)
+            )
+
+            with sftp.open(remote_path, 'rb') as f:
+                if not reset and expected_head:
+                    reset = f.read(len(expected_head)) != expected_head
+
+                start = 0 if reset else offset
+                if size <= start:
+                    return RemoteDelta(data=b"", size=size, mtime=mtime, reset=reset)
+
+                f.seek(start)
+                # Pipelined reads, much faster than sequential round trips
+                f.prefetch(size)
+                data = f.read(size - start)
+
+            return RemoteDelta(data=data, size=size, mtime=mtime, reset=reset)
+
+        try:
+            return self._run(operation)
+        except Exception as e:
+            raise RuntimeError(f"Error downloading delta of {remote_path}: {e}")
+
     def get_mtime(self, remote_path: str) -> float:
         """Gets modification time of remote file."""
-        if not self.client:
-            self.connect()
-            
         try:
-            sftp = self.client.open_sftp()
-            attr = sftp.stat(remote_path)
-            sftp.close()
-            return attr.st_mtime
+            return self._run(lambda conn: conn.get_sftp().stat(remote_path).st_mtime)
         except Exception as e:
              # Fallback using command execution if sftp stat fails?
             return 0.0
 
     def close(self):
-        if self.client:
-            self.client.close()
-            self.client = None
+        """Releases this manager. The pooled connection stays open for reuse."""
+        self.client = None
+        self._conn = None
@@ -0,0 +1,280 @@
+import numpy as np
+import pandas as pd
+from typing import Optional, Union
+
+# Preferred time column and the column rows are partitioned by
+TIME_COLUMN = "time"
+PARTITION_COLUMN = "sectorid"
+
+class TimeIndex:
+    """
+    Row positions of a frame in time order, so a time-range query is two
+    binary searches plus the k rows it returns, instead of a boolean mask
+    over every row. Built once per load; the frame itself keeps file order.
+
+    If the rows are already in time order (usual for logs) no permutation is
+    stored and slices are `iloc` views. Otherwise the stable sort permutation
+    is computed once. Rows are also partitioned by `partition_col`, CSR-style:
+    rows of partition i are `partition_rows[offsets[i]:offsets[i + 1]]`, in
+    time order. Rows without time are not indexed.
+    """
+
+    def __init__(self, df: pd.DataFrame, time_col: str, partition_col: str = None):
+        self.time_col = time_col
+        self.partition_col = partition_col
+        # Positions are only valid for this frame (or a column selection of it):
+        # same default index and the same time (and partition) values
+        self.index = df.index if isinstance(df.index, pd.RangeIndex) else None
+        self.columns = {col: df[col] for col in (time_col, partition_col) if col in df.columns}
+        self._verified = {}
+
+        times = df[time_col]
+        self.tz = times.dt.tz
+        if self.tz is not None:
+            times = times.dt.tz_convert(None)
+        valid = times.notna().to_numpy()
+        ns = times.to_numpy(dtype="datetime64[ns]").view("i8")
+
+        self.in_order = bool(valid.all() and (np.diff(ns) >= 0).all())
+        if self.in_order:
+            self.order = None
+            self.times = ns
+        else:
+            rows = np.flatnonzero(valid)
+            self.order = rows[np.argsort(ns[rows], kind="stable")]
+            self.times = ns[self.order]
+
+        self.partition_keys = {}
+        self.partition_offsets = self.partition_rows = self.partition_times = None
+        if partition_col is not None and partition_col in df.columns:
+            codes, uniques = pd.factorize(df[partition_col], sort=True)
+            # Rows in time order, then grouped by partition with a stable sort of the codes
+            rows = np.arange(len(df)) if self.order is None else self.order
+            rows = rows[codes[rows] >= 0]
+            rows = rows[np.argsort(codes[rows], kind="stable")]
+            counts = np.bincount(codes[rows], minlength=len(uniques))
+            self.partition_keys = {key: i for i, key in enumerate(uniques)}
+            self.partition_offsets = np.concatenate([[0], np.cumsum(counts)])
+            self.partition_rows = rows
+            self.partition_times = ns[rows]
+
+    def extend(self, df: pd.DataFrame, delta: pd.DataFrame) -> bool:
+        """
+        Index rows appended to the frame (`df` is the indexed frame followed
+        by `delta`) without sorting again: positions and partitions are
+        appended when the new rows are in time order and none is older than
+        the last indexed one. Returns False, leaving the index unchanged, if
+        the rows cannot be appended that way and a rebuild is needed.
+        """
+        n = 0 if self.index is None else len(self.index)
+        if (self.index is None or not isinstance(df.index, pd.RangeIndex) or len(df) != n + len(delta)
+                or self.time_col not in delta.columns):
+            return False
+        if len(delta):
+            times = delta[self.time_col]
+            if not pd.api.types.is_datetime64_any_dtype(times) or times.dt.tz != self.tz:
+                return False
+            if self.tz is not None:
+                times = times.dt.tz_convert(None)
+            # Rows without time are left out of the index: the sort decides where they go
+            if times.isna().any():
+                return False
+            ns = times.to_numpy(dtype="datetime64[ns]").view("i8")
+            if (np.diff(ns) < 0).any() or (len(self.times) and ns[0] < self.times[-1]):
+                return False
+            rows = np.arange(n, len(df))
+
+            if self.partition_offsets is not None:
+                partitions = self._extended_partitions(delta, rows, ns)
+                if partitions is None:
+                    return False
+                self.partition_keys, self.partition_offsets, self.partition_rows, self.partition_times = partitions
+            if self.order is not None:
+                self.order = np.concatenate([self.order, rows])
+            self.times = np.concatenate([self.times, ns])
+
+        self.index = df.index
+        self.columns = {col: df[col] for col in self.columns}
+        self._verified = {}
+        return True
+
+    def _extended_partitions(self, delta: pd.DataFrame, rows: np.ndarray, ns: np.ndarray):
+        """Partition arrays with the delta rows appended to their partitions, or None if the keys do not sort."""
+        if self.partition_col not in delta.columns:
+            return None
+        codes, uniques = pd.factorize(delta[self.partition_col])
+        try:
+            keys = sorted(set(self.partition_keys).union(uniques))
+        except TypeError:
+            return None
+        added = codes >= 0
+        # New rows grouped by partition, in time order within each
+        grouped = np.argsort(codes[added], kind="stable")
+        new_rows, new_times, new_codes = rows[added][grouped], ns[added][grouped], codes[added][grouped]
+        new_offsets = np.searchsorted(new_codes, np.arange(len(uniques) + 1))
+        new_index = {key: i for i, key in enumerate(uniques)}
+
+        parts_rows, parts_times, counts = [], [], []
+        for key in keys:
+            count = 0
+            i = self.partition_keys.get(key)
+            if i is not None:
+                part = slice(self.partition_offsets[i], self.partition_offsets[i + 1])
+                parts_rows.append(self.partition_rows[part])
+                parts_times.append(self.partition_times[part])
+                count += part.stop - part.start
+            j = new_index.get(key)
+            if j is not None:
+                part = slice(new_offsets[j], new_offsets[j + 1])
+                parts_rows.append(new_rows[part])
+                parts_times.append(new_times[part])
+                count += part.stop - part.start
+            counts.append(count)
+        return ({key: i for i, key in enumerate(keys)},
+                np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]),
+                np.concatenate(parts_rows) if parts_rows else self.partition_rows,
+                np.concatenate(parts_times) if parts_times else self.partition_times)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def first(self) -> Optional[pd.Timestamp]:
+        return self._timestamp(self.times[0]) if len(self.times) else None
+
+    @property
+    def last(self) -> Optional[pd.Timestamp]:
+        return self._timestamp(self.times[-1]) if len(self.times) else None
+
+    @property
+    def sectors(self) -> list:
+        """Values of the partition column, sorted."""
+        return list(self.partition_keys)
+
+    def _timestamp(self, value: int) -> pd.Timestamp:
+        ts = pd.Timestamp(value)
+        return ts.tz_localize("UTC").tz_convert(self.tz) if self.tz is not None else ts
+
+    def _bound(self, value) -> int:
+        ts = pd.Timestamp(value)
+        if ts.tz is None and self.tz is not None:
+            ts = ts.tz_localize(self.tz)
+        if ts.tz is not None:
+            ts = ts.tz_convert(None)
+        return ts.value
+
+    def positions(self, start=None, end=None, sector=None) -> Union[slice, np.ndarray]:
+        """
+        Positions of the rows with `start <= time < end` (None: unbounded), in
+        time order: a slice when they are contiguous in the frame.
+        """
+        if sector is None:
+            times, rows = self.times, self.order
+        else:
+            if self.partition_offsets is None:
+                raise ValueError(f"Rows are not partitioned (no '{self.partition_col}' column)")
+            i = self.partition_keys.get(sector)
+            if i is None:
+                return slice(0, 0)
+            part = slice(self.partition_offsets[i], self.partition_offsets[i + 1])
+            times, rows = self.partition_times[part], self.partition_rows[part]
+
+        lo = 0 if start is None else int(np.searchsorted(times, self._bound(start), side="left"))
+        hi = len(times) if end is None else int(np.searchsorted(times, self._bound(end), side="left"))
+        hi = max(lo, hi)
+        if rows is None:
+            return slice(lo, hi)
+        rows = rows[lo:hi]
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and (np.diff(rows) == 1).all():
+            return slice(int(rows[0]), int(rows[-1]) + 1)
+        return rows
+
+    def count(self, start=None, end=None, sector=None) -> int:
+        """Number of rows with `start <= time < end`, without building them."""
+        rows = self.positions(start, end, sector)
+        return rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+
+    def slice(self, df: pd.DataFrame, start=None, end=None, sector=None) -> pd.DataFrame:
+        """
+        Rows of `df` with `start <= time < end` (and the given sector), in
+        time order. A view when the rows are contiguous, otherwise a copy of
+        only those rows. Frames other than the indexed one (e.g. already
+        filtered) fall back to a mask over their rows.
+        """
+        if not self._matches(df, sector is not None):
+            return self._mask_slice(df, start, end, sector)
+        rows = self.positions(start, end, sector)
+        return df.iloc[rows] if isinstance(rows, slice) else df.take(rows)
+
+    def _matches(self, df: pd.DataFrame, partitioned: bool) -> bool:
+        """True if `df` has the rows and time (partition) values the index was built on."""
+        if self.index is None or not isinstance(df.index, pd.RangeIndex) or not df.index.equals(self.index):
+            return False
+        needed = [self.time_col] + ([self.partition_col] if partitioned else [])
+        return all(col in df.columns and self._same_column(col, df[col]) for col in needed)
+
+    def _same_column(self, col: str, series: pd.Series) -> bool:
+        reference = self.columns[col]
+        values, expected = _buffer(series), _buffer(reference)
+        if values is None or expected is None:
+            return series.equals(reference)
+        if isinstance(series.dtype, pd.CategoricalDtype) and not series.cat.categories.equals(reference.cat.categories):
+            return False
+        verified = self._verified.get(col)
+        # Same memory (the loaded frame, a shallow copy or a column selection): O(1)
+        if _same_buffer(values, expected) or (verified is not None and _same_buffer(values, verified)):
+            return True
+        # Another copy of the data (e.g. an isolated worker): compare once, then keep the
+        # array alive so its memory cannot be reused by different values
+        if values.dtype == expected.dtype and np.array_equal(_comparable(values), _comparable(expected)):
+            self._verified[col] = values
+            return True
+        return False
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_verified"] = {}
+        return state
+
+    def _mask_slice(self, df: pd.DataFrame, start, end, sector) -> pd.DataFrame:
+        times = df[self.time_col]
+        mask = times.notna()
+        if start is not None:
+            mask &= times >= self._timestamp(self._bound(start))
+        if end is not None:
+            mask &= times < self._timestamp(self._bound(end))
+        if sector is not None:
+            mask &= df[self.partition_col] == sector
+        return df[mask].sort_values(self.time_col, kind="stable")
+
+def _buffer(series: pd.Series) -> Optional[np.ndarray]:
+    """The array holding the values of `series` (codes for categoricals), or None if not numpy-backed."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy()
+    if isinstance(series.dtype, np.dtype) or pd.api.types.is_datetime64_any_dtype(series):
+        return np.asarray(series.values)
+    return None
+
+def _comparable(values: np.ndarray) -> np.ndarray:
+    # Datetimes as integers, so NaT compares equal to NaT
+    return values.view("i8") if values.dtype.kind in "mM" else values
+
+def _same_buffer(a: np.ndarray, b: np.ndarray) -> bool:
+    return (a.__array_interface__["data"][0] == b.__array_interface__["data"][0]
+            and a.strides == b.strides and a.shape == b.shape and a.dtype == b.dtype)
+
+def build_time_index(df: pd.DataFrame, time_col: str = None,
+                     partition_col: str = PARTITION_COLUMN) -> Optional[TimeIndex]:
+    """
+    Time index of a loaded frame on `time_col` (default: `TIME_COLUMN` if
+    it is a datetime column, else the first datetime column), or None if
+    the frame has no datetime column.
+    """
+    if df is None or df.empty:
+        return None
+    if time_col is None:
+        datetimes = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+        if not datetimes:
+            return None
+        time_col = TIME_COLUMN if TIME_COLUMN in datetimes else datetimes[0]
+    return TimeIndex(df, time_col, partition_col)
@@ -0,0 +1,55 @@
+import sys
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.code_cache import CodeCache, schema_fingerprint, normalize_question
+from src.schema_analyzer import analyze_schema
+
+def test_fingerprint_ignores_compaction():
+    today = pd.DataFrame({"power": np.array([1.5, 2.5], dtype="float32"), "sector": [1, 2]})
+    yesterday = pd.DataFrame({"power": pd.arrays.SparseArray([np.nan, 1.0]), "sector": np.array([3, 4], dtype="int32")})
+    renamed = today.rename(columns={"power": "potencia"})
+
+    assert schema_fingerprint(analyze_schema(today)) == schema_fingerprint(analyze_schema(yesterday))
+    assert schema_fingerprint(analyze_schema(today)) != schema_fingerprint(analyze_schema(renamed))
+    assert schema_fingerprint(analyze_schema(today)) != schema_fingerprint(analyze_schema(today), "chunked")
+    print("Schema fingerprint OK")
+
+def test_code_cache_roundtrip():
+    assert normalize_question("¿Cuántas  filas hay?") == "cuantas filas hay"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CodeCache(os.path.join(tmp, 'code.sqlite'), max_entries=2)
+        cache.put("fp1", "¿Cuántas filas hay?", "result = len(df)")
+        assert cache.get("fp1", "cuantas filas hay") == "result = len(df)"
+        assert cache.get("fp2", "¿Cuántas filas hay?") is None
+
+        cache.put("fp1", "Media de power", "result = df['power'].mean()")
+        cache.get("fp1", "¿Cuántas filas hay?")
+        cache.put("fp1", "Máximo de power", "result = df['power'].max()")
+        # Least recently used entry dropped beyond max_entries
+        assert cache.get("fp1", "Media de power") is None
+        assert {e["question"]: e["uses"] for e in cache.entries()} == {"maximo de power": 0, "cuantas filas hay": 2}
+
+        cache.delete("fp1")
+        assert cache.entries() == []
+
+        cache.put("fp2", "Media de power", "result = df['power'].mean()")
+        cache.clear()
+        assert cache.entries() == []
+
+        # A path that cannot be created leaves a cache that always misses
+        broken = CodeCache(os.path.join(tmp, 'code.sqlite', 'nested.sqlite'))
+        broken.put("fp1", "Media de power", "result = df['power'].mean()")
+        assert broken.get("fp1", "Media de power") is None and broken.entries() == []
+
+    print("Code cache OK")
+
+if __name__ == "__main__":
+    test_fingerprint_ignores_compaction()
+    test_code_cache_roundtrip()
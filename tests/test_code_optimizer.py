@@ -0,0 +1,152 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.code_optimizer import optimize_code, extract_referenced_columns
+from src.code_executor import execute_code
+
+def _frame(n=500):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "power": rng.normal(-60, 10, n),
+        "freq": rng.uniform(100, 200, n),
+        "protocolType": rng.choice(["LTE", "GSM", "UMTS"], n),
+        "sectorid": rng.integers(0, 5, n),
+    })
+
+def _check(code, df):
+    optimized = optimize_code(code, df)
+    original = execute_code(code, df)
+    rewritten = execute_code(optimized.code, df)
+    assert rewritten.success, rewritten.error
+    return optimized, original.result, rewritten.result
+
+def test_apply_axis1_rewrite():
+    df = _frame()
+    code = ("# nivel por fila\n"
+            "df['nivel'] = df.apply(lambda r: 'alto' if r['power'] > -55 and 'LTE' in r['protocolType'] else 'bajo', axis=1)\n"
+            "result = df['nivel'].value_counts()")
+    optimized, before, after = _check(code, df)
+    assert optimized.rewrites and ".apply(" not in optimized.code
+    assert optimized.code.startswith("# nivel por fila\n")
+    assert before.to_dict() == after.to_dict()
+    print("apply(axis=1) rewrite OK")
+
+def test_row_loop_rewrite():
+    df = _frame()
+    code = """count = 0
+total = 0.0
+for idx, row in df.iterrows():
+    if row['sectorid'] == 2:
+        count += 1
+        total += row['power']
+        df.at[idx, 'marca'] = 'si'
+result = (count, total, df['marca'].notna().sum())"""
+    optimized, before, after = _check(code, df)
+    assert optimized.rewrites and "iterrows" not in optimized.code
+    assert before[0] == after[0] and np.isclose(before[1], after[1]) and before[2] == after[2]
+    print("Row loop rewrite OK")
+
+def test_loop_sum_keeps_nan():
+    # The first NaN comes after the validation sample
+    df = _frame(3000)
+    df.loc[2500, "power"] = np.nan
+    code = """total = 0.0
+for _, row in df.iterrows():
+    total += row['power']
+result = total"""
+    optimized = optimize_code(code, df, sample_rows=2000)
+    assert optimized.rewrites
+    assert np.isnan(execute_code(code, df).result)
+    assert np.isnan(execute_code(optimized.code, df).result)
+    print("Loop sum keeps NaN OK")
+
+def test_validation_uses_given_runner():
+    df = _frame()
+    code = "result = df.apply(lambda r: r['power'] * 2, axis=1).sum()"
+    calls = []
+
+    def runner(program, sample):
+        calls.append(program)
+        return execute_code(program, sample, profile_top=0)
+
+    optimized = optimize_code(code, df.copy(), runner=runner)
+    assert optimized.rewrites and calls == [code, optimized.code]
+    print("Validation runner OK")
+
+def test_unsafe_code_is_kept():
+    df = _frame()
+    # Running maximum: not a sum, count, append or column assignment
+    code = """best = None
+for _, row in df.iterrows():
+    if best is None or row['power'] > best:
+        best = row['power']
+result = best"""
+    assert optimize_code(code, df).code == code
+
+    # Rewrite would change the result: `or` between numbers returns an operand
+    code = "result = df.apply(lambda r: r['power'] or r['freq'], axis=1).sum()"
+    assert optimize_code(code, df).code == code
+    print("Unsafe code kept OK")
+
+def test_referenced_columns():
+    columns = ["power", "freq", "protocolType", "sectorid", "timestamp"]
+    code = """filtered = df[df['sectorid'] == 3]
+fig = px.line(filtered, x='timestamp', y='power', title='Potencia')
+result = fig"""
+    assert extract_referenced_columns(code, columns) == ["power", "sectorid", "timestamp"]
+    assert extract_referenced_columns("result = df.groupby('protocolType')['freq'].mean()", columns) == ["freq", "protocolType"]
+    assert extract_referenced_columns("result = len(df)", columns) == []
+
+    chunked = """def map_chunk(chunk):
+    return chunk.groupby('sectorid')['power'].sum()
+
+def reduce_partials(partials):
+    return merge_partials(partials, 'sum')"""
+    assert extract_referenced_columns(chunked, columns) == ["power", "sectorid"]
+
+    helpers = "result = per_interval(df, 'timestamp', '1min', by='sectorid', value='power', agg='max')"
+    assert extract_referenced_columns(helpers, columns) == ["power", "sectorid", "timestamp"]
+
+    window = "w = time_index.slice(df, '2025-10-09 16:52', None, sector=2)\nresult = w['power'].max()"
+    assert extract_referenced_columns(window, columns) == ["power"]
+
+    assert extract_referenced_columns("result = px.scatter(df, 'freq', 'power')", columns) == ["power", "freq"]
+
+    # The whole frame (or columns chosen at runtime) is needed
+    for code in ("result = df[df['power'] > -50]", "result = df.describe()",
+                 "col = 'power'\nresult = df[col].max()", "result = df.groupby('sectorid').mean()",
+                 "result = px.line(df)", "result = px.box(df, color='sectorid')", "result = px.imshow(df)",
+                 "result = px.scatter_matrix(df, color='sectorid')", "result = px.parallel_coordinates(df)"):
+        assert extract_referenced_columns(code, columns) is None, code
+    print("Referenced columns OK")
+
+def test_wide_form_plots_are_not_projected():
+    import plotly.express as px
+    df = _frame(50)[["power", "freq"]]
+    dimensions = lambda fig: [len(getattr(trace, "dimensions", None) or ()) for trace in fig.data]
+    for code in ("result = px.line(df)", "result = px.scatter_matrix(df)"):
+        # Projected the way the app does it: only with a non-empty column list
+        columns = extract_referenced_columns(code, df.columns)
+        assert columns is None, code
+        projected = df[columns] if columns else df
+        full = execute_code(code, df, {"px": px}).result
+        result = execute_code(code, projected, {"px": px}).result
+        assert len(result.data) == len(full.data), code
+        assert dimensions(result) == dimensions(full), code
+        # Both columns are plotted: two lines, or one matrix of two dimensions
+        assert len(full.data) == 2 or dimensions(full) == [2], code
+    print("Wide-form plots OK")
+
+if __name__ == "__main__":
+    test_apply_axis1_rewrite()
+    test_row_loop_rewrite()
+    test_loop_sum_keeps_nan()
+    test_validation_uses_given_runner()
+    test_unsafe_code_is_kept()
+    test_referenced_columns()
+    test_wide_form_plots_are_not_projected()
@@ -1,9 +1,13 @@
 import sys
 import os
+import io
+import tempfile
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.csv_loader import load_csv
-from src.schema_analyzer import analyze_schema, generate_schema_description
+from src import csv_loader
+from src.csv_loader import load_csv, sniff_csv, extract_list_columns, iter_csv_chunks, IncrementalCSVReader
+from src.code_executor import execute_code, execute_chunked, get_executor_stats, cached_result, store_result, clear_executor_caches
+from src.schema_analyzer import analyze_schema, generate_schema_description, SchemaStats, estimate_tokens
 
 def test_loader_and_analyzer():
     csv_path = os.path.join('tests', 'sample_data', 'test_sample.csv')
@@ -37,5 +41,254 @@ def test_loader_and_analyzer():
     except Exception as e:
         print(f"❌ Generate Description Failed: {e}")
 
+def test_sniffer_latin1_semicolon():
+    data = 'fecha;ciudad;"valor; x"\n2024-01-01;Logroño;1,5\n2024-01-02;Cádiz;2\n'.encode('latin-1')
+
+    dialect = sniff_csv(io.BytesIO(data))
+    assert dialect.encoding == 'latin-1'
+    assert dialect.sep == ';'
+    assert dialect.n_cols == 3
+
+    df = load_csv(io.BytesIO(data))
+    assert list(df.columns) == ['fecha', 'ciudad', 'valor; x']
+    assert df['ciudad'].tolist() == ['Logroño', 'Cádiz']
+    print("✅ Sniffer Success")
+
+def test_latin1_outside_sample():
+    # Accented bytes only in the middle: head and tail samples look like UTF-8
+    rows = ["2024-01-01;Madrid;1"] * 20000 + ["2024-01-02;Año;2"] + ["2024-01-03;Soria;3"] * 20000
+    data = ("fecha;ciudad;valor\n" + "\n".join(rows) + "\n").encode('latin-1')
+    assert sniff_csv(io.BytesIO(data)).encoding == 'utf-8'
+
+    df = load_csv(io.BytesIO(data))
+    assert df['ciudad'].iloc[20000] == 'Año' and df.attrs["encoding"] == 'latin-1'
+    chunks = list(iter_csv_chunks(io.BytesIO(data), chunksize=15000))
+    assert [value for chunk in chunks for value in chunk['ciudad']][20000] == 'Año'
+
+    # The settled encoding is reused instead of decoding the whole file again
+    scans = []
+    is_utf8_stream = csv_loader._is_utf8_stream
+    csv_loader._is_utf8_stream = lambda file, *args: scans.append(file) or is_utf8_stream(file, *args)
+    try:
+        reader = IncrementalCSVReader()
+        reader.load_bytes(data)
+        assert reader._dialect.encoding == 'latin-1' and not scans
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ciudades.csv')
+            with open(path, 'wb') as f:
+                f.write(data)
+            for _ in range(2):
+                chunks = list(iter_csv_chunks(path, chunksize=15000))
+                assert [value for chunk in chunks for value in chunk['ciudad']][20000] == 'Año'
+            # One decode of the file, for the first stream only
+            assert scans.count(path) == 1
+    finally:
+        csv_loader._is_utf8_stream = is_utf8_stream
+    print("✅ Latin-1 fallback Success")
+
+def test_datetime_detection():
+    data = (
+        b"time,fecha,uuid\n"
+        b"2025-10-09 16:52:17.671537,09/10/2025,01K74Q9F7FRKSD02HP7XVWPHY2\n"
+        b"2025-10-09 16:52:18,13/10/2025,01K74Q9F7FRKSD02HP7XVWPHY3\n"
+    )
+    df = load_csv(io.BytesIO(data))
+    assert str(df['time'].dtype) == 'datetime64[ns]'
+    assert df['fecha'].dt.day.tolist() == [9, 13]
+    # ULIDs must not be mistaken for dates
+    assert df['uuid'].dtype == 'object'
+    print("✅ Datetime Detection Success")
+
+def test_datetime_format_cache_is_per_content():
+    first = io.BytesIO(b"id,fecha\n1,pendiente\n2,pendiente\n")
+    first.name = "subida.csv"
+    assert load_csv(first)['fecha'].dtype == 'object'
+
+    # Same name, other contents: detected again
+    second = io.BytesIO(b"id,fecha\n1,25/12/2025\n2,26/12/2025\n")
+    second.name = "subida.csv"
+    assert load_csv(second)['fecha'].dt.day.tolist() == [25, 26]
+    print("✅ Datetime Format Cache Success")
+
+def test_list_literal_columns():
+    data = b'scalar,multi\n[-1],"[1, 2.5]"\n[],[]\n[3],[-3]\n'
+    df = load_csv(io.BytesIO(data))
+    # Lists with at most one value become plain floats
+    assert df['scalar'].dtype == 'float64'
+    assert df['scalar'].isna().tolist() == [False, True, False]
+
+    list_columns = extract_list_columns(df)
+    assert list(list_columns) == ['multi']
+    multi = list_columns['multi']
+    assert multi.lengths().tolist() == [2, 0, 1]
+    assert multi.values.tolist() == [1.0, 2.5, -3.0]
+
+    res = execute_code("result = list_columns['multi'].reduce('max').sum()", df, {"list_columns": list_columns})
+    assert res.success and res.result == -0.5
+    print("✅ List Columns Success")
+
+def test_chunked_execution():
+    csv_path = os.path.join('tests', 'sample_data', 'test_sample.csv')
+    code = """
+def map_chunk(chunk):
+    return chunk.groupby('sectorid')['power'].agg(['sum', 'count'])
+
+def reduce_partials(partials):
+    return merge_partials(partials, 'sum')
+
+def finalize(partial):
+    return partial['sum'] / partial['count']
+"""
+    res = execute_chunked(code, iter_csv_chunks(csv_path, chunksize=7), fold_every=2)
+    assert res.success, res.error
+
+    # Only the referenced columns parsed
+    projected = next(iter_csv_chunks(csv_path, chunksize=7, columns=['power', 'sectorid']))
+    assert sorted(projected.columns) == ['power', 'sectorid']
+    res_projected = execute_chunked(code, iter_csv_chunks(csv_path, chunksize=7, columns=['power', 'sectorid']))
+    assert (res_projected.result - res.result).abs().max() < 1e-9
+
+    expected = load_csv(csv_path).groupby('sectorid')['power'].mean()
+    assert (res.result - expected).abs().max() < 1e-9
+    print("✅ Chunked Execution Success")
+
+def test_copy_on_write_execution():
+    import pandas as pd
+    df = pd.DataFrame({"power": [1.0, 2.0, 3.0], "other": [4.0, 5.0, 6.0], "sector": ["a", "b", "a"]})
+    code = """
+df.loc[df['power'] > 1, 'power'] = 0
+df['sector'] = df['sector'].str.upper()
+df['new'] = 1
+result = df['power'].sum()
+"""
+    res = execute_code(code, df)
+    assert res.success, res.error
+    assert res.result == 1.0
+    assert res.mutated_columns == ['power', 'sector', 'new']
+    # The caller's frame is untouched
+    assert df['power'].tolist() == [1.0, 2.0, 3.0] and list(df.columns) == ['power', 'other', 'sector']
+
+    res = execute_code("result = df['other'].max()", df)
+    assert res.result == 6.0 and res.mutated_columns == []
+
+    # Only on while generated code runs: the rest of the process keeps its setting
+    res = execute_code("result = pd.get_option('mode.copy_on_write')", df)
+    assert res.success and res.result is True
+    assert pd.get_option("mode.copy_on_write") is False
+    print("✅ Copy-on-write Execution Success")
+
+def test_execution_memoization():
+    import pandas as pd
+    df = pd.DataFrame({"power": [1.0, 2.0, 3.0]})
+    code = "result = df['power'].sum()"
+    before = get_executor_stats()
+
+    first = execute_code(code, df, data_version="memo-v1")
+    # Different data under the same version would still give the stored result
+    second = execute_code(code, df * 10, data_version="memo-v1")
+    third = execute_code(code, df * 10, data_version="memo-v2")
+    assert (first.result, second.result, third.result) == (6.0, 6.0, 60.0)
+
+    after = get_executor_stats()
+    assert after["result_hits"] == before["result_hits"] + 1
+    assert after["compile_hits"] >= before["compile_hits"] + 1
+    assert after["result_bytes"] > before["result_bytes"]
+
+    # Least recently used results are dropped beyond the byte budget (64 bytes per scalar)
+    clear_executor_caches()
+    for i in range(4):
+        store_result(f"result = {i}", "memo-v3", execute_code(f"result = {i}", df), max_bytes=256)
+    assert cached_result("result = 0", "memo-v3") is not None
+    store_result("result = 4", "memo-v3", execute_code("result = 4", df), max_bytes=256)
+    assert cached_result("result = 1", "memo-v3") is None
+    assert cached_result("result = 0", "memo-v3").result == 0
+    assert get_executor_stats()["result_bytes"] == 256
+    print("✅ Execution Memoization Success")
+
+def test_execution_profile():
+    import pandas as pd
+    df = pd.DataFrame({"power": range(1000), "sector": [i % 7 for i in range(1000)]})
+    res = execute_code("result = df.groupby('sector')['power'].apply(lambda s: s.max() - s.min())", df, profile_top=5)
+    assert res.success, res.error
+    profile = res.profile
+    assert profile["wall_time"] > 0 and profile["cpu_time"] >= 0
+    assert profile["peak_bytes"] > 0 and profile["result_bytes"] > 0
+    assert 0 < len(profile["top"]) <= 5 and {"function", "calls", "cumtime"} <= set(profile["top"][0])
+
+    res = execute_code("result = 1 / 0", df)
+    assert not res.success and "wall_time" in res.profile and "top" not in res.profile
+    print("✅ Execution Profile Success")
+
+def test_overlapping_profiles_keep_peak():
+    from src.code_executor import RunProfile
+    first = RunProfile()
+    with first:
+        block = bytearray(8 * 1024 ** 2)
+        del block
+        # A run starting in another thread resets the process-wide peak
+        with RunProfile() as second:
+            pass
+    assert first.profile["peak_bytes"] >= 8 * 1024 ** 2
+    assert second.profile["peak_bytes"] < 8 * 1024 ** 2
+    print("✅ Overlapping Profiles Success")
+
+def test_sampled_profiling():
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(1)
+    n = 50_000
+    df = pd.DataFrame({
+        "id": np.arange(n),
+        "sector": rng.integers(1, 5, n).astype('int32'),
+        "power": np.where(rng.random(n) < 0.1, np.nan, rng.normal(size=n)),
+    })
+
+    schema = SchemaStats.from_frame(df, sample_threshold=10_000, sample_rows=5_000).to_dict()
+    cols = {c["name"]: c for c in schema["columns"]}
+    assert schema["sampled_rows"] == 5_000
+
+    # Exact fields still cover every row
+    assert cols["power"]["null_count"] == int(df["power"].isna().sum())
+    assert cols["id"]["max"] == str(n - 1)
+
+    # Estimated fields are flagged
+    assert "unique_count" in cols["id"]["approximate"]
+    assert cols["sector"]["unique_count"] == 4
+    assert abs(cols["id"]["unique_count"] - n) < n * 0.05
+    assert len(cols["sector"]["samples"]) == 4
+
+    # A block above the threshold but smaller than the sample is profiled exactly
+    small = SchemaStats.from_frame(df.head(8_000), sample_threshold=5_000, sample_rows=10_000).to_dict()
+    assert "sampled_rows" not in small
+    assert {c["name"]: c for c in small["columns"]}["id"]["unique_count"] == 8_000
+    print("✅ Sampled Profiling Success")
+
+def test_schema_token_budget():
+    df = load_csv(os.path.join(os.path.dirname(__file__), '..', 'detecciones_vivas.csv'), compact=True)
+
+    desc = generate_schema_description(df)
+    assert "All-null columns (34)" in desc
+    assert "- drone_latitude (" not in desc
+
+    small = generate_schema_description(df, question="potencia por sectorid", token_budget=100)
+    assert estimate_tokens(small) <= 100
+    # The column named in the question keeps its details
+    assert "- sectorid (int32)" in small
+    assert "protocolType" in small
+    print("✅ Schema Token Budget Success")
+
 if __name__ == "__main__":
     test_loader_and_analyzer()
+    test_sniffer_latin1_semicolon()
+    test_latin1_outside_sample()
+    test_datetime_detection()
+    test_datetime_format_cache_is_per_content()
+    test_list_literal_columns()
+    test_chunked_execution()
+    test_copy_on_write_execution()
+    test_execution_memoization()
+    test_execution_profile()
+    test_overlapping_profiles_keep_peak()
+    test_sampled_profiling()
+    test_schema_token_budget()
@@ -0,0 +1,130 @@
+import sys
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.execution_pool import ExecutionPool, SharedFrame, resource
+from src.csv_loader import extract_list_columns
+from src.time_index import build_time_index
+
+def _frame():
+    return pd.DataFrame({
+        "power": np.arange(10, dtype="float32"),
+        "timestamp": pd.date_range("2024-01-01", periods=10, freq="h"),
+        "sector": pd.Categorical(["a", "b"] * 5),
+        "alarm": pd.arrays.SparseArray([np.nan] * 8 + [1.0, 2.0]),
+        "name": list("abcdefghij"),
+    })
+
+def test_isolated_roundtrip():
+    pool = ExecutionPool(size=1, timeout=20)
+    try:
+        df = _frame()
+        code = ("df['power'] = df['power'] * 2\n"
+                "result = (df['power'].sum(), df['alarm'].sum(), df['sector'].value_counts()['a'], "
+                "df['name'].iloc[3], df['timestamp'].max())")
+        res = pool.execute(code, df=df, frame_key="roundtrip")
+        assert res.success, res.error
+        assert res.result == (90.0, 3.0, 5, "d", pd.Timestamp("2024-01-01 09:00"))
+
+        # The worker reuses its mapping and the previous run's changes are gone
+        res = pool.execute("result = df['power'].sum()", df=df, frame_key="roundtrip")
+        assert res.success and res.result == 45.0
+        assert df["power"].sum() == 45.0
+
+        # Sparse columns stay sparse, with the same stored values
+        res = pool.execute("result = (str(df['alarm'].dtype), df['alarm'].array.sp_values.tolist())",
+                           df=df, frame_key="roundtrip")
+        assert res.success and res.result == ("Sparse[float64, nan]", [1.0, 2.0])
+    finally:
+        pool.close()
+    print("Isolated execution OK")
+
+def test_timeout_recycles_worker():
+    pool = ExecutionPool(size=1, timeout=3)
+    try:
+        df = _frame()
+        res = pool.execute("while True:\n    pass", df=df, frame_key="timeout")
+        assert not res.success and "TimeoutError" in res.error
+        assert pool.stats["timeouts"] == 1 and pool.stats["recycled"] == 1
+
+        # The replacement worker maps the frame again
+        res = pool.execute("result = len(df)", df=df, frame_key="timeout")
+        assert res.success and res.result == 10
+    finally:
+        pool.close()
+    print("Execution timeout OK")
+
+def test_cancel_stops_run():
+    pool = ExecutionPool(size=1, timeout=20)
+    try:
+        df = _frame()
+        cancel = threading.Event()
+        threading.Timer(1.0, cancel.set).start()
+        start = time.monotonic()
+        res = pool.execute("while True:\n    pass", df=df, frame_key="cancel", cancel=cancel)
+        assert not res.success and "CancelledError" in res.error
+        assert time.monotonic() - start < 10
+        assert pool.stats["cancelled"] == 1 and pool.stats["recycled"] == 1
+
+        # A run cancelled before a worker is free does not start
+        res = pool.execute("result = len(df)", df=df, frame_key="cancel", cancel=cancel)
+        assert not res.success and "CancelledError" in res.error
+        res = pool.execute("result = len(df)", df=df, frame_key="cancel")
+        assert res.success and res.result == 10
+    finally:
+        pool.close()
+    print("Execution cancel OK")
+
+def test_frame_globals_are_published_once():
+    df = _frame()
+    df["readings"] = ["[1, 2]", "[3]", "[]", "[4, 5, 6]", "[7]"] * 2
+    frame_globals = {"list_columns": extract_list_columns(df), "time_index": build_time_index(df)}
+    df = df.drop(columns="readings")
+
+    # The index arrays live in shared memory, not in the pickled metadata
+    shared = SharedFrame(df, frame_globals)
+    try:
+        assert len(shared.meta["globals"]["buffers"]) >= 3
+        assert len(shared.meta["globals"]["pickled"]) < 4096
+    finally:
+        shared.release()
+
+    pool = ExecutionPool(size=1, timeout=20)
+    try:
+        code = ("result = (list_columns['readings'].reduce('sum').sum(), "
+                "len(time_index.slice(df, '2024-01-01 02:00', '2024-01-01 05:00')))")
+        res = pool.execute(code, df=df, frame_key="globals", frame_globals=frame_globals)
+        assert res.success, res.error
+        assert res.result == (56.0, 3)
+    finally:
+        pool.close()
+    print("Frame globals OK")
+
+def test_memory_limit_stops_run():
+    if resource is None:
+        print("Memory limit not available on this platform, skipped")
+        return
+    pool = ExecutionPool(size=1, timeout=20, memory_limit=256 * 1024 ** 2)
+    try:
+        res = pool.execute("big = np.ones(2 * 1024 ** 3 // 8)\nresult = big.sum()", df=_frame(), frame_key="memory")
+        assert not res.success and "MemoryError" in res.error
+
+        # The worker survives and the next run gets a fresh budget
+        res = pool.execute("result = len(np.ones(1024 ** 2))", df=_frame(), frame_key="memory")
+        assert res.success and res.result == 1024 ** 2
+    finally:
+        pool.close()
+    print("Memory limit OK")
+
+if __name__ == "__main__":
+    test_isolated_roundtrip()
+    test_timeout_recycles_worker()
+    test_cancel_stops_run()
+    test_frame_globals_are_published_once()
+    test_memory_limit_stops_run()
@@ -0,0 +1,66 @@
+import sys
+import os
+import shutil
+import tempfile
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.csv_loader import load_csv
+from src.frame_cache import FrameCache, fingerprint
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '..', 'detecciones_vivas.csv')
+
+def test_frame_cache_roundtrip():
+    df = load_csv(CSV_PATH, compact=True)
+    key = fingerprint(CSV_PATH, "compact=True")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = FrameCache(cache_dir=tmp)
+        assert cache.get(key) is None
+
+        cache.put(key, df)
+        cached = cache.get(key)
+        assert cached is not None
+        assert cached.attrs["memory_report"] == df.attrs["memory_report"]
+        # Numeric columns are views on the memory-mapped files, not fresh copies
+        assert not cached['power'].to_numpy().flags.owndata
+        pd.testing.assert_frame_equal(cached.copy(), df)
+
+        subset = cache.get(key, columns=['time', 'power'])
+        assert list(subset.columns) == ['time', 'power']
+
+        # Eviction drops least recently used entries beyond the size limit
+        cache.max_bytes = 0
+        cache.evict()
+        assert cache.get(key) is None
+
+    print("Frame cache OK")
+
+def test_undeletable_entry_is_retried():
+    df = load_csv(CSV_PATH)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = FrameCache(cache_dir=tmp)
+        cache.put("a", df)
+
+        # Files still mapped elsewhere (Windows): the directory survives the eviction
+        rmtree = shutil.rmtree
+        shutil.rmtree = lambda path, ignore_errors=False: None
+        try:
+            cache.max_bytes = 0
+            cache.evict()
+        finally:
+            shutil.rmtree = rmtree
+        assert os.path.isdir(os.path.join(tmp, "a"))
+        assert cache.get("a") is None
+
+        # Once released, the next eviction removes it
+        cache.evict()
+        assert not os.path.exists(os.path.join(tmp, "a"))
+
+    print("Undeletable entry retried OK")
+
+if __name__ == "__main__":
+    test_frame_cache_roundtrip()
+    test_undeletable_entry_is_retried()
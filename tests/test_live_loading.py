@@ -0,0 +1,225 @@
+import sys
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.csv_loader import load_csv, IncrementalCSVReader, extract_list_columns, extend_list_columns
+from src.schema_analyzer import SchemaStats, analyze_schema
+from src import frame_cache
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '..', 'detecciones_vivas.csv')
+
+def _read_lines():
+    with open(CSV_PATH, 'rb') as f:
+        return f.read().splitlines(keepends=True)
+
+def test_incremental_reader_appends():
+    lines = _read_lines()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'live.csv')
+        with open(path, 'wb') as f:
+            f.writelines(lines[:20])
+
+        reader = IncrementalCSVReader(path)
+        df = reader.load()
+        assert len(df) == 19
+
+        # Half-written last line must wait for its newline
+        with open(path, 'ab') as f:
+            f.writelines(lines[20:30])
+            f.write(lines[30][:25])
+        df = reader.refresh()
+        assert len(reader.last_delta) == 10
+        assert not reader.last_reset
+
+        with open(path, 'ab') as f:
+            f.write(lines[30][25:])
+            f.writelines(lines[31:])
+        df = reader.refresh()
+        pd.testing.assert_frame_equal(df, load_csv(path))
+
+        # Nothing new
+        reader.refresh()
+        assert len(reader.last_delta) == 0
+
+        # Truncated file forces a full reload
+        with open(path, 'wb') as f:
+            f.writelines(lines[:5])
+        df = reader.refresh()
+        assert reader.last_reset
+        assert len(df) == 4
+
+    print("Incremental reader OK")
+
+def test_compacted_reader_keeps_dtypes():
+    lines = _read_lines()
+    full = load_csv(CSV_PATH, compact=True)
+    report = full.attrs["memory_report"]
+    assert report["after_bytes"] < report["before_bytes"]
+    assert str(full['protocolType'].dtype) == 'category'
+    assert str(full['power'].dtype) == 'float32'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'live.csv')
+        with open(path, 'wb') as f:
+            f.writelines(lines[:10])
+
+        reader = IncrementalCSVReader(path, compact=True)
+        reader.load()
+        with open(path, 'ab') as f:
+            f.writelines(lines[10:])
+        df = reader.refresh()
+
+        assert not reader.last_reset
+        pd.testing.assert_frame_equal(df, full, check_categorical=False)
+
+    print("Compacted reader OK")
+
+def test_appends_do_not_copy_loaded_rows():
+    lines = _read_lines()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'live.csv')
+        with open(path, 'wb') as f:
+            f.writelines(lines[:10])
+
+        reader = IncrementalCSVReader(path, compact=True)
+        reader.load()
+        with open(path, 'ab') as f:
+            f.writelines(lines[10:30])
+        first = reader.refresh()
+        before = first.copy()
+
+        with open(path, 'ab') as f:
+            f.writelines(lines[30:])
+            # New category
+            f.write(lines[1].replace(b'Skylink', b'Nuevo'))
+        second = reader.refresh()
+
+        # The second frame extends the arrays of the first, which does not change
+        assert np.shares_memory(second['power'].to_numpy(), first['power'].to_numpy())
+        pd.testing.assert_frame_equal(first, before)
+        assert second['protocolType'].iloc[-1] == 'Nuevo'
+        pd.testing.assert_frame_equal(second, load_csv(path, compact=True), check_categorical=False)
+
+    print("Appends without copies OK")
+
+def test_schema_stats_follow_appends():
+    lines = _read_lines()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'live.csv')
+        with open(path, 'wb') as f:
+            f.writelines(lines[:15])
+
+        reader = IncrementalCSVReader(path, compact=True)
+        stats = SchemaStats.from_frame(reader.load())
+        with open(path, 'ab') as f:
+            f.writelines(lines[15:])
+        df = reader.refresh()
+        stats.update(reader.last_delta)
+
+        # Same statistics as profiling the whole frame again
+        assert stats.to_dict() == analyze_schema(df)
+
+    print("Incremental schema stats OK")
+
+def test_list_columns_follow_appends():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'live.csv')
+        with open(path, 'w') as f:
+            f.write('time,readings,tags\n2025-10-09 00:00:00,"[1, 2]",[1]\n2025-10-09 00:00:01,[],"[2, 3]"\n')
+
+        reader = IncrementalCSVReader(path)
+        list_columns = extract_list_columns(reader.load())
+        assert list(list_columns) == ['readings', 'tags']
+        with open(path, 'a') as f:
+            f.write('2025-10-09 00:00:02,"[3, 4.5, 5]",[4]\n2025-10-09 00:00:03,,ninguna\n')
+        df = reader.refresh()
+        list_columns = extend_list_columns(list_columns, df, reader.last_delta)
+
+        # Same columns and values as parsing every row again
+        expected = extract_list_columns(df)
+        assert list(list_columns) == list(expected) == ['readings']
+        readings = list_columns['readings']
+        assert readings.values.tolist() == expected['readings'].values.tolist() == [1, 2, 3, 4.5, 5]
+        assert readings.lengths().tolist() == [2, 0, 3, 0]
+        assert readings.index.equals(df.index)
+
+        # Nothing appended
+        assert extend_list_columns(list_columns, df, df.iloc[0:0])['readings'].offsets is readings.offsets
+
+    print("Incremental list columns OK")
+
+def test_partial_last_row_is_reported_as_replaced():
+    lines = _read_lines()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'live.csv')
+        with open(path, 'wb') as f:
+            f.writelines(lines[:19])
+            f.write(lines[19][:25])
+
+        reader = IncrementalCSVReader(path, compact=True)
+        stats = SchemaStats.from_frame(reader.load())
+        assert stats.row_count == 19 and reader.last_dropped == 0
+
+        with open(path, 'ab') as f:
+            f.write(lines[19][25:])
+            f.writelines(lines[20:])
+        df = reader.refresh()
+        # The partial row was parsed again in the delta: the stats must not just add it
+        assert reader.last_dropped == 1 and len(reader.last_delta) == len(df) - 18
+        if reader.last_dropped:
+            stats = SchemaStats.from_frame(df)
+        assert stats.to_dict() == analyze_schema(df)
+
+        with open(path, 'ab') as f:
+            f.write(lines[-1])
+        reader.refresh()
+        assert reader.last_dropped == 0
+
+    print("Replaced partial row OK")
+
+def test_cached_load_matches_full_read():
+    lines = _read_lines()
+    # Larger than the sniffed head, so the last line is found from the end
+    body = lines[1:] * 10
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'live.csv')
+        with open(path, 'wb') as f:
+            f.writelines([lines[0]] + body)
+            f.write(lines[1][:25])
+
+        previous = frame_cache._DEFAULT_CACHE
+        frame_cache._DEFAULT_CACHE = frame_cache.FrameCache(cache_dir=os.path.join(tmp, 'cache'))
+        try:
+            cold = IncrementalCSVReader(path, cache=True)
+            cold.load()
+            warm = IncrementalCSVReader(path, cache=True)
+            warm.load()
+            assert frame_cache._DEFAULT_CACHE.hits == 1
+        finally:
+            frame_cache._DEFAULT_CACHE = previous
+
+        assert (warm.header, warm.offset, warm.size, warm._tail_rows) == \
+            (cold.header, cold.offset, cold.size, cold._tail_rows)
+        assert warm._dialect.sep == cold._dialect.sep
+
+        with open(path, 'ab') as f:
+            f.write(lines[1][25:])
+            f.writelines(lines[2:])
+        pd.testing.assert_frame_equal(warm.refresh().copy(), cold.refresh().copy())
+        assert len(warm.df) == len(body) + len(lines) - 1
+
+    print("Cached reader load OK")
+
+if __name__ == "__main__":
+    test_incremental_reader_appends()
+    test_compacted_reader_keeps_dtypes()
+    test_appends_do_not_copy_loaded_rows()
+    test_schema_stats_follow_appends()
+    test_list_columns_follow_appends()
+    test_partial_last_row_is_reported_as_replaced()
+    test_cached_load_matches_full_read()
@@ -0,0 +1,153 @@
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.llm_cache import ResponseCache, make_key
+from src import llm_client
+from src.llm_client import LLMClient, extract_code, close_groq_clients
+
+class _FakeStream:
+    """Streamed completion yielding the given tokens."""
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.sent = 0
+        self.closed = False
+
+    async def __aiter__(self):
+        for token in self.tokens:
+            self.sent += 1
+            delta = type("Delta", (), {"content": token})
+            choice = type("Choice", (), {"delta": delta})
+            yield type("Chunk", (), {"choices": [choice]})
+
+    async def close(self):
+        self.closed = True
+
+class _FakeCompletions:
+    """Stands in for the Groq API: counts calls and echoes the prompt."""
+    def __init__(self, tokens=None):
+        self.calls = 0
+        self.tokens = tokens
+        self.stream = None
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        tokens = self.tokens or [f"result = {len(messages[-1]['content'])}"]
+        self.stream = _FakeStream(tokens)
+        return self.stream
+
+def _fake_client(completions):
+    return type("Client", (), {"chat": type("Chat", (), {"completions": completions})})
+
+def test_response_cache_ttl_and_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, 'llm.sqlite'), ttl=3600, max_bytes=100)
+        key = make_key("model", "system", "¿Cuántas filas hay?")
+        assert key != make_key("model", "system 2", "¿Cuántas filas hay?")
+
+        cache.put(key, "result = len(df)")
+        assert cache.get(key) == "result = len(df)"
+        assert cache.get(make_key("model", "system", "otra")) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # Least recently used entries go first when over max_bytes
+        cache.put("a", "x" * 40)
+        cache.put("b", "y" * 40)
+        cache.get("a")
+        cache.put("c", "z" * 40)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["bytes"] <= 100
+
+        expired = ResponseCache(cache.path, ttl=0)
+        time.sleep(0.01)
+        assert expired.get("a") is None
+
+    print("Response cache OK")
+
+def test_llm_client_uses_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, 'llm.sqlite'))
+        llm = LLMClient(api_key="test", cache=cache)
+        fake = _FakeCompletions()
+        llm.async_client.client = _fake_client(fake)
+
+        first = llm.query("¿Cuántas filas hay?", system="schema")
+        second = llm.query("¿Cuántas filas hay?", system="schema")
+        assert first == second
+        assert fake.calls == 1
+
+        # Another schema is another question
+        llm.query("¿Cuántas filas hay?", system="other schema")
+        assert fake.calls == 2
+
+        llm.forget("¿Cuántas filas hay?", system="schema")
+        llm.query("¿Cuántas filas hay?", system="schema")
+        assert fake.calls == 3
+
+    print("LLM client cache OK")
+
+def test_stream_stops_at_closing_fence():
+    tokens = ["```py", "thon\nresult = ", "len(df)\n", "```\nEsta línea", " sobra.", " Y esta."]
+    llm = LLMClient(api_key="test")
+    fake = _FakeCompletions(tokens)
+    llm.async_client.client = _fake_client(fake)
+
+    streamed = list(llm.stream_query("¿Cuántas filas hay?"))
+    assert "".join(streamed) == "```python\nresult = len(df)\n```"
+    # The rest of the completion is not read
+    assert fake.stream.sent == 4
+    assert fake.stream.closed
+
+    assert extract_code("".join(streamed)) == "result = len(df)"
+    assert extract_code("```python\nresult = le") == "result = le"
+    assert extract_code("result = 1") == "result = 1"
+    print("Streaming OK")
+
+class _SilentStream(_FakeStream):
+    """A completion that never sends a token."""
+    async def __aiter__(self):
+        await asyncio.sleep(60)
+        yield
+
+class _SilentCompletions(_FakeCompletions):
+    async def create(self, messages, **kwargs):
+        self.stream = _SilentStream([])
+        return self.stream
+
+def test_groq_client_is_shared_and_reads_time_out():
+    first, second = LLMClient(api_key="shared-key"), LLMClient(api_key="shared-key")
+    assert first.async_client.client is second.async_client.client
+    assert LLMClient(api_key="other-key").async_client.client is not first.async_client.client
+
+    previous = llm_client.TOKEN_TIMEOUT
+    llm_client.TOKEN_TIMEOUT = 0.5
+    try:
+        fake = _SilentCompletions()
+        first.async_client.client = _fake_client(fake)
+        try:
+            first.query("¿Cuántas filas hay?")
+            assert False, "expected TimeoutError"
+        except TimeoutError:
+            pass
+    finally:
+        llm_client.TOKEN_TIMEOUT = previous
+    # The abandoned request is cancelled and its stream closed
+    time.sleep(0.2)
+    assert fake.stream.closed
+
+    shared = second.async_client.client
+    close_groq_clients()
+    assert LLMClient(api_key="shared-key").async_client.client is not shared
+    print("Shared LLM client OK")
+
+if __name__ == "__main__":
+    test_response_cache_ttl_and_eviction()
+    test_llm_client_uses_cache()
+    test_stream_stops_at_closing_fence()
+    test_groq_client_is_shared_and_reads_time_out()
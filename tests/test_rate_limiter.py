@@ -0,0 +1,82 @@
+import sys
+import os
+import time
+import asyncio
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.rate_limiter import RateLimiter, TokenBucket
+from src.llm_client import LLMClient
+
+def _fast_limiter():
+    # 10 requests per second instead of per minute, to keep the test short
+    limiter = RateLimiter()
+    limiter.requests = TokenBucket(2, period=0.2)
+    limiter.tokens = TokenBucket(1000, period=0.2)
+    return limiter
+
+def test_limiter_queues_in_order():
+    limiter = _fast_limiter()
+    served = []
+
+    async def request(i):
+        await limiter.acquire(10)
+        served.append(i)
+
+    async def main():
+        await asyncio.gather(*(request(i) for i in range(6)))
+
+    start = time.monotonic()
+    asyncio.run(main())
+    elapsed = time.monotonic() - start
+
+    assert served == list(range(6))
+    # 2 requests available at once, then one every 0.1 s
+    assert elapsed >= 0.35
+
+    limiter.pause(0.2)
+    start = time.monotonic()
+    asyncio.run(limiter.acquire(1))
+    assert time.monotonic() - start >= 0.15
+    print("Rate limiter OK")
+
+class _RateLimitError(Exception):
+    def __init__(self):
+        super().__init__("Error code: 429 - rate limit reached")
+        self.response = type("Response", (), {"headers": {"retry-after": "0.2"}})
+
+class _FlakyCompletions:
+    """Fails with a 429 the first time, then streams one token."""
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise _RateLimitError()
+        return _OneTokenStream()
+
+class _OneTokenStream:
+    async def __aiter__(self):
+        delta = type("Delta", (), {"content": "result = 1"})
+        yield type("Chunk", (), {"choices": [type("Choice", (), {"delta": delta})]})
+
+    async def close(self):
+        pass
+
+def test_client_honors_retry_after():
+    llm = LLMClient(api_key="test")
+    llm.async_client.limiter = RateLimiter()
+    fake = _FlakyCompletions()
+    llm.async_client.client = type("Client", (), {"chat": type("Chat", (), {"completions": fake})})
+
+    start = time.monotonic()
+    assert llm.query("¿Cuántas filas hay?") == "result = 1"
+    assert fake.calls == 2
+    assert time.monotonic() - start >= 0.15
+    print("Retry-after OK")
+
+if __name__ == "__main__":
+    test_limiter_queues_in_order()
+    test_client_honors_retry_after()
@@ -0,0 +1,68 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.rf_helpers import per_interval, group_stats, gaps_per_entity, rolling_window, histogram
+from src.code_executor import execute_code
+
+def _detections():
+    times = pd.to_datetime([
+        "2025-10-09 16:52:10", "2025-10-09 16:52:40", "2025-10-09 16:53:05",
+        "2025-10-09 16:52:50", None, "2025-10-09 16:55:00",
+    ])
+    return pd.DataFrame({
+        "time": times,
+        "uuid": ["a", "a", "b", "a", "b", None],
+        "sectorid": [2, 2, 3, 2, 3, 3],
+        "power": [-58.0, -55.0, -54.0, -60.0, -50.0, -40.0],
+    }, index=[10, 11, 12, 13, 14, 15])
+
+def test_interval_and_group_aggregation():
+    df = _detections()
+    counts = per_interval(df, "time", "1min", by="sectorid")
+    assert counts.loc[(2, pd.Timestamp("2025-10-09 16:52"))] == 3
+    assert counts.loc[(3, pd.Timestamp("2025-10-09 16:53"))] == 1
+    assert counts.sum() == 5  # The row without time is left out
+
+    peaks = per_interval(df, "time", "1min", value="power", agg="max")
+    assert peaks.loc[pd.Timestamp("2025-10-09 16:52")] == -55.0
+
+    stats = group_stats(df, "sectorid", "power")
+    assert list(stats.columns) == ["count", "mean", "max"]
+    assert stats.loc[3, "max"] == -40.0
+
+    hist = histogram(df, "power", bins=2, range=(-60, -40))
+    assert hist.tolist() == [4, 2] and hist.index[0] == -60
+    print("Interval and group aggregation OK")
+
+def test_gaps_and_rolling_windows():
+    df = _detections()
+    gaps = gaps_per_entity(df, "uuid", "time")
+    assert gaps.index.equals(df.index)
+    assert np.isnan(gaps[10]) and gaps[11] == 30.0 and gaps[13] == 10.0
+    assert np.isnan(gaps[12]) and np.isnan(gaps[14]) and np.isnan(gaps[15])
+
+    rolled = rolling_window(df, "time", "power", "30s", "max", by="sectorid")
+    assert np.isnan(rolled[14])
+    # Row 13 (16:52:50) sees row 11 (16:52:40) but not row 10 (16:52:10)
+    assert rolled.drop(14).to_dict() == {10: -58.0, 11: -55.0, 12: -54.0, 13: -55.0, 15: -40.0}
+
+    overall = rolling_window(df, "time", "power", "1min", "count")
+    assert overall[13] == 3 and overall[15] == 1
+    print("Gaps and rolling windows OK")
+
+def test_helpers_in_generated_code():
+    df = _detections()
+    res = execute_code("result = gaps_per_entity(df, 'uuid', 'time').groupby(df['uuid']).mean()", df)
+    assert res.success, res.error
+    assert res.result["a"] == 20.0
+    print("Helpers in generated code OK")
+
+if __name__ == "__main__":
+    test_interval_and_group_aggregation()
+    test_gaps_and_rolling_windows()
+    test_helpers_in_generated_code()
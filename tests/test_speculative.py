@@ -0,0 +1,61 @@
+import sys
+import os
+import asyncio
+import threading
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.llm_client import LLMClient
+from src.code_executor import execute_code
+from src.speculative import run_speculative, get_speculative_stats
+
+# Code returned per temperature: the deterministic answer is wrong
+CANDIDATES = {
+    0.0: (0.0, "```python\nresult = df['no_existe'].sum()\n```"),
+    0.4: (0.2, "```python\nresult = df['power'].sum()\n```"),
+    0.8: (0.05, "```python\nresult = df['power'].sum()\n```"),
+}
+
+class _Stream:
+    def __init__(self, delay, text):
+        self.delay = delay
+        self.text = text
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.delay)
+        delta = type("Delta", (), {"content": self.text})
+        yield type("Chunk", (), {"choices": [type("Choice", (), {"delta": delta})]})
+
+    async def close(self):
+        pass
+
+class _Completions:
+    async def create(self, messages, temperature=0.0, **kwargs):
+        return _Stream(*CANDIDATES[temperature])
+
+def test_first_successful_candidate_wins():
+    df = pd.DataFrame({"power": [1.0, 2.0, 3.0]})
+    llm = LLMClient(api_key="test")
+    llm.async_client.client = type("Client", (), {"chat": type("Chat", (), {"completions": _Completions()})})
+
+    before = get_speculative_stats()
+    cancel = threading.Event()
+    outcome = run_speculative(llm, "Suma de power", "schema", lambda code: execute_code(code, df), cancel=cancel)
+    # Set for the losing candidates still running
+    assert cancel.is_set()
+
+    assert outcome.success
+    assert outcome.result.result == 6.0
+    # The fastest successful candidate, not the slower one
+    assert outcome.winner == 2
+    assert outcome.code == "result = df['power'].sum()"
+    assert any(i == 0 for i, _ in outcome.errors)
+
+    after = get_speculative_stats()
+    assert after["saved_round_trips"] == before["saved_round_trips"] + 1
+    print("Speculative candidates OK")
+
+if __name__ == "__main__":
+    test_first_successful_candidate_wins()
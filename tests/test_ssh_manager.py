@@ -0,0 +1,199 @@
+import sys
+import os
+import io
+import socket
+import threading
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import ssh_manager
+from src.ssh_manager import SSHManager
+
+class _FakeRemoteFile(io.BytesIO):
+    """SFTP file over in-memory bytes; records where reads started."""
+    def __init__(self, data, reads):
+        super().__init__(data)
+        self.reads = reads
+
+    def prefetch(self, file_size=None):
+        pass
+
+    def read(self, size=-1):
+        self.reads.append(self.tell())
+        return super().read(size)
+
+class _FakeSFTP:
+    """Stands in for paramiko.SFTPClient on a single remote file."""
+    def __init__(self):
+        self.data = b""
+        self.mtime = 0.0
+        self.reads = []
+
+    def stat(self, path):
+        return type("Attr", (), {"st_size": len(self.data), "st_mtime": self.mtime})
+
+    def open(self, path, mode='r'):
+        return _FakeRemoteFile(self.data, self.reads)
+
+    def get_channel(self):
+        return type("Channel", (), {"closed": False})
+
+    def close(self):
+        pass
+
+class _FakeConnection:
+    def __init__(self, sftp):
+        self.sftp = sftp
+        self.lock = threading.RLock()
+
+    def is_alive(self):
+        return True
+
+    def get_sftp(self):
+        return self.sftp
+
+def _manager(sftp):
+    manager = SSHManager()
+    manager._conn = _FakeConnection(sftp)
+    return manager
+
+HEADER = b"time,power\n"
+
+def test_delta_resumes_from_offset():
+    sftp = _FakeSFTP()
+    sftp.data, sftp.mtime = HEADER + b"1,-60\n", 100.0
+    manager = _manager(sftp)
+
+    first = manager.get_file_delta("/logs/live.csv")
+    assert first.reset and first.data == sftp.data and first.size == len(sftp.data)
+
+    offset = first.size
+    sftp.data, sftp.mtime = sftp.data + b"2,-61\n3,-62\n", 101.0
+    sftp.reads.clear()
+    delta = manager.get_file_delta("/logs/live.csv", offset, first.size, first.mtime, HEADER)
+    assert not delta.reset and delta.data == b"2,-61\n3,-62\n"
+    # Only the header check and the appended bytes were read
+    assert sftp.reads == [0, offset]
+
+    # Nothing appended
+    same = manager.get_file_delta("/logs/live.csv", delta.size, delta.size, delta.mtime, HEADER)
+    assert not same.reset and same.data == b""
+    print("Delta resume OK")
+
+def test_delta_resets_on_truncation_and_rotation():
+    sftp = _FakeSFTP()
+    sftp.data, sftp.mtime = HEADER + b"1,-60\n2,-61\n", 100.0
+    manager = _manager(sftp)
+    size = len(sftp.data)
+
+    # Truncated: smaller than the previous size
+    sftp.data, sftp.mtime = HEADER + b"1,-60\n", 101.0
+    truncated = manager.get_file_delta("/logs/live.csv", size, size, 100.0, HEADER)
+    assert truncated.reset and truncated.data == sftp.data
+
+    # Rotated: bigger, but another header
+    sftp.data, sftp.mtime = b"time,power,sector\n1,-60,2\n2,-61,3\n", 102.0
+    rotated = manager.get_file_delta("/logs/live.csv", size, size, 101.0, HEADER)
+    assert rotated.reset and rotated.data == sftp.data
+
+    # Replaced by an older copy of the same size or more
+    sftp.data, sftp.mtime = HEADER + b"1,-60\n2,-61\n3,-62\n", 50.0
+    older = manager.get_file_delta("/logs/live.csv", size, size, 102.0, HEADER)
+    assert older.reset and older.data == sftp.data
+    print("Delta reset OK")
+
+class _FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+class _FakeClient:
+    """Stands in for an authenticated paramiko.SSHClient."""
+    def __init__(self, sftp):
+        self.transport = _FakeTransport()
+        self.sftp = sftp
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def open_sftp(self):
+        return self.sftp
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+class _DroppingSFTP(_FakeSFTP):
+    """SFTP channel whose transport dies on the next stat()."""
+    def __init__(self):
+        super().__init__()
+        self.client = None
+        self.fail = False
+
+    def stat(self, path):
+        if self.fail:
+            self.fail = False
+            self.client.transport.active = False
+            raise socket.error("connection reset")
+        return super().stat(path)
+
+def _pooled_managers(open_client):
+    ssh_manager.close_pool()
+    managers = []
+    for _ in range(2):
+        manager = SSHManager()
+        manager.host, manager.user, manager.password = "sensor", "agent", "secret"
+        manager._open_client = open_client
+        managers.append(manager)
+    return managers
+
+def test_pool_reuses_and_reconnects_once():
+    clients = []
+
+    def open_client():
+        sftp = _DroppingSFTP()
+        sftp.data, sftp.mtime = HEADER, 100.0
+        sftp.client = _FakeClient(sftp)
+        clients.append(sftp.client)
+        return sftp.client
+
+    before = ssh_manager.get_pool_stats()
+    first, second = _pooled_managers(open_client)
+    try:
+        assert first.get_mtime("/logs/live.csv") == 100.0
+        # Another session reuses the same transport
+        assert second.get_mtime("/logs/live.csv") == 100.0
+        assert len(clients) == 1 and second._conn is first._conn
+
+        # The transport drops mid-call: one new handshake, then the call succeeds
+        clients[0].sftp.fail = True
+        delta = first.get_file_delta("/logs/live.csv")
+        assert delta.data == HEADER and len(clients) == 2
+        assert clients[0].closed and not clients[1].closed
+
+        # A failure on a live transport is not retried
+        clients[1].sftp.fail = True
+        clients[1].transport.is_active = lambda: True
+        try:
+            first.get_file_delta("/logs/live.csv")
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+        assert len(clients) == 2
+
+        stats = ssh_manager.get_pool_stats()
+        assert stats["handshakes"] - before["handshakes"] == 2
+        assert stats["reconnects"] - before["reconnects"] == 1
+        assert stats["reused"] - before["reused"] >= 1
+    finally:
+        ssh_manager.close_pool()
+    print("Connection pool OK")
+
+if __name__ == "__main__":
+    test_delta_resumes_from_offset()
+    test_delta_resets_on_truncation_and_rotation()
+    test_pool_reuses_and_reconnects_once()
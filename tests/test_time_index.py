@@ -0,0 +1,120 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+
+# Add src to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.time_index import build_time_index
+from src.code_executor import execute_code
+
+def _detections(times):
+    return pd.DataFrame({
+        "time": pd.to_datetime(times),
+        "sectorid": [2, 3, 2, 3, 2, 3][:len(times)],
+        "power": np.arange(len(times), dtype=float),
+    })
+
+def test_sorted_input_gives_views():
+    df = _detections(["2025-10-09 16:52:00", "2025-10-09 16:52:30", "2025-10-09 16:53:00",
+                      "2025-10-09 16:53:30", "2025-10-09 16:54:00", "2025-10-09 16:54:30"])
+    index = build_time_index(df)
+    assert index.in_order and index.order is None
+    assert index.first == pd.Timestamp("2025-10-09 16:52:00") and index.sectors == [2, 3]
+
+    window = index.slice(df, "2025-10-09 16:52:30", "2025-10-09 16:54:00")
+    assert window.index.tolist() == [1, 2, 3]  # End is excluded
+    assert np.shares_memory(window["power"].to_numpy(), df["power"].to_numpy())
+    assert index.count("2025-10-09 16:53", None) == 4
+    assert index.count(None, "2025-10-09 16:00") == 0
+
+    assert index.slice(df, "2025-10-09 16:52:30", None, sector=3).index.tolist() == [1, 3, 5]
+    assert index.count(sector=7) == 0
+    print("Sorted time index OK")
+
+def test_unsorted_input_and_fallbacks():
+    df = _detections(["2025-10-09 16:54:00", "2025-10-09 16:52:00", None,
+                      "2025-10-09 16:53:00", "2025-10-09 16:52:30", "2025-10-09 16:55:00"])
+    index = build_time_index(df)
+    assert not index.in_order and len(index) == 5
+
+    window = index.slice(df, "2025-10-09 16:52:00", "2025-10-09 16:54:00")
+    assert window.index.tolist() == [1, 4, 3]  # Time order, row without time left out
+    assert index.slice(df, None, None, sector=3).index.tolist() == [1, 3, 5]
+
+    # A column selection keeps the positions; a filtered frame falls back to a mask
+    assert index.slice(df[["time", "power"]], "2025-10-09 16:52:00", "2025-10-09 16:53:00").index.tolist() == [1, 4]
+    filtered = df[df["power"] > 1]
+    assert index.slice(filtered, "2025-10-09 16:52:00", "2025-10-09 16:54:00").index.tolist() == [4, 3]
+
+    assert build_time_index(df.drop(columns="time")) is None
+    print("Unsorted time index OK")
+
+def test_changed_frame_is_not_sliced_with_stale_positions():
+    df = _detections(["2025-10-09 00:00:00", "2025-10-09 00:01:00", "2025-10-09 00:05:00",
+                      "2025-10-09 00:10:00"])
+    index = build_time_index(df)
+
+    # Same length and default index, different rows
+    reordered = df.sort_values("power", ascending=False).reset_index(drop=True)
+    window = index.slice(reordered, "2025-10-09 00:00", "2025-10-09 00:02")
+    assert window["time"].tolist() == [pd.Timestamp("2025-10-09 00:00"), pd.Timestamp("2025-10-09 00:01")]
+
+    shifted = df.copy()
+    shifted["time"] += pd.Timedelta("1h")
+    assert len(index.slice(shifted, "2025-10-09 01:00", "2025-10-09 01:02")) == 2
+
+    resectored = df.copy()
+    resectored["sectorid"] = 3
+    assert len(index.slice(resectored, None, None, sector=3)) == 4
+
+    # An equal copy (e.g. in a worker process) still uses the index
+    copied = pd.DataFrame({col: df[col].to_numpy(copy=True) for col in df.columns})
+    assert index._matches(copied, partitioned=True)
+    print("Changed frames OK")
+
+def test_time_index_in_generated_code():
+    df = _detections(["2025-10-09 16:52:00", "2025-10-09 16:52:30", "2025-10-09 16:53:00"])
+    index = build_time_index(df)
+    code = "result = time_index.slice(df, time_index.last - pd.Timedelta('1min'), None)['power'].sum()"
+    res = execute_code(code, df, {"time_index": index})
+    assert res.success, res.error
+    assert res.result == 3.0
+    print("Time index in generated code OK")
+
+def test_appended_rows_extend_the_index():
+    df = _detections(["2025-10-09 16:54:00", "2025-10-09 16:52:00", None,
+                      "2025-10-09 16:53:00", "2025-10-09 16:52:30", "2025-10-09 16:55:00"])
+    index = build_time_index(df)
+    delta = pd.DataFrame({
+        "time": pd.to_datetime(["2025-10-09 16:55:00", "2025-10-09 16:56:00", "2025-10-09 16:57:00"]),
+        "sectorid": [3, 1, 5],
+        "power": [6.0, 7.0, 8.0],
+    })
+    grown = pd.concat([df, delta], ignore_index=True)
+    assert index.extend(grown, delta)
+
+    rebuilt = build_time_index(grown)
+    assert np.array_equal(index.times, rebuilt.times) and np.array_equal(index.order, rebuilt.order)
+    assert index.sectors == rebuilt.sectors == [1, 2, 3, 5]
+    assert np.array_equal(index.partition_offsets, rebuilt.partition_offsets)
+    assert np.array_equal(index.partition_rows, rebuilt.partition_rows)
+    assert index.slice(grown, "2025-10-09 16:54:30", None, sector=3).index.tolist() == [5, 6]
+    assert index.slice(grown, "2025-10-09 16:56", None).index.tolist() == [7, 8]
+
+    # Nothing appended: the index is kept as is
+    assert index.extend(grown, grown.iloc[0:0]) and len(index) == 8
+
+    # Rows older than the last indexed one need the sort: rebuild
+    older = delta.assign(time=pd.to_datetime(["2025-10-09 16:50:00"] * 3))
+    assert not index.extend(pd.concat([grown, older], ignore_index=True), older)
+    assert len(index) == 8
+    print("Extended time index OK")
+
+if __name__ == "__main__":
+    test_sorted_input_gives_views()
+    test_unsorted_input_and_fallbacks()
+    test_changed_frame_is_not_sliced_with_stale_positions()
+    test_appended_rows_extend_the_index()
+    test_time_index_in_generated_code()